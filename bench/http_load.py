@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+HTTP API load test — runs the HTTP interface in-process on a gateway backed
+by the mock LLM and measures request throughput and streaming latency.
+Clients share the server's event loop, so the figures are a lower bound.
+
+    python bench/http_load.py [--requests 500] [--concurrency 50] [--tokens 40]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx
+from pocketclaw.config import Config
+from pocketclaw.gateway import Gateway
+from pocketclaw.interfaces.http import HTTPInterface
+from mock_llm import MockLLM
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def _run(worker, n, concurrency):
+    queue = asyncio.Queue()
+    for i in range(n):
+        queue.put_nowait(i)
+    results = []
+
+    async def loop():
+        async with httpx.AsyncClient(timeout=60) as client:
+            while not queue.empty():
+                i = queue.get_nowait()
+                results.append(await worker(client, i))
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(loop() for _ in range(concurrency)))
+    return results, time.perf_counter() - t0
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        config = Config()
+        config.set("memory.path", tmp)
+        config.set("memory.backend", "sqlite")
+        config.set("metrics.path", f"{tmp}/metrics.jsonl")
+        config.set("skills.paths", [])
+        config.set("interfaces.http.port", 0)
+        config.set("advanced.max_concurrent_llm", args.concurrency)
+        gateway = Gateway(config)
+        gateway.llm = MockLLM(args.ttft, args.tokens, args.token_rate)
+        api = await HTTPInterface(gateway, config).start()
+        base = f"http://127.0.0.1:{api.port}"
+
+        async def plain(client, i):
+            t0 = time.perf_counter()
+            r = await client.post(f"{base}/v1/message", json={"text": f"q{i}", "conv_id": f"load-{i}"})
+            r.raise_for_status()
+            return time.perf_counter() - t0
+
+        async def stream(client, i):
+            t0 = time.perf_counter()
+            first = None
+            body = {"text": f"q{i}", "conv_id": f"sse-{i}"}
+            async with client.stream("POST", f"{base}/v1/message/stream", json=body) as r:
+                async for line in r.aiter_lines():
+                    if first is None and line == "event: text":
+                        first = time.perf_counter() - t0
+            return first or 0.0, time.perf_counter() - t0
+
+        print(f"Mock LLM: ttft {args.ttft * 1000:.0f} ms, {args.tokens} tokens at {args.token_rate:.0f} tok/s")
+        print(f"{args.requests} requests, {args.concurrency} concurrent\n")
+
+        lat, elapsed = await _run(plain, args.requests, args.concurrency)
+        print("POST /v1/message")
+        print(f"  {args.requests / elapsed:8.1f} req/s   p50 {_pct(lat, .5) * 1000:7.1f} ms"
+              f"   p95 {_pct(lat, .95) * 1000:7.1f} ms")
+
+        res, elapsed = await _run(stream, args.requests, args.concurrency)
+        firsts, totals = [r[0] for r in res], [r[1] for r in res]
+        print("POST /v1/message/stream")
+        print(f"  {args.requests / elapsed:8.1f} req/s   first token p50 {_pct(firsts, .5) * 1000:7.1f} ms"
+              f"   p95 {_pct(firsts, .95) * 1000:7.1f} ms")
+        print(f"  {'':8}          complete    p50 {statistics.median(totals) * 1000:7.1f} ms"
+              f"   p95 {_pct(totals, .95) * 1000:7.1f} ms")
+
+        await api.close()
+        await gateway.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=500)
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--tokens", type=int, default=40, help="tokens per mock reply")
+    ap.add_argument("--token-rate", type=float, default=200.0, help="mock tokens per second")
+    ap.add_argument("--ttft", type=float, default=0.05, help="mock time to first token (s)")
+    asyncio.run(main(ap.parse_args()))
@@ -0,0 +1,39 @@
+"""
+In-process stand-in for LLMConnector with a configurable time-to-first-token
+and token rate. Swap it onto a Gateway with `gateway.llm = MockLLM(...)`.
+"""
+
+import asyncio
+from pocketclaw.llm import LLMResponse
+
+
+class MockLLM:
+    provider, model = "mock", "mock-1"
+
+    def __init__(self, ttft=0.05, tokens=40, token_rate=200.0):
+        self.ttft = ttft
+        self.tokens = tokens
+        self.token_delay = 1.0 / token_rate if token_rate else 0
+        self.calls = 0
+
+    def _words(self):
+        return [f"tok{i} " for i in range(self.tokens)]
+
+    async def chat(self, system, messages, tools=None, cache=True):
+        self.calls += 1
+        await asyncio.sleep(self.ttft + self.token_delay * self.tokens)
+        return LLMResponse("".join(self._words()))
+
+    async def chat_stream(self, system, messages, tools=None, cache=True):
+        self.calls += 1
+        await asyncio.sleep(self.ttft)
+        text = ""
+        for w in self._words():
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            text += w
+            yield {"type": "text", "text": w}
+        yield {"type": "done", "text": text}
+
+    async def close(self):
+        pass
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Local HTTP stand-in for the Anthropic Messages and OpenAI Chat Completions
+APIs, streaming or not, with configurable latency and token rate.
+
+    python bench/mock_server.py [--port 0] [--ttft 0.05] [--tokens 40] [--token-rate 200]
+
+Point PocketClaw at it with llm.base_url = http://127.0.0.1:PORT (anthropic)
+or http://127.0.0.1:PORT/v1 (openai). The listening port is printed as the
+first line on stdout.
+
+Replies follow a tool script: a list of steps, each a list of
+{"name", "input"} tool calls. The step is picked from the number of tool
+rounds since the last plain user message, so the server is stateless and
+any number of conversations can run at once. After the last step the
+model answers with plain text. POST /_config with any of ttft, tokens,
+token_rate, script to change behaviour between runs; GET /_stats returns
+request counts.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import uuid
+
+
+class MockServer:
+    def __init__(self, ttft=0.05, tokens=40, token_rate=200.0, script=None):
+        self.ttft = ttft
+        self.tokens = tokens
+        self.token_rate = token_rate
+        self.script = script or []
+        self.requests = 0
+        self.server = None
+        self.port = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self._connection, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    # -- Protocol ----------------------------------------------
+
+    async def _connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, path, _ = line.decode("latin-1").split()
+                headers = {}
+                while (h := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                length = int(headers.get("content-length") or 0)
+                body = json.loads(await reader.readexactly(length)) if length else {}
+                await self._route(method, path, body, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _send(self, writer, status, obj):
+        data = json.dumps(obj).encode()
+        writer.write(
+            f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+        )
+        await writer.drain()
+
+    async def _route(self, method, path, body, writer):
+        if path == "/_config" and method == "POST":
+            for k in ("ttft", "tokens", "token_rate", "script"):
+                if k in body:
+                    setattr(self, k, body[k])
+            await self._send(writer, 200, {"ok": True})
+        elif path == "/_stats":
+            await self._send(writer, 200, {"requests": self.requests})
+        elif path.endswith("/messages"):
+            self.requests += 1
+            await self._reply(writer, body, anthropic=True)
+        elif path.endswith("/chat/completions"):
+            self.requests += 1
+            await self._reply(writer, body, anthropic=False)
+        else:
+            await self._send(writer, 404, {"error": f"no route {path}"})
+
+    # -- Model behaviour ---------------------------------------
+
+    def _step(self, body):
+        """Tool rounds since the last plain-text user message."""
+        rounds = 0
+        for msg in reversed(body.get("messages", [])):
+            content = msg.get("content")
+            if msg["role"] == "user" and isinstance(content, str):
+                break
+            if msg["role"] == "assistant" and (
+                msg.get("tool_calls") or (isinstance(content, list) and any(b.get("type") == "tool_use" for b in content))
+            ):
+                rounds += 1
+        return rounds
+
+    def _plan(self, body):
+        step = self._step(body)
+        if step < len(self.script):
+            calls = [{"id": f"toolu_{uuid.uuid4().hex[:16]}", **c} for c in self.script[step]]
+            return "", calls
+        return "".join(f"tok{i} " for i in range(self.tokens)), []
+
+    async def _reply(self, writer, body, anthropic):
+        text, calls = self._plan(body)
+        delay = 1.0 / self.token_rate if self.token_rate else 0
+        await asyncio.sleep(self.ttft)
+        usage_in = len(json.dumps(body)) // 4
+        words = text.split(" ")[:-1] if text else []
+        if not body.get("stream"):
+            await asyncio.sleep(delay * len(words))
+            await self._send(writer, 200, self._full(text, calls, usage_in, len(words), anthropic))
+            return
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        events = self._anth_events if anthropic else self._oai_events
+        for payload, pause in events(words, calls, usage_in):
+            if pause and delay:
+                await asyncio.sleep(delay)
+            data = f"data: {json.dumps(payload) if not isinstance(payload, str) else payload}\n\n".encode()
+            writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    def _full(self, text, calls, usage_in, usage_out, anthropic):
+        if anthropic:
+            content = [{"type": "text", "text": text}] if text else []
+            content += [{"type": "tool_use", "id": c["id"], "name": c["name"], "input": c.get("input", {})} for c in calls]
+            return {"content": content, "usage": {"input_tokens": usage_in, "output_tokens": usage_out}}
+        msg = {"role": "assistant", "content": text or None}
+        if calls:
+            msg["tool_calls"] = [
+                {"id": c["id"], "type": "function",
+                 "function": {"name": c["name"], "arguments": json.dumps(c.get("input", {}))}}
+                for c in calls
+            ]
+        return {"choices": [{"message": msg}], "usage": {"prompt_tokens": usage_in, "completion_tokens": usage_out}}
+
+    def _anth_events(self, words, calls, usage_in):
+        yield {"type": "message_start", "message": {"usage": {"input_tokens": usage_in, "output_tokens": 1}}}, False
+        if words:
+            yield {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}, False
+            for w in words:
+                yield {"type": "content_block_delta", "delta": {"type": "text_delta", "text": w + " "}}, True
+            yield {"type": "content_block_stop"}, False
+        for c in calls:
+            yield {"type": "content_block_start", "content_block": {"type": "tool_use", "id": c["id"], "name": c["name"]}}, False
+            yield {"type": "content_block_delta", "delta": {"type": "input_json_delta", "partial_json": json.dumps(c.get("input", {}))}}, True
+            yield {"type": "content_block_stop"}, False
+        yield {"type": "message_delta", "usage": {"output_tokens": len(words)}}, False
+        yield {"type": "message_stop"}, False
+
+    def _oai_events(self, words, calls, usage_in):
+        for w in words:
+            yield {"choices": [{"delta": {"content": w + " "}}]}, True
+        for i, c in enumerate(calls):
+            yield {"choices": [{"delta": {"tool_calls": [{
+                "index": i, "id": c["id"],
+                "function": {"name": c["name"], "arguments": json.dumps(c.get("input", {}))},
+            }]}}]}, True
+        yield {"choices": [], "usage": {"prompt_tokens": usage_in, "completion_tokens": len(words)}}, False
+        yield "[DONE]", False
+
+
+async def main(args):
+    server = await MockServer(args.ttft, args.tokens, args.token_rate).start(args.host, args.port)
+    print(server.port, flush=True)
+    print(f"Mock LLM API on http://{args.host}:{server.port}", file=sys.stderr)
+    async with server.server:
+        await server.server.serve_forever()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=0)
+    ap.add_argument("--ttft", type=float, default=0.05, help="seconds before the first token")
+    ap.add_argument("--tokens", type=int, default=40, help="tokens in a text reply")
+    ap.add_argument("--token-rate", type=float, default=200.0, help="tokens per second")
+    try:
+        asyncio.run(main(ap.parse_args()))
+    except KeyboardInterrupt:
+        pass
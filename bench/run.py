@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark suite. Runs PocketClaw against bench/mock_server.py
+over real HTTP, one scenario per child process, and reports startup time,
+turn latency, CPU and peak RSS for each.
+
+    python bench/run.py                         # all scenarios, both API formats
+    python bench/run.py --scenarios tool_loop --providers openai
+    python bench/run.py --save-baseline         # record bench/baseline.json
+    python bench/run.py --threshold 0.25        # exit 1 on >25% regressions
+
+Scenarios:
+    cold_oneshot     `pocket "..."` in a fresh interpreter, one plain reply
+    tool_loop        one turn with 30 consecutive run_shell rounds (streamed)
+    huge_output      a tool returning ~2 MB of text, sent back to the model
+    concurrent_100   100 conversations at once, one tool round each
+
+Baselines are machine-specific; record one on the device you compare on.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH = Path(__file__).resolve().parent
+ROOT = BENCH.parent
+sys.path.insert(0, str(ROOT))
+
+SCENARIOS = {
+    "cold_oneshot": {"oneshot": True, "script": []},
+    "tool_loop": {"script": [[{"name": "run_shell", "input": {"command": f"echo step {i}"}}] for i in range(30)]},
+    "huge_output": {"script": [[{"name": "run_shell", "input": {"command": "head -c 2000000 /dev/zero | tr '\\0' x"}}]]},
+    "concurrent_100": {
+        "conversations": 100,
+        "max_concurrent_llm": 16,
+        "script": [[{"name": "run_shell", "input": {"command": "echo hi"}}]],
+    },
+}
+PROVIDERS = {
+    "anthropic": ("anthropic", "claude-sonnet-4-20250514", ""),
+    "openai": ("openai", "gpt-4o-mini", "/v1"),
+}
+# Lower is better for every metric. Differences under the floor are noise.
+FLOORS = {"wall_ms": 50, "startup_ms": 25, "turn_p50_ms": 25, "turn_p95_ms": 50, "cpu_s": 0.1, "rss_mb": 5}
+
+
+# -- Child process -----------------------------------------------
+
+async def child(name):
+    """Run one in-process scenario and print its timings as JSON."""
+    sc = SCENARIOS[name]
+    t0 = time.perf_counter()
+    from pocketclaw.config import Config
+    from pocketclaw.gateway import Gateway
+    gw = Gateway(Config())
+    startup = time.perf_counter() - t0
+    turns = []
+
+    async def conversation(i):
+        t = time.perf_counter()
+        async for _ in gw.handle_message_stream(f"benchmark task {i}", f"bench-{i}"):
+            pass
+        turns.append((time.perf_counter() - t) * 1000)
+
+    t1 = time.perf_counter()
+    await asyncio.gather(*(conversation(i) for i in range(sc.get("conversations", 1))))
+    wall = time.perf_counter() - t1
+    await gw.close()
+    print(json.dumps({"startup_ms": startup * 1000, "turns": turns, "run_ms": wall * 1000}))
+
+
+# -- Parent ------------------------------------------------------
+
+def _home(workdir, provider, port, sc):
+    """Fake HOME with a config pointing at the mock server."""
+    import yaml
+    home = Path(workdir) / "home"
+    shutil.rmtree(home, ignore_errors=True)
+    (home / ".pocketclaw").mkdir(parents=True)
+    kind, model, suffix = PROVIDERS[provider]
+    config = {
+        "llm": {"provider": kind, "api_key": "bench", "model": model, "base_url": f"http://127.0.0.1:{port}{suffix}",
+                "rate_limit": {"max_concurrency": sc.get("max_concurrent_llm", 4)}},
+        "skills": {"paths": [str(ROOT / "skills" / "builtin")]},
+        "memory": {"path": str(home / "memory"), "backend": "sqlite"},
+        "metrics": {"path": str(home / "metrics.jsonl")},
+        "advanced": {"max_concurrent_llm": sc.get("max_concurrent_llm", 4), "max_tool_iterations": 50},
+    }
+    (home / ".pocketclaw" / "config.yaml").write_text(yaml.safe_dump(config), encoding="utf-8")
+    # The one-shot path takes a Termux wake lock; stand in for it off-device
+    bin_dir = home / "bin"
+    bin_dir.mkdir()
+    for tool in ("termux-wake-lock", "termux-wake-unlock"):
+        if not shutil.which(tool):
+            (bin_dir / tool).write_text("#!/bin/sh\nexit 0\n")
+            (bin_dir / tool).chmod(0o755)
+    return home, bin_dir
+
+
+def _measure(cmd, env, cwd):
+    """Run cmd, return (exit status, stdout, wall seconds, rusage)."""
+    with tempfile.TemporaryFile() as out:
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(cmd, stdout=out, stderr=subprocess.STDOUT, env=env, cwd=cwd)
+        _, status, usage = os.wait4(proc.pid, 0)
+        wall = time.perf_counter() - t0
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        out.seek(0)
+        return proc.returncode, out.read().decode(errors="replace"), wall, usage
+
+
+def _mock_call(port, path, body=None):
+    import httpx
+    url = f"http://127.0.0.1:{port}{path}"
+    r = httpx.post(url, json=body) if body is not None else httpx.get(url)
+    r.raise_for_status()
+    return r.json()
+
+
+def run_scenario(name, provider, port, workdir, args):
+    sc = SCENARIOS[name]
+    _mock_call(port, "/_config", {"script": sc["script"], "ttft": args.ttft, "tokens": args.tokens, "token_rate": args.token_rate})
+    before = _mock_call(port, "/_stats")["requests"]
+    home, bin_dir = _home(workdir, provider, port, sc)
+    env = dict(os.environ, HOME=str(home), PATH=f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+               PYTHONPATH=os.pathsep.join(filter(None, [str(ROOT), os.environ.get("PYTHONPATH")])))
+    for var in ("ANTHROPIC_API_KEY", "OPENAI_API_KEY"):
+        env.pop(var, None)
+    if sc.get("oneshot"):
+        cmd = [sys.executable, "-m", "pocketclaw", "say hello"]
+    else:
+        cmd = [sys.executable, str(BENCH / "run.py"), "--child", name]
+    code, out, wall, usage = _measure(cmd, env, str(home))
+    if code != 0:
+        raise RuntimeError(f"{name}[{provider}] exited with {code}:\n{out[-2000:]}")
+    calls = _mock_call(port, "/_stats")["requests"] - before
+    expected = sc.get("conversations", 1) * (len(sc["script"]) + 1)
+    if calls != expected:
+        raise RuntimeError(f"{name}[{provider}]: expected {expected} LLM calls, mock saw {calls}:\n{out[-2000:]}")
+    result = {
+        "wall_ms": round(wall * 1000, 1),
+        "cpu_s": round(usage.ru_utime + usage.ru_stime, 3),
+        # ru_maxrss is KiB on Linux/Android
+        "rss_mb": round(usage.ru_maxrss / 1024, 1),
+    }
+    if not sc.get("oneshot"):
+        data = json.loads(out.strip().splitlines()[-1])
+        turns = sorted(data["turns"])
+        result["startup_ms"] = round(data["startup_ms"], 1)
+        result["turn_p50_ms"] = round(statistics.median(turns), 1)
+        result["turn_p95_ms"] = round(turns[min(len(turns) - 1, int(len(turns) * 0.95))], 1)
+    return result
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    print(f"\n{'scenario':<28}{'metric':<14}{'value':>10}{'baseline':>10}{'change':>9}")
+    for key, metrics in results.items():
+        for metric, value in metrics.items():
+            base = baseline.get(key, {}).get(metric)
+            if base is None:
+                print(f"{key:<28}{metric:<14}{value:>10}{'-':>10}{'':>9}")
+                continue
+            change = (value - base) / base if base else 0.0
+            bad = change > threshold and value - base > FLOORS.get(metric, 0)
+            flag = "  REGRESSION" if bad else ""
+            print(f"{key:<28}{metric:<14}{value:>10}{base:>10}{change:>+9.0%}{flag}")
+            if bad:
+                regressions.append(f"{key} {metric}: {base} -> {value} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS))
+    ap.add_argument("--providers", default=",".join(PROVIDERS))
+    ap.add_argument("--ttft", type=float, default=0.05)
+    ap.add_argument("--tokens", type=int, default=40)
+    ap.add_argument("--token-rate", type=float, default=400.0)
+    ap.add_argument("--baseline", default=str(BENCH / "baseline.json"))
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--threshold", type=float, default=0.25, help="allowed fractional slowdown")
+    args = ap.parse_args()
+
+    if args.child:
+        asyncio.run(child(args.child))
+        return
+
+    server = subprocess.Popen([sys.executable, str(BENCH / "mock_server.py"), "--port", "0"],
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    port = int(server.stdout.readline())
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            for name in args.scenarios.split(","):
+                for provider in args.providers.split(","):
+                    key = f"{name}[{provider}]"
+                    print(f"  {key} ...", end="", flush=True)
+                    results[key] = run_scenario(name, provider, port, workdir, args)
+                    print(f" {results[key]['wall_ms']:.0f}ms")
+    finally:
+        server.terminate()
+        server.wait()
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+        print(f"\nBaseline written to {baseline_path}")
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {}
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for r in regressions:
+            print(f"  {r}")
+        sys.exit(1)
+    print("\nNo regressions." if baseline else "\nNo baseline yet; run with --save-baseline to record one.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Memory backend benchmark — turn-save latency and concurrent-writer throughput
+for the json and sqlite conversation backends.
+
+    python bench/storage_bench.py [--history 200] [--turns 200] [--writers 4]
+"""
+
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from pocketclaw.storage import get_backend
+
+
+def _turn(i):
+    return [
+        {"role": "user", "content": f"question {i} " + "x" * 200},
+        {"role": "assistant", "content": [
+            {"type": "tool_use", "id": f"t{i}", "name": "run_shell", "input": {"command": "ls"}},
+        ]},
+        {"role": "user", "content": [
+            {"type": "tool_result", "tool_use_id": f"t{i}", "content": "file\n" * 100},
+        ]},
+        {"role": "assistant", "content": f"answer {i} " + "y" * 300},
+    ]
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def bench_latency(name, history, turns):
+    with tempfile.TemporaryDirectory() as base:
+        backend = get_backend(name, base, max_messages=history + 4 * turns)
+        for i in range(history // 4):
+            backend.append("bench", _turn(i))
+        times = []
+        for i in range(turns):
+            t0 = time.perf_counter()
+            backend.append("bench", _turn(i))
+            times.append((time.perf_counter() - t0) * 1000)
+        backend.close()
+    return statistics.median(times), _pct(times, 0.95)
+
+
+def _writer(name, base, turns, cap):
+    backend = get_backend(name, base, max_messages=cap)
+    for i in range(turns):
+        backend.append("shared", _turn(i)[:2])
+    backend.close()
+
+
+def bench_concurrent(name, writers, turns):
+    with tempfile.TemporaryDirectory() as base:
+        cap = writers * turns * 2
+        get_backend(name, base, cap).close()
+        procs = [multiprocessing.Process(target=_writer, args=(name, base, turns, cap)) for _ in range(writers)]
+        t0 = time.perf_counter()
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - t0
+        backend = get_backend(name, base, cap)
+        stored = len(backend.load("shared"))
+        backend.close()
+    return writers * turns / elapsed, stored, cap
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--history", type=int, default=200, help="messages already in the conversation")
+    ap.add_argument("--turns", type=int, default=200, help="turns saved per measurement")
+    ap.add_argument("--writers", type=int, default=4, help="concurrent writer processes")
+    args = ap.parse_args()
+
+    print(f"Turn save latency ({args.history} messages of history, {args.turns} turns)")
+    for name in ("json", "sqlite"):
+        p50, p95 = bench_latency(name, args.history, args.turns)
+        print(f"  {name:7} p50 {p50:7.2f} ms   p95 {p95:7.2f} ms")
+
+    print(f"\nConcurrent writers ({args.writers} processes x {args.turns} turns)")
+    for name in ("json", "sqlite"):
+        rate, stored, expected = bench_concurrent(name, args.writers, args.turns)
+        lost = expected - stored
+        print(f"  {name:7} {rate:8.1f} turns/s   lost messages: {lost}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
-import asyncio
 import json
 import shutil
+from .tools.cache import invalidates
+from .tools import process
 
 
 class AndroidBridge:
@@ -17,16 +18,10 @@ class AndroidBridge:
             return False
 
     async def termux_api(self, command, args=None):
-        cmd = [command] + (args or [])
-        proc = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
-        stdout, stderr = await proc.communicate()
-        output = stdout.decode(errors="replace").strip()
+        proc = await process.run([command] + (args or []))
+        output = proc.stdout.decode(errors="replace").strip()
         if proc.returncode != 0:
-            err = stderr.decode(errors="replace").strip()
+            err = proc.stderr.decode(errors="replace").strip()
             return f"Error: {err or 'command failed'}"
         try:
             return json.dumps(json.loads(output), indent=2)
@@ -43,6 +38,8 @@ class AndroidBridge:
 def get_android_tools(config):
     bridge = AndroidBridge()
 
+    # Termux:API can open apps and dialogs, so treat it as changing the screen
+    @invalidates("screen")
     async def termux_api_handler(command, args=None):
         return await bridge.termux_api(command, args)
 
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import re
+import sys
+import time
+from pathlib import Path
+from .metrics import percentile
+
+
+def load_prompts(path):
+    """[(index, prompt, item)] from a JSONL file. A line may be a JSON object
+    with prompt/text/input (or title + body, as in a request backlog), a
+    JSON string, or plain text. Blank lines are skipped but keep their
+    index, so indices always match line numbers (0-based)."""
+    prompts = []
+    for i, line in enumerate(Path(path).read_text(encoding='utf-8').splitlines()):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            item = line
+        if isinstance(item, str):
+            prompts.append((i, item, {}))
+            continue
+        if not isinstance(item, dict):
+            raise ValueError(f"line {i + 1}: expected an object, string or text")
+        prompt = item.get("prompt") or item.get("text") or item.get("input")
+        if not prompt and (item.get("title") or item.get("body")):
+            prompt = "\n\n".join(filter(None, [item.get("title"), item.get("body")]))
+        if not prompt:
+            raise ValueError(f"line {i + 1}: no prompt/text/input field")
+        prompts.append((i, prompt, item))
+    return prompts
+
+
+def completed(out_path):
+    """Indices that already have a successful result in out_path."""
+    done = set()
+    if not out_path.exists():
+        return done
+    for line in out_path.read_text(encoding='utf-8').splitlines():
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            continue  # a line cut short by an interruption
+        if rec.get("ok"):
+            done.add(rec["index"])
+    return done
+
+
+class BatchRunner:
+    """Runs prompts from a JSONL file concurrently on one gateway.
+
+    Each prompt gets its own conversation. Results are appended to the
+    output file as they finish (completion order, tagged with the source
+    index). Rerunning skips prompts that already succeeded.
+    """
+
+    def __init__(self, gateway, src, out=None, parallel=4, priority="background", timeout=None, fresh=False):
+        self.gateway = gateway
+        self.src = Path(src)
+        self.out = Path(out) if out else self.src.with_name(self.src.stem + ".out.jsonl")
+        self.parallel = max(1, int(parallel))
+        self.priority = priority
+        self.timeout = timeout
+        self.fresh = fresh
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self.running = 0
+        self.latencies = []
+
+    def conv_id(self, index):
+        """The batch's own conversation for line index. A conv_id given on
+        the line is only a label: using it would let a line wipe a real
+        conversation, or two lines share one."""
+        return f"batch-{re.sub(r'[^A-Za-z0-9._-]', '_', self.src.stem)}-{index}"
+
+    async def _one(self, index, prompt, item):
+        conv_id = self.conv_id(index)
+        # Start from a clean conversation so a retried prompt can't see the
+        # partial history of an earlier attempt
+        self.gateway.memory.delete_conversation(conv_id)
+        rec = {"index": index, "conv_id": conv_id}
+        for key in ("id", "request_id"):
+            if key in item:
+                rec[key] = item[key]
+        if "conv_id" in item:
+            rec["label"] = item["conv_id"]
+        t0 = time.monotonic()
+        self.running += 1
+        try:
+            reply = await asyncio.wait_for(
+                self.gateway.handle_message(prompt, conv_id, self.priority), self.timeout
+            )
+            rec.update(ok=True, reply=reply)
+            self.done += 1
+        except asyncio.TimeoutError:
+            rec.update(ok=False, error=f"timed out after {self.timeout}s")
+            self.failed += 1
+        except Exception as e:
+            rec.update(ok=False, error=str(e) or type(e).__name__)
+            self.failed += 1
+        finally:
+            self.running -= 1
+        rec["ms"] = round((time.monotonic() - t0) * 1000, 1)
+        self.latencies.append(rec["ms"])
+        return rec
+
+    async def run(self, progress=None):
+        prompts = load_prompts(self.src)
+        if self.fresh and self.out.exists():
+            self.out.unlink()
+        skip = completed(self.out)
+        todo = [p for p in prompts if p[0] not in skip]
+        self.skipped = len(prompts) - len(todo)
+        total = len(todo)
+        queue = asyncio.Queue()
+        for p in todo:
+            queue.put_nowait(p)
+        started = time.monotonic()
+
+        with open(self.out, "a", encoding='utf-8') as out:
+            async def worker():
+                while not queue.empty():
+                    rec = await self._one(*queue.get_nowait())
+                    out.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+                    out.flush()
+                    if progress:
+                        progress(self, total, time.monotonic() - started)
+
+            await asyncio.gather(*(worker() for _ in range(min(self.parallel, total) or 1)))
+        return self.summary(time.monotonic() - started, len(prompts))
+
+    def summary(self, elapsed, total):
+        finished = self.done + self.failed
+        return {
+            "total": total,
+            "ok": self.done,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "elapsed": round(elapsed, 2),
+            "per_minute": round(finished / elapsed * 60, 1) if elapsed else 0.0,
+            "p50_ms": percentile(self.latencies, 50),
+            "p95_ms": percentile(self.latencies, 95),
+            "out": str(self.out),
+        }
+
+
+def print_progress(runner, total, elapsed):
+    finished = runner.done + runner.failed
+    rate = finished / elapsed if elapsed else 0
+    eta = (total - finished) / rate if rate else 0
+    sys.stderr.write(
+        f"\r  [{finished}/{total}] {runner.running} running, {runner.failed} failed, "
+        f"{rate * 60:.1f}/min, ETA {eta:.0f}s   "
+    )
+    sys.stderr.flush()
@@ -37,17 +37,30 @@ async def main(args=None):
     elif cmd == "onboard":
         from .onboard import run as onboard
         onboard()
+    elif cmd == "start":
+        await _start(config, args[1:])
+    elif cmd == "serve":
+        await _serve(config, args[1:])
     elif cmd == "status":
-        if Supervisor.is_running():
-            print(f"PocketClaw is running (PID {Supervisor.get_pid()})")
-        else:
-            print("PocketClaw is not running")
+        await _status(config)
     elif cmd == "stop":
-        if Supervisor.is_running():
-            Supervisor.kill()
-            print("PocketClaw stopped")
-        else:
-            print("PocketClaw is not running")
+        from . import daemon
+        try:
+            await daemon.call(daemon.socket_path(config), "shutdown")
+            print("PocketClaw daemon stopped")
+        except ConnectionError:
+            if Supervisor.is_running():
+                Supervisor.kill()
+                print("PocketClaw stopped")
+            else:
+                print("PocketClaw is not running")
+    elif cmd == "reload":
+        from . import daemon
+        try:
+            await daemon.call(daemon.socket_path(config), "reload")
+            print("PocketClaw daemon reloaded")
+        except ConnectionError:
+            print("PocketClaw daemon is not running")
     elif cmd == "config":
         _handle_config(config, args[1:])
     elif cmd == "skills":
@@ -55,10 +68,20 @@ async def main(args=None):
         print(SkillLoader(config).get_summary() or "No skills loaded.")
     elif cmd == "memory":
         _handle_memory(config, args[1:])
+    elif cmd == "batch":
+        await _batch(config, args[1:])
+    elif cmd == "jobs":
+        _jobs(config)
+    elif cmd == "stats":
+        _stats(config, args[1:])
+    elif cmd == "cache":
+        _handle_cache(config, args[1:])
     elif cmd == "doctor":
         _doctor(config)
     else:
-        # One-shot mode
+        # One-shot mode: hand off to the daemon if one is warm, else in-process
+        if await _via_daemon(config, " ".join(args)):
+            return
         gateway = Gateway(config)
         sup = Supervisor()
         sup.start()
@@ -70,6 +93,140 @@ async def main(args=None):
             sup.stop()
 
 
+async def _via_daemon(config, text):
+    from . import daemon
+    path = daemon.socket_path(config)
+    if not path.exists():
+        return False
+    printed = False
+    try:
+        async for chunk in daemon.request(path, {"op": "message", "text": text}):
+            if chunk["type"] == "text":
+                print(chunk["text"], end="", flush=True)
+                printed = True
+            elif chunk["type"] == "error":
+                print(f"Error: {chunk['error']}")
+                return True
+    except ConnectionError:
+        if printed:
+            print("\n[daemon connection lost]")
+            return True
+        return False
+    print()
+    return True
+
+
+async def _start(config, args):
+    from . import daemon
+    path = daemon.socket_path(config)
+    if await daemon.ping(path):
+        print(f"PocketClaw daemon already running ({path})")
+        return
+    if "--daemon" in args or "-d" in args:
+        pid = await daemon.spawn(config)
+        if pid:
+            print(f"PocketClaw daemon started (PID {pid})")
+        else:
+            print(f"Daemon failed to start - see {daemon.LOG_PATH}")
+        return
+    await daemon.run(config)
+
+
+async def _serve(config, args):
+    from .interfaces.http import HTTPInterface
+    for flag, key in (("--host", "interfaces.http.host"), ("--port", "interfaces.http.port")):
+        if flag in args and args.index(flag) + 1 < len(args):
+            config.set(key, args[args.index(flag) + 1])
+    gateway = Gateway(config)
+    sup = Supervisor()
+    sup.start()
+    try:
+        await HTTPInterface(gateway, config).run()
+    finally:
+        await gateway.close()
+        sup.stop()
+
+
+def _opt(args, *flags, default=None):
+    for flag in flags:
+        if flag in args and args.index(flag) + 1 < len(args):
+            return args[args.index(flag) + 1]
+    return default
+
+
+async def _batch(config, args):
+    from .batch import BatchRunner, print_progress
+    takes_value = ("-o", "--out", "-j", "--parallel", "--timeout")
+    files = [a for prev, a in zip([None] + args, args) if not a.startswith("-") and prev not in takes_value]
+    if not files:
+        print("Usage: pocket batch FILE.jsonl [-o OUT.jsonl] [-j N] [--timeout SECS] [--fresh]")
+        return
+    timeout = _opt(args, "--timeout")
+    gateway = Gateway(config)
+    runner = BatchRunner(
+        gateway, files[0],
+        out=_opt(args, "-o", "--out"),
+        parallel=int(_opt(args, "-j", "--parallel", default=config.get("batch.parallel", 4))),
+        timeout=float(timeout) if timeout else config.get("batch.timeout") or None,
+        fresh="--fresh" in args,
+    )
+    sup = Supervisor()
+    sup.start()
+    try:
+        st = await runner.run(progress=print_progress)
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        print(f"\nInterrupted after {runner.done} prompts. Run the same command again to resume.")
+        return
+    finally:
+        await gateway.close()
+        sup.stop()
+    print(f"\nBatch done: {st['ok']} ok, {st['failed']} failed, {st['skipped']} already done "
+          f"(of {st['total']}) in {st['elapsed']:.1f}s")
+    print(f"  Throughput: {st['per_minute']} prompts/min, latency p50 {st['p50_ms'] / 1000:.1f}s, "
+          f"p95 {st['p95_ms'] / 1000:.1f}s")
+    print(f"  Results:    {st['out']}")
+
+
+async def _status(config):
+    from . import daemon
+    try:
+        st = await daemon.call(daemon.socket_path(config), "status")
+    except ConnectionError:
+        st = {}
+    if st.get("type") == "status":
+        print(f"PocketClaw daemon is running (PID {st['pid']}, v{st['version']})")
+        print(f"  Uptime:    {st['uptime']:.0f}s (idle {st['idle']:.0f}s, exits after {st['idle_timeout']}s idle)")
+        print(f"  Model:     {st['provider']}/{st['model']}")
+        print(f"  Loaded:    {st['skills']} skills, {st['tools']} tools, {st['memory_backend']} memory")
+        print(f"  Requests:  {st['in_flight']} in flight, {st['served']} served, {st['errors']} errors")
+        sch = st["scheduler"]
+        lanes = ", ".join(f"{k} {v}" for k, v in sch["queued_by_lane"].items())
+        print(f"  LLM slots: {sch['active']}/{sch['max_concurrent']} busy, {sch['queued']} queued ({lanes})")
+        print(f"  Turns:     {sch['conversations']} conversations active, {sch['waiting_turns']} waiting on a lock")
+        if st.get("http"):
+            print(f"  HTTP API:  http://{st['http']}")
+        if st.get("router"):
+            rt = st["router"]
+            print(f"  Router:    {rt['fast_calls']} fast ({rt['fast_model']}), {rt['primary_calls']} primary, "
+                  f"saved ~{rt['saved_ms'] / 1000:.1f}s / ${rt['saved_usd']:.4f}")
+        if st.get("jobs"):
+            jb, wl = st["jobs"], st["jobs"]["wake_lock"]
+            nxt = f", next wakeup in {jb['next_in']:.0f}s" if jb["next_in"] is not None else ""
+            print(f"  Jobs:      {jb['jobs']} scheduled, {jb['wakeups']} wakeups{nxt}; wake lock "
+                  f"{'held' if wl['held'] else 'free'} ({wl['held_s']:.0f}s held over {wl['acquired']} acquisitions)")
+        for model, rl in (st.get("rate_limits") or {}).items():
+            budget = "".join(
+                f", {rl[k]['remaining']}/{rl[k]['limit']} {k}" for k in ("requests", "tokens") if rl[k]
+            )
+            held = f", held {rl['blocked_s']:.0f}s" if rl["blocked_s"] else ""
+            print(f"  Limits:    {model}: {rl['inflight']}/{rl['concurrency']:.0f} in flight, "
+                  f"{rl['queued']} queued{budget}, {rl['throttled']} throttled{held}")
+    elif Supervisor.is_running():
+        print(f"PocketClaw is running (PID {Supervisor.get_pid()}, no daemon)")
+    else:
+        print("PocketClaw is not running")
+
+
 async def _interactive(config):
     gateway = Gateway(config)
     sup = Supervisor()
@@ -99,16 +256,121 @@ def _handle_memory(config, args):
     from .memory import MemoryStore
     mem = MemoryStore(config)
     if args and args[0] == "clear":
-        import shutil
-        conv_dir = mem.base / "conversations"
-        if conv_dir.exists():
-            shutil.rmtree(conv_dir)
-            conv_dir.mkdir()
+        mem.clear_conversations()
         print("Conversations cleared.")
+    elif args and args[0] == "migrate":
+        from .storage import BACKENDS, get_backend, migrate
+        target = args[1] if len(args) > 1 else ""
+        if target not in BACKENDS:
+            print(f"Usage: pocket memory migrate {{{'|'.join(BACKENDS)}}}")
+            return
+        if target == mem.backend.name:
+            print(f"Already using the {target} backend.")
+            return
+        dst = get_backend(target, mem.base, mem.max_messages)
+        n = migrate(mem.backend, dst)
+        dst.close()
+        config.set("memory.backend", target)
+        config.save()
+        print(f"Migrated {n} conversations to {target}. memory.backend = {target}")
     else:
         print(mem.get_context() or "No stored facts.")
 
 
+def _stats(config, args):
+    from .metrics import MetricsLog, summarize
+    n = 500
+    if "--last" in args:
+        try:
+            n = int(args[args.index("--last") + 1])
+        except (IndexError, ValueError):
+            print("Usage: pocket stats [--last N]")
+            return
+    log = MetricsLog(config)
+    records = log.tail(n)
+    if not records:
+        print("No turns recorded yet.")
+        return
+    st = summarize(records, log.prices)
+
+    def row(label, d, unit="ms"):
+        if d["n"]:
+            print(f"  {label:<16} p50 {d['p50']:>8.1f}{unit}   p95 {d['p95']:>8.1f}{unit}   (n={d['n']})")
+
+    print(f"Last {st['turns']} turns ({st['errors']} failed)\n")
+    row("Turn", st["turn_ms"])
+    for name in ("build", "queue", "save"):
+        if name in st["spans"]:
+            row(name.capitalize(), st["spans"][name])
+    row("LLM call", st["llm_ms"])
+    row("First token", st["ttft_ms"])
+    row("Output speed", st["tok_s"], " tok/s")
+    if st["llm_cached"]:
+        print(f"  {st['llm_cached']} LLM calls answered from the response cache")
+    if st["elided_tokens"]["n"]:
+        row("Tokens elided", st["elided_tokens"], " tok")
+    th = st["throttle"]
+    if th["calls"]:
+        row("Rate-limit wait", th["wait_ms"])
+        print(f"  {th['calls']} LLM calls held by the rate limiter, {th['retries']} retried after a 429")
+    if st["tools"]:
+        print("\nTools:")
+        for name, d in sorted(st["tools"].items(), key=lambda kv: -kv[1]["p95"]):
+            extra = f", {d['failed']} failed" if d["failed"] else ""
+            extra += f", {d['cached']} cached" if d["cached"] else ""
+            extra += f", {d['cpu_s']:.1f}s CPU, peak {d['rss_mb']:.0f} MB" if d["rss_mb"] is not None else ""
+            print(f"  {name:<22} p50 {d['p50']:>8.1f}ms   p95 {d['p95']:>8.1f}ms   ({d['n']} calls{extra})")
+    rt = st["router"]
+    if rt:
+        esc = ", ".join(f"{k} {v}" for k, v in rt["escalations"].items()) or "none"
+        print(f"\nRouter: {rt['fast']} fast / {rt['primary']} primary calls (escalations: {esc})")
+        print(f"  {rt['offloaded_tokens']} tokens handled by the fast model, "
+              f"est. {rt['saved_ms'] / 1000:+.1f}s and ${rt['saved_usd']:+.4f} saved")
+    print("\nUsage:")
+    for model, u in st["usage"].items():
+        usd = f"${u['cost']:.4f}" if u["priced"] else "price unknown"
+        print(f"  {model:<40} {u['turns']} turns, {u['in']} in / {u['out']} out tokens, {usd}")
+
+
+def _jobs(config):
+    import time
+    from pathlib import Path
+    from .jobs import JOBS_PATH, load_jobs, load_state
+    from .skill_loader import SkillLoader
+    jobs = load_jobs(SkillLoader(config))
+    if not jobs:
+        print("No scheduled jobs. Skills declare them under `schedule:`.")
+        return
+    state = load_state(Path(config.get("jobs.state", str(JOBS_PATH))).expanduser())
+    now = time.time()
+    for job in jobs:
+        st = state.get(job.id, {})
+        due = f"due in {max(0, st['due'] - now):.0f}s" if st.get("schedule") == job.schedule else "not started"
+        last = "never run"
+        if st.get("last_run"):
+            last = f"last run {now - st['last_run']:.0f}s ago " + (f"failed: {st['last_error']}" if st.get("last_error") else "ok")
+        print(f"  {job.id:<36} {job.schedule:<20} {due}, {last}")
+        if st.get("runs"):
+            print(f"  {'':<36} {st['runs']} runs, {st['failures']} failed, {st['missed']} missed runs skipped, "
+                  f"{st['deferred']} deferred for low battery")
+
+
+def _handle_cache(config, args):
+    from .llm_cache import ResponseCache
+    cache = ResponseCache.from_config(config.get("llm.cache", {}))
+    if args and args[0] == "clear":
+        cache.clear()
+        print("Response cache cleared.")
+    else:
+        st = cache.stats()
+        state = "enabled" if config.get("llm.cache.enabled") else "disabled (llm.cache.enabled)"
+        print(f"LLM response cache: {state}")
+        print(f"  Entries:  {st['entries']} ({st['bytes'] / 1024:.0f} KiB)")
+        print(f"  Hits:     {st['hits']} / {st['hits'] + st['misses']} lookups ({st['hit_rate']:.0%})")
+        print(f"  Evicted:  {st['evictions']}")
+    cache.close()
+
+
 def _print_help():
     print("""PocketClaw - AI agent for Android
 
@@ -116,11 +378,19 @@ Usage:
   pocket                      Start interactive chat
   pocket "do something"       One-shot command
   pocket onboard              Run setup wizard
-  pocket status               Show running state
+  pocket start [--daemon]     Run the daemon (--daemon: in background)
+  pocket status               Show daemon health and load
+  pocket reload               Reload daemon config and skills
+  pocket serve [--port N]     Serve the local HTTP/SSE API
   pocket stop                 Stop daemon
   pocket skills               List loaded skills
   pocket memory               Show stored facts
   pocket memory clear         Clear conversations
+  pocket memory migrate B     Move conversations to backend B (json|sqlite)
+  pocket cache [clear]        Show or clear the LLM response cache
+  pocket stats [--last N]     Turn timings (p50/p95), tokens and cost
+  pocket batch FILE [-j N]    Run every prompt in a JSONL file (resumable)
+  pocket jobs                 Scheduled skill jobs, next due and last run
   pocket config set KEY VAL   Set config value
   pocket config get KEY       Get config value
   pocket doctor               Run diagnostics
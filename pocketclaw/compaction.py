@@ -0,0 +1,84 @@
+# Tools whose every result describes the whole screen, so only the latest
+# one is worth resending
+SNAPSHOT_TOOLS = {"screen_read", "screen_wait"}
+
+
+def excerpt(text, chars):
+    """The first and last chars/2 characters of text with a size marker
+    between them."""
+    half = chars // 2
+    return f"{text[:half]}\n[... {len(text) - 2 * half} of {len(text)} chars elided ...]\n{text[-half:]}"
+
+
+class Compactor:
+    """Shrinks stale tool results in the messages sent to the LLM. The
+    stored history is never changed.
+
+    A tool result stays verbatim for keep_iterations tool rounds, then is
+    cut to a head/tail excerpt if longer than max_chars. The cut-off only
+    moves every keep_iterations rounds, and the output depends on nothing
+    but the messages, so the request prefix stays byte-identical between
+    rounds and provider prompt caches keep hitting. Past the cut-off, every
+    screen snapshot but the last one there is replaced by a marker; recent
+    snapshots are left alone so collapsing never rewrites the cached
+    prefix between steps.
+    """
+
+    def __init__(self, keep_iterations=4, max_chars=2000, excerpt_chars=600):
+        self.keep = max(1, keep_iterations)
+        self.max_chars = max_chars
+        self.excerpt_chars = min(excerpt_chars, max_chars)
+
+    @classmethod
+    def from_config(cls, cfg):
+        if not cfg.get("enabled", True):
+            return None
+        return cls(cfg.get("keep_iterations", 4), cfg.get("max_chars", 2000), cfg.get("excerpt_chars", 600))
+
+    def compact(self, messages):
+        """(messages to send, characters saved). Only changed messages are
+        copied."""
+        names = {}
+        rounds = []
+        for i, msg in enumerate(messages):
+            content = msg.get("content")
+            if not isinstance(content, list):
+                continue
+            if msg["role"] == "assistant":
+                names.update((b["id"], b["name"]) for b in content if b.get("type") == "tool_use")
+            elif any(b.get("type") == "tool_result" for b in content):
+                rounds.append(i)
+
+        # Leave between keep and 2 * keep - 1 rounds alone
+        stale = set(rounds[: max(0, (len(rounds) - self.keep) // self.keep * self.keep)])
+        # Only stale rounds count, so the latest can't move between steps
+        latest = None
+        for i in rounds:
+            if i not in stale:
+                break
+            for b in messages[i]["content"]:
+                if b.get("type") == "tool_result" and names.get(b["tool_use_id"]) in SNAPSHOT_TOOLS:
+                    latest = b["tool_use_id"]
+
+        out, saved = list(messages), 0
+        for i in rounds:
+            blocks, changed = [], False
+            for b in messages[i]["content"]:
+                text = b.get("content")
+                name = names.get(b.get("tool_use_id"))
+                short = None
+                if i not in stale or b.get("type") != "tool_result" or not isinstance(text, str):
+                    pass
+                elif name in SNAPSHOT_TOOLS and latest != b["tool_use_id"] and len(text) > 80:
+                    short = f"[{name} output superseded by a later screen snapshot; {len(text)} chars elided]"
+                elif len(text) > self.max_chars:
+                    short = excerpt(text, self.excerpt_chars)
+                if short is None:
+                    blocks.append(b)
+                    continue
+                blocks.append({**b, "content": short})
+                saved += len(text) - len(short)
+                changed = True
+            if changed:
+                out[i] = {**messages[i], "content": blocks}
+        return out, saved
@@ -33,8 +33,41 @@ DEFAULTS = {
         "model": "claude-sonnet-4-20250514",
         "max_tokens": 4096,
         "temperature": 0.3,
+        "stream_usage": True,
+        "cache": {
+            "enabled": False,
+            "max_entries": 500,
+            "max_mb": 20,
+            "ttl": 86400,
+            "max_temperature": 0.3,
+            "bypass": [],
+        },
+        "router": {
+            "enabled": False,
+            "fast": {"provider": "groq", "model": "llama-3.1-8b-instant", "api_key": "", "base_url": ""},
+            "first_step": "fast",
+            "final_reply": "primary",
+            "escalate_on_tool_error": True,
+        },
+        "rate_limit": {
+            "enabled": True,
+            "max_concurrency": 8,
+            "min_concurrency": 1,
+            "rpm": 0,
+            "tpm": 0,
+            "max_retries": 5,
+            "max_wait": 60,
+        },
+    },
+    "interfaces": {
+        "terminal": True,
+        "http": {
+            "enabled": False,
+            "host": "127.0.0.1",
+            "port": 8765,
+            "token": "",
+        },
     },
-    "interfaces": {"terminal": True},
     "skills": {
         "paths": [
             "~/.pocketclaw/app/skills/builtin",
@@ -46,8 +79,25 @@ DEFAULTS = {
     },
     "memory": {
         "path": "~/.pocketclaw/memory",
+        "backend": "json",
         "max_conversation_messages": 50,
         "auto_summarise": True,
+        "recall_limit": 10,
+        "history_max_entries": 1000,
+        "context_max_facts": 20,
+        "context_token_budget": 500,
+        "semantic": {
+            "enabled": True,
+            "dim": 256,
+            "min_score": 0.25,
+            "index_conversations": False,
+        },
+        "compaction": {
+            "enabled": True,
+            "keep_iterations": 4,
+            "max_chars": 2000,
+            "excerpt_chars": 600,
+        },
     },
     "confirm": {
         "file_delete": True,
@@ -56,10 +106,41 @@ DEFAULTS = {
         "screen_actions": False,
         "money": True,
     },
-    "display": {"color": True, "streaming": True, "show_tool_calls": True},
+    "daemon": {
+        "socket": "~/.pocketclaw/pocketclaw.sock",
+        "idle_timeout": 1800,
+    },
+    "display": {"color": True, "streaming": True, "show_tool_calls": True, "frame_ms": 33, "prewarm": True},
+    "macros": {
+        "path": "~/.pocketclaw/macros.json",
+        "guard_timeout": 5,
+        "poll_ms": 300,
+    },
+    "jobs": {
+        "enabled": True,
+        "window": 300,
+        "timeout": 300,
+        "low_battery": 20,
+        "backoff": 4,
+        "state": "~/.pocketclaw/jobs.json",
+    },
+    "batch": {
+        "parallel": 4,
+        "timeout": 0,
+    },
+    "metrics": {
+        "enabled": True,
+        "path": "~/.pocketclaw/metrics.jsonl",
+        "max_entries": 5000,
+        "prices": {},
+    },
     "advanced": {
         "max_tool_iterations": 50,
+        "max_concurrent_llm": 4,
         "tool_timeout": 30,
+        "tool_timeouts": {"macro": 120, "pipeline": 300, "http_request": 300},
+        "tool_limits": {"cpu_s": 120, "memory_mb": 0, "file_mb": 512, "output_mb": 8},
+        "tool_cache": True,
         "screenshot_scale": 0.5,
     },
 }
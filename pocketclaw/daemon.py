@@ -0,0 +1,326 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+from contextlib import aclosing
+from pathlib import Path
+from . import __version__
+from .config import Config, POCKETCLAW_DIR
+from .gateway import Gateway
+from .jobs import JobScheduler
+from .storage import check_conv_id
+from .supervisor import Supervisor
+
+log = logging.getLogger(__name__)
+
+SOCKET_PATH = POCKETCLAW_DIR / "pocketclaw.sock"
+LOG_PATH = POCKETCLAW_DIR / "daemon.log"
+
+# Frames are newline-delimited JSON objects. A client sends one request
+# frame ({"op": ...}); the daemon answers with zero or more chunk frames
+# and always finishes with {"type": "end"} or {"type": "error"}.
+FRAME_LIMIT = 16 * 1024 * 1024
+
+
+def socket_path(config):
+    return Path(config.get("daemon.socket", str(SOCKET_PATH))).expanduser()
+
+
+def encode(frame):
+    return (json.dumps(frame, default=str) + "\n").encode()
+
+
+class Daemon:
+    """Resident process holding one warm Gateway (HTTP pool, skills, memory)
+    and serving requests over a Unix socket."""
+
+    def __init__(self, config, gateway_factory=Gateway):
+        self.config = config
+        self.gateway_factory = gateway_factory
+        self.path = socket_path(config)
+        self.idle_timeout = config.get("daemon.idle_timeout", 1800)
+        self.gateway = None
+        self.server = None
+        self.started = time.time()
+        self.last_activity = time.monotonic()
+        self.in_flight = 0
+        self.served = 0
+        self.errors = 0
+        self.reloads = 0
+        self._users = {}  # gateway -> in-flight requests, for graceful reload
+        self.http = None
+        self.jobs = None
+        self._stopping = asyncio.Event()
+
+    async def start(self):
+        self.gateway = self.gateway_factory(self.config)
+        self._users[self.gateway] = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            if await ping(self.path):
+                raise RuntimeError(f"Daemon already running on {self.path}")
+            self.path.unlink()
+        self.server = await asyncio.start_unix_server(self._handle, path=str(self.path), limit=FRAME_LIMIT)
+        os.chmod(self.path, 0o600)
+        if self.config.get("interfaces.http.enabled", False):
+            from .interfaces.http import HTTPInterface
+            self.http = await HTTPInterface(self.gateway, self.config).start()
+            log.info(f"HTTP API on http://{self.http.host}:{self.http.port}")
+        if self.config.get("jobs.enabled", True):
+            self.jobs = JobScheduler(self.gateway, self.config).start()
+
+    async def serve_forever(self):
+        loop = asyncio.get_running_loop()
+        for sig, fn in ((signal.SIGTERM, self.stop), (signal.SIGINT, self.stop), (signal.SIGHUP, self._reload_soon)):
+            try:
+                loop.add_signal_handler(sig, fn)
+            except (NotImplementedError, RuntimeError):
+                pass
+        watchdog = asyncio.create_task(self._idle_watchdog())
+        try:
+            await self._stopping.wait()
+        finally:
+            watchdog.cancel()
+            await self.close()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def close(self, grace=10):
+        if self.jobs:
+            await self.jobs.stop()
+            self.jobs = None
+        if self.http:
+            await self.http.close()
+            self.http = None
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        deadline = time.monotonic() + grace
+        while self.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for gw in list(self._users):
+            await gw.close()
+        self._users.clear()
+        if self.path.exists():
+            self.path.unlink()
+
+    # -- Lifecycle ---------------------------------------------
+
+    def _reload_soon(self):
+        asyncio.ensure_future(self.reload())
+
+    async def reload(self):
+        """Swap in a fresh Config + Gateway. Requests already running keep
+        the old gateway, which is closed once they finish."""
+        old = self.gateway
+        self.config = Config(self.config.path)
+        self.gateway = self.gateway_factory(self.config)
+        self._users[self.gateway] = 0
+        if self.http:
+            self.http.gateway = self.gateway
+        if self.jobs:
+            self.jobs.reload(self.gateway)
+        self.reloads += 1
+        asyncio.ensure_future(self._retire(old))
+
+    async def _retire(self, gw):
+        # HTTP turns don't go through _users, so also wait for the
+        # gateway's own scheduler to go quiet
+        while self._users.get(gw) or gw.scheduler.metrics()["conversations"]:
+            await asyncio.sleep(0.1)
+        if self._users.pop(gw, None) is not None:
+            await gw.close()
+
+    async def _idle_watchdog(self):
+        if not self.idle_timeout:
+            return
+        while True:
+            await asyncio.sleep(min(30, self.idle_timeout))
+            idle = time.monotonic() - self.last_activity
+            # Scheduled jobs keep the daemon resident
+            if not self.in_flight and idle >= self.idle_timeout and not (self.jobs and self.jobs.jobs):
+                log.info(f"Idle for {idle:.0f}s, shutting down")
+                self.stop()
+                return
+
+    def status(self):
+        gw = self.gateway
+        return {
+            "pid": os.getpid(),
+            "version": __version__,
+            "uptime": round(time.time() - self.started, 1),
+            "idle": round(time.monotonic() - self.last_activity, 1),
+            "idle_timeout": self.idle_timeout,
+            "in_flight": self.in_flight,
+            "served": self.served,
+            "errors": self.errors,
+            "reloads": self.reloads,
+            "provider": gw.llm.provider,
+            "model": gw.llm.model,
+            "skills": len(gw.skills.skills),
+            "tools": len(gw.tools),
+            "memory_backend": gw.memory.backend.name,
+            "scheduler": gw.scheduler.metrics(),
+            "http": f"{self.http.host}:{self.http.port}" if self.http else None,
+            "router": gw.llm.stats() if hasattr(gw.llm, "stats") else None,
+            "rate_limits": gw.llm.rate_limits() if hasattr(gw.llm, "rate_limits") else {},
+            "jobs": self.jobs.stats() if self.jobs else None,
+        }
+
+    # -- Connections -------------------------------------------
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    req = json.loads(line)
+                except ValueError:
+                    writer.write(encode({"type": "error", "error": "bad frame"}))
+                    await writer.drain()
+                    continue
+                self.last_activity = time.monotonic()
+                await self._dispatch(req, writer)
+                self.last_activity = time.monotonic()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # Client went away, or the daemon is shutting down
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, req, writer):
+        op = req.get("op")
+        if op == "message":
+            await self._message(req, writer)
+            return
+        if op == "status":
+            writer.write(encode({"type": "status", **self.status()}))
+        elif op == "cancel":
+            n = self.gateway.cancel(req.get("conv_id", "default"))
+            writer.write(encode({"type": "cancelled", "turns": n}))
+        elif op == "reload":
+            await self.reload()
+            writer.write(encode({"type": "reloaded", "reloads": self.reloads}))
+        elif op == "shutdown":
+            writer.write(encode({"type": "stopping"}))
+            self.stop()
+        else:
+            writer.write(encode({"type": "error", "error": f"unknown op '{op}'"}))
+            await writer.drain()
+            return
+        writer.write(encode({"type": "end"}))
+        await writer.drain()
+
+    async def _message(self, req, writer):
+        gw = self.gateway
+        self._users[gw] += 1
+        self.in_flight += 1
+        try:
+            text, conv_id = req.get("text", ""), check_conv_id(req.get("conv_id", "default"))
+            priority = req.get("priority", "normal")
+            if req.get("stream", True):
+                # A client that hangs up cancels the rest of its turn
+                async with aclosing(gw.handle_message_stream(text, conv_id, priority)) as turn:
+                    async for chunk in turn:
+                        writer.write(encode(chunk))
+                        await writer.drain()
+            else:
+                reply = await gw.handle_message(text, conv_id, priority)
+                writer.write(encode({"type": "text", "text": reply}))
+            writer.write(encode({"type": "end"}))
+            self.served += 1
+        except (ConnectionError, asyncio.CancelledError):
+            raise
+        except Exception as e:
+            self.errors += 1
+            log.error(f"Request failed: {e}")
+            writer.write(encode({"type": "error", "error": str(e)}))
+        finally:
+            self.in_flight -= 1
+            self._users[gw] -= 1
+        await writer.drain()
+
+
+# -- Client ------------------------------------------------------
+
+async def request(path, frame):
+    """Send one request frame, yield response frames until end/error.
+    Raises ConnectionError if no daemon is listening."""
+    try:
+        reader, writer = await asyncio.open_unix_connection(str(path), limit=FRAME_LIMIT)
+    except (FileNotFoundError, ConnectionRefusedError, OSError) as e:
+        raise ConnectionError(str(e)) from e
+    try:
+        writer.write(encode(frame))
+        await writer.drain()
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("daemon closed the connection")
+            chunk = json.loads(line)
+            if chunk.get("type") == "end":
+                return
+            yield chunk
+            if chunk.get("type") == "error":
+                return
+    finally:
+        writer.close()
+
+
+async def call(path, op, **kw):
+    """Non-streaming request; returns the first response frame."""
+    async with aclosing(request(path, {"op": op, **kw})) as frames:
+        async for chunk in frames:
+            return chunk
+    return {}
+
+
+async def ping(path):
+    try:
+        return (await asyncio.wait_for(call(path, "status"), 2)).get("type") == "status"
+    except (ConnectionError, asyncio.TimeoutError, ValueError):
+        return False
+
+
+async def run(config):
+    """Run the daemon in the foreground until stopped or idle."""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    daemon = Daemon(config)
+    await daemon.start()
+    sup = Supervisor()
+    sup.start()
+    log.info(f"PocketClaw daemon listening on {daemon.path}")
+    try:
+        await daemon.serve_forever()
+    finally:
+        sup.stop()
+
+
+async def spawn(config, wait=10):
+    """Start the daemon as a detached background process."""
+    import subprocess
+    import sys
+    LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+    pkg_root = str(Path(__file__).resolve().parent.parent)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [pkg_root, os.environ.get("PYTHONPATH")])))
+    with open(LOG_PATH, "a", encoding='utf-8') as logf:
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "pocketclaw", "start"],
+            stdin=subprocess.DEVNULL, stdout=logf, stderr=logf,
+            start_new_session=True, env=env,
+        )
+    path = socket_path(config)
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            return None
+        if await ping(path):
+            return proc.pid
+        await asyncio.sleep(0.1)
+    return None
@@ -0,0 +1,218 @@
+import json
+import re
+import sqlite3
+import zlib
+from datetime import datetime
+from pathlib import Path
+from .storage import connect_sqlite
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS facts (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    text TEXT NOT NULL,
+    updated TEXT NOT NULL
+);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS facts_fts USING fts5(
+    key, text, content='facts', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS facts_ai AFTER INSERT ON facts BEGIN
+    INSERT INTO facts_fts(rowid, key, text) VALUES (new.rowid, new.key, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS facts_ad AFTER DELETE ON facts BEGIN
+    INSERT INTO facts_fts(facts_fts, rowid, key, text) VALUES ('delete', old.rowid, old.key, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS facts_au AFTER UPDATE ON facts BEGIN
+    INSERT INTO facts_fts(facts_fts, rowid, key, text) VALUES ('delete', old.rowid, old.key, old.text);
+    INSERT INTO facts_fts(rowid, key, text) VALUES (new.rowid, new.key, new.text);
+END;
+"""
+
+_QUERY_TERM = re.compile(r'"([^"]+)"|(\S+)')
+
+
+def _searchable(key, value):
+    """Flatten a fact into the plain text the index sees."""
+    if isinstance(value, str):
+        body = value
+    else:
+        body = json.dumps(value, ensure_ascii=False, default=str)
+    return f"{key.replace('_', ' ')} {body}"
+
+
+def parse_query(query, prefix=False):
+    """Split a recall query into (kind, text) terms.
+
+    kind is 'phrase' for "quoted text" or multi-word tokens like user_name,
+    'prefix' for term* (or every bare term when prefix=True), else 'token'.
+    """
+    terms = []
+    for m in _QUERY_TERM.finditer(query):
+        if m.group(1):
+            words = re.findall(r"\w+", m.group(1))
+            if words:
+                terms.append(("phrase", " ".join(words)))
+            continue
+        raw = m.group(2)
+        star = raw.endswith("*")
+        words = re.findall(r"\w+", raw)
+        if not words:
+            continue
+        if len(words) > 1:
+            terms.append(("phrase", " ".join(words)))
+        elif star or prefix:
+            terms.append(("prefix", words[0]))
+        else:
+            terms.append(("token", words[0]))
+    return terms
+
+
+def _fts_expr(terms):
+    parts = []
+    for kind, text in terms:
+        quoted = '"' + text.replace('"', '""') + '"'
+        parts.append(quoted + "*" if kind == "prefix" else quoted)
+    return " OR ".join(parts)
+
+
+class FactStore:
+    """Key/value facts in SQLite with an FTS5 index for ranked recall."""
+
+    def __init__(self, path, legacy_json=None):
+        self.path = Path(path)
+        fresh = not self.path.exists()
+        self.db = connect_sqlite(self.path)
+        self.db.executescript(_SCHEMA)
+        try:
+            self.db.executescript(_FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # Some Python builds ship SQLite without FTS5
+            self.fts = False
+        if fresh and legacy_json:
+            self._import_json(Path(legacy_json))
+
+    def _import_json(self, path):
+        if not path.exists():
+            return
+        try:
+            facts = json.loads(path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return
+        self.update(facts)
+        path.rename(path.with_name(path.name + ".migrated"))
+
+    def _row(self, key, value, now):
+        return (key, json.dumps(value, ensure_ascii=False, default=str),
+                _searchable(key, value), now)
+
+    def get(self, key, default=None):
+        row = self.db.execute("SELECT value FROM facts WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def all(self):
+        rows = self.db.execute("SELECT key, value FROM facts ORDER BY rowid")
+        return {k: json.loads(v) for k, v in rows}
+
+    def recent(self, limit=10):
+        rows = self.db.execute(
+            "SELECT key, value FROM facts ORDER BY updated DESC, rowid DESC LIMIT ?", (int(limit),))
+        return [(k, json.loads(v)) for k, v in rows]
+
+    def count(self):
+        return self.db.execute("SELECT COUNT(*) FROM facts").fetchone()[0]
+
+    def digest(self):
+        """Hex CRC32 of every key and stored value, in key order; changes
+        whenever any fact does."""
+        crc = 0
+        for k, v in self.db.execute("SELECT key, value FROM facts ORDER BY key"):
+            crc = zlib.crc32(f"{k}\0{v}\n".encode(), crc)
+        return f"{crc:08x}"
+
+    def set(self, key, value):
+        self.update({key: value})
+
+    def update(self, facts):
+        """Insert or replace several facts in one transaction."""
+        now = datetime.now().isoformat(timespec="seconds")
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO facts (key, value, text, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, "
+                "text = excluded.text, updated = excluded.updated",
+                [self._row(k, v, now) for k, v in facts.items()],
+            )
+
+    def delete(self, *keys):
+        with self.db:
+            cur = self.db.executemany("DELETE FROM facts WHERE key = ?", [(k,) for k in keys])
+        return cur.rowcount > 0
+
+    def replace(self, facts):
+        """Make the store hold exactly `facts`, atomically."""
+        now = datetime.now().isoformat(timespec="seconds")
+        with self.db:
+            keep = list(facts)
+            marks = ",".join("?" * len(keep))
+            if keep:
+                self.db.execute(f"DELETE FROM facts WHERE key NOT IN ({marks})", keep)
+            else:
+                self.db.execute("DELETE FROM facts")
+            self.db.executemany(
+                "INSERT INTO facts (key, value, text, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, "
+                "text = excluded.text, updated = excluded.updated",
+                [self._row(k, v, now) for k, v in facts.items()],
+            )
+
+    def search(self, query, limit=10):
+        """Ranked recall. Returns [(key, value, score)], best first.
+
+        Bare terms match whole tokens; if nothing matches they are retried
+        as prefixes so partial words still find something.
+        """
+        terms = parse_query(query)
+        if not terms:
+            return []
+        hits = self._search(terms, limit)
+        if not hits and any(kind == "token" for kind, _ in terms):
+            hits = self._search(parse_query(query, prefix=True), limit)
+        return hits
+
+    def _search(self, terms, limit):
+        if self.fts:
+            rows = self.db.execute(
+                "SELECT f.key, f.value, bm25(facts_fts, 2.0, 1.0) AS score "
+                "FROM facts_fts JOIN facts f ON f.rowid = facts_fts.rowid "
+                "WHERE facts_fts MATCH ? ORDER BY score LIMIT ?",
+                (_fts_expr(terms), int(limit)),
+            )
+            return [(k, json.loads(v), -s) for k, v, s in rows]
+        return self._scan(terms, limit)
+
+    def _scan(self, terms, limit):
+        # Fallback without FTS5: score by number of matching terms
+        scored = []
+        for key, value, text in self.db.execute("SELECT key, value, text FROM facts"):
+            words = re.findall(r"\w+", text.lower())
+            joined = " ".join(words)
+            score = 0
+            for kind, t in terms:
+                t = t.lower()
+                if kind == "phrase":
+                    score += f" {t} " in f" {joined} "
+                elif kind == "prefix":
+                    score += any(w.startswith(t) for w in words)
+                else:
+                    score += t in words
+            if score:
+                scored.append((key, json.loads(value), float(score)))
+        scored.sort(key=lambda h: -h[2])
+        return scored[:int(limit)]
+
+    def close(self):
+        self.db.close()
@@ -1,18 +1,50 @@
+import asyncio
+import contextvars
+import json
 import logging
-from .llm import LLMConnector
+import time
+from contextlib import aclosing, nullcontext
+from .compaction import Compactor
+from .llm import LLMConnector, ToolCall
+from .macros import MacroStore, Trace
+from .router import Router
 from .memory import MemoryStore
+from .metrics import MetricsLog
+from .pipeline import Pipeline, PipelineError
+from .scheduler import Scheduler
 from .skill_loader import SkillLoader
-from .system_prompt import build_system_prompt
+from .supervisor import WAKE_LOCK
+from .system_prompt import build_system_prompt, prompt_parts
+from .tools.cache import CACHED_FLAG, ToolCache, invalidates, read_only
+from .tools.process import ToolScope
 
 log = logging.getLogger(__name__)
 
+# Stands in for output a cancelled turn never produced
+CANCELLED = "[cancelled]"
+
+# The tool cache and metrics of the turn whose tool call is running, so
+# tools that run other tools (macro, pipeline) can run them the same way
+_turn = contextvars.ContextVar("turn_tools", default=(None, None))
+
 
 class Gateway:
     def __init__(self, config):
         self.config = config
-        self.llm = LLMConnector(config.get("llm"))
+        if config.get("llm.router.enabled", False):
+            self.llm = Router(config)
+        else:
+            self.llm = LLMConnector(config.get("llm"))
         self.memory = MemoryStore(config)
         self.skills = SkillLoader(config)
+        self.macros = MacroStore(config)
+        self.scheduler = Scheduler(config.get("advanced.max_concurrent_llm", 4))
+        # Conversations whose LLM calls always skip the response cache
+        self.cache_bypass = set(config.get("llm.cache.bypass", []) or [])
+        self.metrics = MetricsLog(config)
+        self.compactor = Compactor.from_config(config.get("memory.compaction") or {})
+        # Prompt parts and tool list built ahead of a conversation's next turn
+        self._warm = {}
         self.tools = {}
         self._register_tools()
 
@@ -26,6 +58,8 @@ class Gateway:
 
         self.tools["memory"] = self.memory.handle_tool
         self.tools["confirm"] = self._handle_confirm
+        self.tools["macro"] = self._handle_macro
+        self.tools["pipeline"] = self._handle_pipeline
 
         for name, handler in self.skills.get_handlers().items():
             self.tools[name] = handler
@@ -34,11 +68,15 @@ class Gateway:
         defs = self.skills.get_tool_definitions()
         defs.append({
             "name": "memory",
-            "description": "Store or retrieve persistent info. 'remember' to save, 'recall' to search, 'forget' to remove.",
+            "description": (
+                "Store or retrieve persistent info. 'remember' to save, 'recall' to search, 'forget' to remove. "
+                "Recall queries match words; use \"quoted phrases\" or prefix* terms. Results are ranked."
+            ),
             "parameters": {
                 "action": {"type": "string", "description": "'remember', 'recall', or 'forget'", "required": True},
                 "key": {"type": "string", "description": "What to remember/recall/forget", "required": True},
                 "value": {"type": "string", "description": "Value to remember", "required": False},
+                "limit": {"type": "integer", "description": "Max recall results (default 10)", "required": False},
             },
         })
         defs.append({
@@ -49,107 +87,342 @@ class Gateway:
                 "risk_level": {"type": "string", "description": "'low', 'medium', or 'high'", "required": False},
             },
         })
+        defs.append({
+            "name": "pipeline",
+            "description": (
+                "Run several tool calls in one go when each just feeds the next, e.g. http_request -> "
+                "run_python to parse -> write_file. Each step is {id, tool, args}. A string arg can include "
+                "an earlier step's output as {{id}}, a JSON value from it as {{id | json: $.items[0].name}} "
+                "or a regex match (group 1 if any) as {{id | re: pattern}}. Outputs are inserted as plain text, "
+                "except in run_shell commands and run_python code, where a reference must end in | shell or "
+                "| py to be quoted, e.g. {{id | json: $.name | py}}. "
+                "Independent steps run in parallel; a failed step skips the steps that use it. Returns the "
+                "outputs of the steps listed in output (default: the last steps)."
+            ),
+            "parameters": {
+                "steps": {"type": "array", "items": {"type": "object"},
+                          "description": "[{id, tool, args}, ...]", "required": True},
+                "output": {"type": "array", "description": "Step ids whose output to return", "required": False},
+            },
+        })
+        saved = self.macros.describe()
+        defs.append({
+            "name": "macro",
+            "description": (
+                "Replay or record a fixed sequence of tool calls. 'run' replays a saved macro locally, "
+                "checking the screen before each step; if a check fails you get the current screen and "
+                "continue yourself. After finishing a task the user will repeat, 'save' stores this "
+                "turn's successful tool calls under a name; params maps a parameter name to the literal "
+                "value used (a whole word in some argument), so runs can pass another. A macro that runs "
+                "shell commands, writes files or was confirmed when recorded needs confirmed=true, "
+                "after asking the user with the confirm tool. Also 'list' and 'delete'. "
+                + (f"Saved: {saved}" if saved else "No macros saved yet.")
+            ),
+            "parameters": {
+                "action": {"type": "string", "description": "'run', 'save', 'list' or 'delete'", "required": True},
+                "name": {"type": "string", "description": "Macro name", "required": False},
+                "params": {"type": "object", "description": "run: parameter values; save: parameter name -> literal value in this turn", "required": False},
+                "description": {"type": "string", "description": "save: what the macro does", "required": False},
+                "confirmed": {"type": "boolean", "description": "run: the user confirmed this run", "required": False},
+            },
+        })
         return defs
 
-    async def handle_message(self, user_input, conv_id="default"):
+    async def handle_message(self, user_input, conv_id="default", priority="normal"):
+        async with self.scheduler.turn(conv_id):
+            tm = self.metrics.turn(conv_id, self.llm.provider, self.llm.model)
+            with WAKE_LOCK.hold():
+                try:
+                    return await self._run_turn(user_input, conv_id, priority, tm)
+                except BaseException as e:
+                    tm.error = type(e).__name__
+                    raise
+                finally:
+                    self._save_metrics(tm)
+
+    async def handle_message_stream(self, user_input, conv_id="default", priority="normal"):
+        async with self.scheduler.turn(conv_id):
+            tm = self.metrics.turn(conv_id, self.llm.provider, self.llm.model, stream=True)
+            with WAKE_LOCK.hold():
+                try:
+                    async with aclosing(self._run_turn_stream(user_input, conv_id, priority, tm)) as turn:
+                        async for chunk in turn:
+                            yield chunk
+                except BaseException as e:
+                    tm.error = type(e).__name__
+                    raise
+                finally:
+                    self._save_metrics(tm)
+
+    def _save_metrics(self, tm):
+        try:
+            self.metrics.save(tm)
+        except OSError as e:
+            log.warning(f"Could not write metrics: {e}")
+
+    def cancel(self, conv_id):
+        return self.scheduler.cancel(conv_id)
+
+    async def prewarm(self, conv_id):
+        """Do the message-independent part of conv_id's next turn while the
+        user is still typing: read the prompt inputs, build the tool list
+        and open a connection to the provider."""
+        try:
+            self._warm[conv_id] = (prompt_parts(self.skills, self.memory), self.get_tool_definitions())
+            preconnect = getattr(self.llm, "preconnect", None)
+            if preconnect:
+                await preconnect()
+        except Exception as e:
+            log.debug(f"Prewarm failed: {e}")
+
+    def _build(self, conv_id, user_input):
+        parts, tools = self._warm.pop(conv_id, (None, None))
         messages = self.memory.get_conversation(conv_id)
-        system = build_system_prompt(self.config, self.skills, self.memory)
-        tools = self.get_tool_definitions()
+        system = build_system_prompt(self.config, self.skills, self.memory, user_input, parts)
+        return messages, system, tools or self.get_tool_definitions()
+
+    async def _run_turn(self, user_input, conv_id, priority, tm):
+        with tm.span("build"):
+            messages, system, tools = self._build(conv_id, user_input)
         messages.append({"role": "user", "content": user_input})
         max_iter = self.config.get("advanced.max_tool_iterations", 50)
+        use_cache = conv_id not in self.cache_bypass
+        tool_cache = self._tool_cache()
+        trace = self.macros.trace(conv_id)
+        tool_results = []
+
+        try:
+            for _ in range(max_iter):
+                queued = time.monotonic()
+                async with self.scheduler.slot(priority):
+                    tm.add("queue", queued)
+                    started = time.monotonic()
+                    response = await self.llm.chat(system, self._compact(messages, tm), tools, cache=use_cache)
+                    tm.llm(started, response.usage, cached=response.cached, route=response.route,
+                           throttle=response.throttle)
 
-        for _ in range(max_iter):
-            response = await self.llm.chat(system, messages, tools)
+                if not response.tool_calls:
+                    if response.text:
+                        messages.append({"role": "assistant", "content": response.text})
+                    with tm.span("save"):
+                        self.memory.save_conversation(conv_id, messages)
+                    return response.text or ""
 
-            if not response.tool_calls:
+                # Build assistant message with tool use blocks
+                content = []
                 if response.text:
-                    messages.append({"role": "assistant", "content": response.text})
-                self.memory.save_conversation(conv_id, messages)
-                return response.text or ""
-
-            # Build assistant message with tool use blocks
-            content = []
-            if response.text:
-                content.append({"type": "text", "text": response.text})
-            for tc in response.tool_calls:
-                content.append({
-                    "type": "tool_use", "id": tc.id,
-                    "name": tc.name, "input": tc.arguments,
-                })
-            messages.append({"role": "assistant", "content": content})
-
-            # Execute tools and collect results
-            tool_results = []
-            for tc in response.tool_calls:
-                result = await self._exec_tool(tc)
-                tool_results.append({
-                    "type": "tool_result",
-                    "tool_use_id": tc.id,
-                    "content": result,
-                })
-            messages.append({"role": "user", "content": tool_results})
-
-        self.memory.save_conversation(conv_id, messages)
+                    content.append({"type": "text", "text": response.text})
+                for tc in response.tool_calls:
+                    content.append({
+                        "type": "tool_use", "id": tc.id,
+                        "name": tc.name, "input": tc.arguments,
+                    })
+                messages.append({"role": "assistant", "content": content})
+
+                # Execute tools and collect results
+                tool_results = []
+                for tc in response.tool_calls:
+                    result, cached = await self._exec_tool(tc, tool_cache, tm, trace)
+                    result = CACHED_FLAG + result if cached else result
+                    tool_results.append({
+                        "type": "tool_result",
+                        "tool_use_id": tc.id,
+                        "content": result,
+                    })
+                messages.append({"role": "user", "content": tool_results})
+        except asyncio.CancelledError:
+            self._save_cancelled(conv_id, messages, results=tool_results)
+            raise
+
+        with tm.span("save"):
+            self.memory.save_conversation(conv_id, messages)
         return "[max tool iterations reached]"
 
-    async def handle_message_stream(self, user_input, conv_id="default"):
-        messages = self.memory.get_conversation(conv_id)
-        system = build_system_prompt(self.config, self.skills, self.memory)
-        tools = self.get_tool_definitions()
+    async def _run_turn_stream(self, user_input, conv_id, priority, tm):
+        with tm.span("build"):
+            messages, system, tools = self._build(conv_id, user_input)
         messages.append({"role": "user", "content": user_input})
         max_iter = self.config.get("advanced.max_tool_iterations", 50)
+        use_cache = conv_id not in self.cache_bypass
+        tool_cache = self._tool_cache()
+        trace = self.macros.trace(conv_id)
+        full_text, tool_results = "", []
+
+        try:
+            for _ in range(max_iter):
+                full_text = ""
+                tool_calls = []
+                usage, cached, route, throttle, first_token = {}, False, None, None, None
 
-        for _ in range(max_iter):
-            full_text = ""
-            tool_calls = []
+                queued = time.monotonic()
+                async with self.scheduler.slot(priority):
+                    tm.add("queue", queued)
+                    started = time.monotonic()
+                    # aclosing: a cancelled turn closes the provider stream at once
+                    sent = self._compact(messages, tm)
+                    async with aclosing(self.llm.chat_stream(system, sent, tools, cache=use_cache)) as stream:
+                        async for chunk in stream:
+                            if first_token is None and chunk["type"] in ("text", "tool_calls"):
+                                first_token = time.monotonic()
+                            if chunk["type"] == "text":
+                                full_text += chunk["text"]
+                                yield chunk
+                            elif chunk["type"] == "tool_calls":
+                                tool_calls = chunk["tool_calls"]
+                            elif chunk["type"] == "done":
+                                usage, cached, route = chunk.get("usage") or {}, chunk.get("cached", False), chunk.get("route")
+                                throttle = chunk.get("throttle")
+                    tm.llm(started, usage, first_token, cached, route, throttle)
 
-            async for chunk in self.llm.chat_stream(system, messages, tools):
-                if chunk["type"] == "text":
-                    yield chunk
-                    full_text += chunk["text"]
-                elif chunk["type"] == "tool_calls":
-                    tool_calls = chunk["tool_calls"]
+                if not tool_calls:
+                    if full_text:
+                        messages.append({"role": "assistant", "content": full_text})
+                    with tm.span("save"):
+                        self.memory.save_conversation(conv_id, messages)
+                    return
 
-            if not tool_calls:
+                content = []
                 if full_text:
-                    messages.append({"role": "assistant", "content": full_text})
-                self.memory.save_conversation(conv_id, messages)
-                return
-
-            content = []
-            if full_text:
-                content.append({"type": "text", "text": full_text})
-            for tc in tool_calls:
-                content.append({
-                    "type": "tool_use", "id": tc.id,
-                    "name": tc.name, "input": tc.arguments,
-                })
-            messages.append({"role": "assistant", "content": content})
-
-            tool_results = []
-            for tc in tool_calls:
-                yield {"type": "tool_call", "name": tc.name, "arguments": tc.arguments}
-                result = await self._exec_tool(tc)
-                yield {"type": "tool_result", "name": tc.name, "result": result}
-                tool_results.append({
-                    "type": "tool_result",
-                    "tool_use_id": tc.id,
-                    "content": result,
-                })
-            messages.append({"role": "user", "content": tool_results})
-
-        self.memory.save_conversation(conv_id, messages)
-
-    async def _exec_tool(self, tool_call):
+                    content.append({"type": "text", "text": full_text})
+                for tc in tool_calls:
+                    content.append({
+                        "type": "tool_use", "id": tc.id,
+                        "name": tc.name, "input": tc.arguments,
+                    })
+                messages.append({"role": "assistant", "content": content})
+
+                tool_results = []
+                for tc in tool_calls:
+                    yield {"type": "tool_call", "name": tc.name, "arguments": tc.arguments}
+                    result, cached = await self._exec_tool(tc, tool_cache, tm, trace)
+                    result = CACHED_FLAG + result if cached else result
+                    tool_results.append({
+                        "type": "tool_result",
+                        "tool_use_id": tc.id,
+                        "content": result,
+                    })
+                    yield {"type": "tool_result", "name": tc.name, "result": result}
+                messages.append({"role": "user", "content": tool_results})
+        except (asyncio.CancelledError, GeneratorExit):
+            # Cancelled, or the consumer closed the stream early
+            self._save_cancelled(conv_id, messages, full_text, tool_results)
+            raise
+
+        with tm.span("save"):
+            self.memory.save_conversation(conv_id, messages)
+
+    def _save_cancelled(self, conv_id, messages, text="", results=()):
+        """Save what a cancelled turn got done. Tool calls left without a
+        result are answered with CANCELLED and the turn ends on an assistant
+        message, so the history stays valid for the next request."""
+        last = messages[-1]
+        if last["role"] == "assistant" and isinstance(last["content"], list):
+            done = {r["tool_use_id"] for r in results}
+            pending = [b["id"] for b in last["content"] if b["type"] == "tool_use" and b["id"] not in done]
+            messages.append({"role": "user", "content": list(results) + [
+                {"type": "tool_result", "tool_use_id": i, "content": CANCELLED} for i in pending
+            ]})
+            text = ""
+        if last["role"] != "assistant" or not isinstance(last["content"], str):
+            messages.append({"role": "assistant", "content": f"{text}\n\n{CANCELLED}" if text else CANCELLED})
+        try:
+            self.memory.save_conversation(conv_id, messages)
+        except Exception as e:
+            log.error(f"Saving cancelled turn failed: {e}")
+
+    def _compact(self, messages, tm):
+        """messages as they should be sent, with stale tool output elided."""
+        if not self.compactor:
+            return messages
+        sent, saved = self.compactor.compact(messages)
+        # ~4 characters per token, as RateLimiter.estimate counts
+        tm.elided_tokens += saved // 4
+        return sent
+
+    def _tool_cache(self):
+        return ToolCache() if self.config.get("advanced.tool_cache", True) else None
+
+    async def _exec_tool(self, tool_call, cache=None, tm=None, trace=None):
+        """(result, cached). The result is the tool's own output; callers
+        that show it to the model mark cache hits with CACHED_FLAG."""
+        started = time.monotonic()
         handler = self.tools.get(tool_call.name)
         if not handler:
-            return f"Error: unknown tool '{tool_call.name}'"
+            return f"Error: unknown tool '{tool_call.name}'", False
+        args = tool_call.arguments
+        if cache is not None:
+            hit = cache.get(tool_call.name, handler, args)
+            if hit is not None:
+                if tm:
+                    tm.tool(tool_call.name, started, hit, cached=True)
+                return hit, True
+        timeout = self._tool_timeout(tool_call.name, handler, args)
+        scope = ToolScope.from_config(self.config.get("advanced.tool_limits") or {})
         try:
-            return await handler(**tool_call.arguments)
+            token = _turn.set((cache, tm))
+            try:
+                with scope.active(), trace.active() if trace else nullcontext():
+                    result = await asyncio.wait_for(handler(**args), timeout)
+            finally:
+                _turn.reset(token)
+        except asyncio.TimeoutError:
+            result = f"Error: {tool_call.name} timed out after {timeout:g}s"
+            if scope.progress:
+                result += f" ({scope.progress})"
         except Exception as e:
             log.error(f"Tool {tool_call.name} failed: {e}")
+            result = f"Error: {e}"
+        if cache is not None:
+            cache.invalidate(handler, args)
+            cache.put(tool_call.name, handler, args, result)
+        if tm:
+            tm.tool(tool_call.name, started, result, usage=scope.usage())
+        if trace is not None:
+            trace.add(tool_call.name, args, result)
+        return result, False
+
+    def _tool_timeout(self, name, handler=None, args=None):
+        """Seconds a call to tool name may take; None for no limit. A
+        @timed_by tool gets at least its own timeout argument plus margin."""
+        overrides = self.config.get("advanced.tool_timeouts") or {}
+        timeout = overrides.get(name, self.config.get("advanced.tool_timeout", 30))
+        timeout = float(timeout) if timeout else None
+        own = getattr(handler, "timed_by", None)
+        if own and timeout is not None:
+            arg, default, margin = own
+            try:
+                timeout = max(timeout, float((args or {}).get(arg, default)) + margin)
+            except (TypeError, ValueError):
+                pass  # the tool reports its own bad argument
+        return timeout
+
+    def _nested_call(self, prefix):
+        """call(tool, args) running a tool through _exec_tool under the
+        current turn's cache and metrics, with its own timeout and limits."""
+        cache, tm = _turn.get()
+
+        async def call(tool, args):
+            result, _ = await self._exec_tool(ToolCall(f"{prefix}_{tool}", tool, args), cache, tm)
+            return result
+        return call
+
+    @invalidates("*")
+    async def _handle_macro(self, action, name=None, params=None, description="", confirmed=False):
+        return await self.macros.handle_tool(Trace.current(), self.tools, action, name, params, description,
+                                             self._nested_call("macro"), bool(confirmed))
+
+    @invalidates("*")
+    async def _handle_pipeline(self, steps, output=None):
+        try:
+            if isinstance(steps, str):
+                steps = json.loads(steps)
+            pipe = Pipeline(steps, output, forbidden=("pipeline", "confirm"))
+        except (PipelineError, ValueError) as e:
             return f"Error: {e}"
 
+        return await pipe.run(self._nested_call("pipeline"))
+
+    @read_only
     async def _handle_confirm(self, action, risk_level="medium"):
         return f"Confirmation needed: {action} (risk: {risk_level})"
 
@@ -0,0 +1,296 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from ..storage import check_conv_id
+
+log = logging.getLogger(__name__)
+
+MAX_BODY = 4 * 1024 * 1024
+STATUS = {
+    200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+    405: "Method Not Allowed", 411: "Length Required", 413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    version: str
+    headers: dict = field(default_factory=dict)
+    body: bytes = b""
+
+    @property
+    def keep_alive(self):
+        conn = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return conn == "keep-alive"
+        return conn != "close"
+
+    def json(self):
+        try:
+            data = json.loads(self.body or b"{}")
+        except ValueError:
+            raise HTTPError(400, "body is not valid JSON")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "body must be a JSON object")
+        return data
+
+
+class HTTPInterface:
+    """Local HTTP/1.1 API over the gateway.
+
+    POST /v1/message           {"text", "conv_id"?, "priority"?} -> {"reply", "conv_id"}
+    POST /v1/message/stream    same body, Server-Sent Events of gateway chunks
+    POST /v1/chat/completions  OpenAI-compatible shim (stream or not)
+    GET  /health               liveness + scheduler metrics
+
+    Connections are kept alive between requests. Every write waits for the
+    socket to drain, so a slow reader stalls its own turn (and eventually
+    times out) instead of buffering unbounded output.
+    """
+
+    def __init__(self, gateway, config):
+        self.gateway = gateway
+        self.config = config
+        self.host = config.get("interfaces.http.host", "127.0.0.1")
+        self.port = int(config.get("interfaces.http.port", 8765))
+        self.token = config.get("interfaces.http.token", "")
+        self.keepalive_timeout = config.get("interfaces.http.keepalive_timeout", 30)
+        self.write_timeout = config.get("interfaces.http.write_timeout", 30)
+        self.server = None
+        self.connections = 0
+        self.requests = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def run(self):
+        await self.start()
+        print(f"PocketClaw HTTP API on http://{self.host}:{self.port}")
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    # -- Connection handling -----------------------------------
+
+    async def _connection(self, reader, writer):
+        self.connections += 1
+        writer.transport.set_write_buffer_limits(high=64 * 1024)
+        try:
+            while True:
+                try:
+                    req = await asyncio.wait_for(self._read_request(reader), self.keepalive_timeout)
+                except asyncio.TimeoutError:
+                    break
+                except HTTPError as e:
+                    await self._send_json(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    break
+                if req is None:
+                    break
+                self.requests += 1
+                try:
+                    await self._route(req, writer)
+                except HTTPError as e:
+                    await self._send_json(writer, e.status, {"error": str(e)}, req.keep_alive)
+                except (ConnectionError, asyncio.TimeoutError):
+                    break
+                except Exception as e:
+                    log.error(f"HTTP {req.method} {req.path} failed: {e}")
+                    await self._send_json(writer, 500, {"error": str(e)}, keep_alive=False)
+                    break
+                if not req.keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, version = line.decode("latin-1").split()
+        except ValueError:
+            raise HTTPError(400, "malformed request line")
+        headers = {}
+        while True:
+            h = await reader.readline()
+            if h in (b"\r\n", b"\n", b""):
+                break
+            k, _, v = h.decode("latin-1").partition(":")
+            headers[k.strip().lower()] = v.strip()
+            if len(headers) > 100:
+                raise HTTPError(400, "too many headers")
+        if "transfer-encoding" in headers:
+            raise HTTPError(411, "chunked request bodies are not supported")
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HTTPError(400, "bad Content-Length")
+        if length > MAX_BODY:
+            raise HTTPError(413, "request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return Request(method.upper(), target.split("?", 1)[0], version, headers, body)
+
+    async def _route(self, req, writer):
+        if self.token and req.headers.get("authorization") != f"Bearer {self.token}":
+            raise HTTPError(401, "missing or wrong bearer token")
+        routes = {
+            "/health": ("GET", self._health),
+            "/v1/message": ("POST", self._message),
+            "/v1/message/stream": ("POST", self._message_stream),
+            "/v1/chat/completions": ("POST", self._chat_completions),
+        }
+        if req.path not in routes:
+            raise HTTPError(404, f"no route {req.path}")
+        method, handler = routes[req.path]
+        if req.method != method:
+            raise HTTPError(405, f"use {method}")
+        await handler(req, writer)
+
+    # -- Writing -----------------------------------------------
+
+    async def _drain(self, writer):
+        await asyncio.wait_for(writer.drain(), self.write_timeout)
+
+    def _head(self, status, headers, keep_alive):
+        lines = [f"HTTP/1.1 {status} {STATUS.get(status, '')}"]
+        headers = {**headers, "Connection": "keep-alive" if keep_alive else "close"}
+        lines += [f"{k}: {v}" for k, v in headers.items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+    async def _send_json(self, writer, status, obj, keep_alive=True):
+        body = json.dumps(obj, default=str).encode()
+        writer.write(self._head(status, {
+            "Content-Type": "application/json",
+            "Content-Length": len(body),
+        }, keep_alive) + body)
+        await self._drain(writer)
+
+    async def _send_events(self, writer, events, keep_alive):
+        """Stream SSE payloads using chunked encoding so the connection can
+        be reused afterwards."""
+        writer.write(self._head(200, {
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "Transfer-Encoding": "chunked",
+        }, keep_alive))
+        async with aclosing(events) as stream:
+            async for payload in stream:
+                data = payload.encode()
+                writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                await self._drain(writer)
+        writer.write(b"0\r\n\r\n")
+        await self._drain(writer)
+
+    # -- Endpoints ---------------------------------------------
+
+    async def _health(self, req, writer):
+        await self._send_json(writer, 200, {
+            "status": "ok",
+            "model": f"{self.gateway.llm.provider}/{self.gateway.llm.model}",
+            "connections": self.connections,
+            "requests": self.requests,
+            "scheduler": self.gateway.scheduler.metrics(),
+        }, req.keep_alive)
+
+    def _turn_args(self, data):
+        text = data.get("text")
+        if not isinstance(text, str) or not text.strip():
+            raise HTTPError(400, "'text' is required")
+        conv_id = self._conv_id(data.get("conv_id") or f"http-{uuid.uuid4().hex[:12]}")
+        return text, conv_id, data.get("priority", "normal")
+
+    @staticmethod
+    def _conv_id(conv_id):
+        try:
+            return check_conv_id(conv_id)
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+
+    async def _message(self, req, writer):
+        text, conv_id, priority = self._turn_args(req.json())
+        reply = await self.gateway.handle_message(text, conv_id, priority)
+        await self._send_json(writer, 200, {"reply": reply, "conv_id": conv_id}, req.keep_alive)
+
+    async def _message_stream(self, req, writer):
+        text, conv_id, priority = self._turn_args(req.json())
+
+        async def events():
+            yield f"event: start\ndata: {json.dumps({'conv_id': conv_id})}\n\n"
+            try:
+                async with aclosing(self.gateway.handle_message_stream(text, conv_id, priority)) as turn:
+                    async for chunk in turn:
+                        yield f"event: {chunk['type']}\ndata: {json.dumps(chunk, default=str)}\n\n"
+            except Exception as e:
+                yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+                return
+            yield "event: end\ndata: {}\n\n"
+
+        await self._send_events(writer, events(), req.keep_alive)
+
+    async def _chat_completions(self, req, writer):
+        """OpenAI-style entry point. PocketClaw keeps the history itself, so
+        only the last user message is used; pass the conversation id as the
+        `user` field or an X-Conversation-Id header to continue a thread."""
+        data = req.json()
+        user_msgs = [m for m in data.get("messages", []) if m.get("role") == "user"]
+        if not user_msgs:
+            raise HTTPError(400, "'messages' needs at least one user message")
+        content = user_msgs[-1].get("content")
+        if isinstance(content, list):
+            content = "\n".join(p.get("text", "") for p in content if p.get("type") == "text")
+        conv_id = self._conv_id(req.headers.get("x-conversation-id") or data.get("user")
+                                or f"openai-{uuid.uuid4().hex[:12]}")
+        cid, created, model = f"chatcmpl-{uuid.uuid4().hex[:24]}", int(time.time()), data.get("model", "pocketclaw")
+
+        if not data.get("stream"):
+            reply = await self.gateway.handle_message(content, conv_id)
+            await self._send_json(writer, 200, {
+                "id": cid, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }, req.keep_alive)
+            return
+
+        def frame(delta, finish=None):
+            return "data: " + json.dumps({
+                "id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }) + "\n\n"
+
+        async def events():
+            yield frame({"role": "assistant"})
+            try:
+                async with aclosing(self.gateway.handle_message_stream(content, conv_id)) as turn:
+                    async for chunk in turn:
+                        if chunk["type"] == "text":
+                            yield frame({"content": chunk["text"]})
+            except Exception as e:
+                yield "data: " + json.dumps({"error": {"message": str(e)}}) + "\n\n"
+            else:
+                yield frame({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        await self._send_events(writer, events(), req.keep_alive)
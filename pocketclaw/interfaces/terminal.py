@@ -1,6 +1,121 @@
+import asyncio
+import queue
+import signal
+import sys
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 
 
+class FrameWriter:
+    """Buffers streamed text and writes it out at most once per frame.
+
+    Text arriving after a quiet spell is written at once, so the first
+    token isn't delayed; a burst is coalesced into one write per frame.
+    """
+
+    def __init__(self, out=None, frame_ms=33):
+        self.out = out or sys.stdout
+        self.interval = frame_ms / 1000
+        self.buf = []
+        self.last = 0.0
+        self.timer = None
+        self.writes = 0
+
+    def write(self, text):
+        self.buf.append(text)
+        if self.timer:
+            return
+        wait = self.last + self.interval - time.monotonic()
+        if wait <= 0:
+            self.flush()
+        else:
+            self.timer = asyncio.get_running_loop().call_later(wait, self.flush)
+
+    def flush(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        if self.buf:
+            self.out.write("".join(self.buf))
+            self.out.flush()
+            self.buf.clear()
+            self.writes += 1
+        self.last = time.monotonic()
+
+
+@contextmanager
+def on_interrupt(callback):
+    """Call callback on the event loop for Ctrl+C instead of the default
+    handling (which would cancel the whole program)."""
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+    loop = asyncio.get_running_loop()
+    restore = signal.signal(signal.SIGINT, lambda *_: loop.call_soon_threadsafe(callback))
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGINT, restore)
+
+
+def _settle(fut, line, exc):
+    if not fut.done():
+        fut.set_exception(exc) if exc else fut.set_result(line)
+
+
+class _InputReader:
+    """One long-lived daemon thread that runs input() for each prompt put
+    on its queue and hands the line back to the asking event loop."""
+
+    def __init__(self):
+        self.prompts = queue.Queue()
+        self.answer = None  # future for the line being read, until taken
+        threading.Thread(target=self._run, name="terminal-input", daemon=True).start()
+
+    def _run(self):
+        while True:
+            prompt, fut = self.prompts.get()
+            try:
+                result = (input(prompt), None)
+            except BaseException as e:
+                result = (None, e)
+            try:
+                fut.get_loop().call_soon_threadsafe(_settle, fut, *result)
+            except RuntimeError:
+                pass  # that event loop has closed
+
+    def line(self, prompt):
+        """Future for the next line. A read abandoned by Ctrl+C is still
+        running, so its line is the one handed out next."""
+        loop = asyncio.get_running_loop()
+        if self.answer is None or self.answer.get_loop() is not loop:
+            self.answer = loop.create_future()
+            self.prompts.put((prompt, self.answer))
+        return self.answer
+
+
+_reader = None
+
+
+async def read_line(prompt):
+    """input() on the reader thread, so the event loop keeps running while
+    the user types. Ctrl+C raises KeyboardInterrupt here, as input() would."""
+    global _reader
+    if _reader is None:
+        _reader = _InputReader()
+    answer = _reader.line(prompt)
+    interrupted = asyncio.get_running_loop().create_future()
+    # A blocked input() can't be interrupted; answer Ctrl+C ourselves
+    with on_interrupt(lambda: interrupted.done() or interrupted.set_result(None)):
+        await asyncio.wait({answer, interrupted}, return_when=asyncio.FIRST_COMPLETED)
+    if not answer.done():
+        raise KeyboardInterrupt
+    _reader.answer = None
+    return answer.result()
+
+
 class TerminalInterface:
     def __init__(self, gateway, config):
         self.gateway = gateway
@@ -8,17 +123,26 @@ class TerminalInterface:
         self.conv_id = f"terminal-{datetime.now():%Y%m%d-%H%M%S}"
         self.color = config.get("display.color", True)
         self.show_tools = config.get("display.show_tool_calls", True)
+        self.prewarm = config.get("display.prewarm", True)
+        self.frame_ms = config.get("display.frame_ms", 33)
 
     def _c(self, code, text):
         return f"\033[{code}m{text}\033[0m" if self.color else text
 
     async def run(self):
         print(self._c("1;36", "PocketClaw") + " ready. Type /help for commands.\n")
+        warm = None
         while True:
+            # Warm up in the background while the user types; the turn
+            # uses whatever is ready by then and never waits for it
+            if self.prewarm and (warm is None or warm.done()):
+                warm = asyncio.create_task(self.gateway.prewarm(self.conv_id))
             try:
-                user_input = input(self._c("1;32", "> "))
+                user_input = await read_line(self._c("1;32", "> "))
             except (EOFError, KeyboardInterrupt):
                 print("\nBye!")
+                if warm:
+                    warm.cancel()
                 break
 
             if not user_input.strip():
@@ -29,25 +153,41 @@ class TerminalInterface:
                     break
                 continue
 
+            # Ctrl+C stops the reply (and its tools), not the program
+            turn = asyncio.create_task(self._reply(user_input))
             try:
-                async for chunk in self.gateway.handle_message_stream(user_input, self.conv_id):
-                    t = chunk["type"]
-                    if t == "text":
-                        print(chunk["text"], end="", flush=True)
-                    elif t == "tool_call" and self.show_tools:
-                        name = chunk["name"]
-                        args = " ".join(f"{k}={v!r}" for k, v in chunk["arguments"].items())
-                        print(self._c("2", f"\n  > {name} {args}"))
-                    elif t == "tool_result" and self.show_tools:
-                        result = chunk["result"]
-                        if len(result) > 500:
-                            result = result[:500] + "..."
-                        for line in result.split("\n"):
-                            print(self._c("2", f"    {line}"))
-                print()
+                with on_interrupt(turn.cancel):
+                    await turn
+            except asyncio.CancelledError:
+                if not turn.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                print(self._c("2", "\n[cancelled]\n"))
             except Exception as e:
                 print(self._c("31", f"\nError: {e}\n"))
 
+    async def _reply(self, user_input):
+        out = FrameWriter(frame_ms=self.frame_ms)
+        try:
+            async for chunk in self.gateway.handle_message_stream(user_input, self.conv_id, "interactive"):
+                t = chunk["type"]
+                if t == "text":
+                    out.write(chunk["text"])
+                    continue
+                out.flush()
+                if t == "tool_call" and self.show_tools:
+                    name = chunk["name"]
+                    args = " ".join(f"{k}={v!r}" for k, v in chunk["arguments"].items())
+                    print(self._c("2", f"\n  > {name} {args}"))
+                elif t == "tool_result" and self.show_tools:
+                    result = chunk["result"]
+                    if len(result) > 500:
+                        result = result[:500] + "..."
+                    for line in result.split("\n"):
+                        print(self._c("2", f"    {line}"))
+        finally:
+            out.flush()
+        print()
+
     def _slash(self, cmd):
         """Handle slash command. Returns False to exit."""
         cmd = cmd.strip().lower()
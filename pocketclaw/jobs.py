@@ -0,0 +1,323 @@
+import asyncio
+import json
+import logging
+import re
+import shutil
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from .config import POCKETCLAW_DIR
+from .storage import atomic_write, file_lock
+from .supervisor import WAKE_LOCK
+from .tools import process
+from .tools.process import ToolScope
+
+log = logging.getLogger(__name__)
+
+JOBS_PATH = POCKETCLAW_DIR / "jobs.json"
+
+# How long the scheduler sleeps at most before re-reading the wall clock.
+# The monotonic clock stops while the phone is suspended.
+MAX_SLEEP = 300
+
+_INTERVAL = re.compile(r"(\d+(?:\.\d+)?)([smhd])")
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_interval(value):
+    """Seconds from a number or a duration like "30m" or "1h30m"."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    value = str(value).strip()
+    parts = _INTERVAL.findall(value)
+    if not parts or "".join(n + u for n, u in parts) != value:
+        raise ValueError(f"bad interval {value!r}")
+    return sum(float(n) * _UNITS[u] for n, u in parts)
+
+
+class Cron:
+    """Five-field cron expression (minute hour day month weekday) in local
+    time, with *, lists, ranges and /steps. Weekday 0 and 7 are Sunday."""
+
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expr):
+        parts = expr.split()
+        if len(parts) != 5:
+            raise ValueError(f"cron needs 5 fields: {expr!r}")
+        self.minute, self.hour, self.day, self.month, weekday = (
+            self._field(p, lo, hi) for p, (lo, hi) in zip(parts, self.FIELDS)
+        )
+        self.weekday = {d % 7 for d in weekday}
+        # As in cron: if both day fields are restricted, either may match
+        self.either_day = parts[2] != "*" and parts[4] != "*"
+
+    @staticmethod
+    def _field(spec, lo, hi):
+        values = set()
+        for part in spec.split(","):
+            rng, _, step = part.partition("/")
+            if rng == "*":
+                a, b = lo, hi
+            elif "-" in rng:
+                a, b = map(int, rng.split("-"))
+            else:
+                a = b = int(rng)
+                if step:
+                    b = hi
+            if not lo <= a <= b <= hi or (step and int(step) < 1):
+                raise ValueError(f"bad cron field {spec!r}")
+            values.update(range(a, b + 1, int(step) if step else 1))
+        return values
+
+    def _day_ok(self, t):
+        dom, dow = t.day in self.day, t.isoweekday() % 7 in self.weekday
+        return dom or dow if self.either_day else dom and dow
+
+    def next(self, after):
+        """First matching minute (epoch seconds) strictly after after."""
+        t = datetime.fromtimestamp(after).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        end = t + timedelta(days=366 * 5)
+        while t < end:
+            if t.month not in self.month:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_ok(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hour:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minute:
+                t += timedelta(minutes=1)
+            else:
+                return t.timestamp()
+        raise ValueError("cron expression never matches")
+
+
+class Job:
+    """One `schedule:` entry of a skill. Runs a prompt through the gateway
+    or a shell command. window is how late it may run so it can share a
+    wakeup with other jobs."""
+
+    def __init__(self, skill, spec, index=0, window=300, timeout=300):
+        self.id = f"{skill}/{spec.get('name', index)}"
+        self.prompt = spec.get("prompt")
+        self.command = spec.get("command")
+        if not self.prompt and not self.command:
+            raise ValueError("needs a prompt or a command")
+        if "cron" in spec:
+            self.schedule = f"cron {spec['cron']}"
+            self.cron, self.interval = Cron(spec["cron"]), None
+        elif "every" in spec:
+            self.schedule = f"every {spec['every']}"
+            self.cron, self.interval = None, parse_interval(spec["every"])
+            if self.interval <= 0:
+                raise ValueError("interval must be positive")
+        else:
+            raise ValueError("needs every or cron")
+        self.window = parse_interval(spec.get("window", window))
+        self.timeout = parse_interval(spec.get("timeout", timeout))
+        # "defer" backs off on low battery; "run" ignores the battery
+        self.on_low_battery = spec.get("on_low_battery", "defer")
+
+    def first(self, now):
+        return now if self.interval else self.cron.next(now)
+
+    def after(self, due, now):
+        """(next due time, runs skipped) once the run due at due has happened
+        at now. However long the phone was off, it runs once."""
+        if self.interval:
+            n = int((now - due) // self.interval) + 1
+            return due + n * self.interval, n - 1
+        nxt, missed = self.cron.next(due), 0
+        while nxt <= now and missed < 1000:
+            nxt, missed = self.cron.next(nxt), missed + 1
+        return (nxt if nxt > now else self.cron.next(now)), missed
+
+    def period(self, due):
+        return self.interval or self.cron.next(due) - due
+
+
+def load_jobs(skills, window=300, timeout=300):
+    jobs = []
+    for skill in skills.skills.values():
+        for i, spec in enumerate(skill.data.get("schedule") or []):
+            try:
+                jobs.append(Job(skill.name, spec, i, window, timeout))
+            except (ValueError, TypeError, AttributeError) as e:
+                log.warning(f"Skill {skill.name}: skipping schedule entry {i}: {e}")
+    return jobs
+
+
+def load_state(path):
+    try:
+        return json.loads(Path(path).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+
+async def read_battery():
+    """(percent, charging) from termux-battery-status, or None if unknown."""
+    if not shutil.which("termux-battery-status"):
+        return None
+    try:
+        proc = await process.run(["termux-battery-status"], timeout=10)
+        info = json.loads(proc.stdout)
+    except (asyncio.TimeoutError, OSError, ValueError):
+        return None
+    charging = info.get("plugged", "UNPLUGGED") != "UNPLUGGED" or info.get("status") in ("CHARGING", "FULL")
+    return info.get("percentage"), charging
+
+
+class JobScheduler:
+    """Runs the jobs skills declare under `schedule:`.
+
+    Jobs due within each other's windows share one wakeup: the scheduler
+    sleeps until the earliest deadline (due time + window) and then runs
+    everything already due. The wake lock is held only while jobs run.
+    Unplugged below jobs.low_battery percent, jobs back off to backoff x
+    their period. Due times are persisted, so after a restart or a long
+    sleep each job runs once and skips the runs it missed.
+    """
+
+    def __init__(self, gateway, config, battery=read_battery, clock=time.time):
+        self.gateway = gateway
+        self.config = config
+        self.window = config.get("jobs.window", 300)
+        self.timeout = config.get("jobs.timeout", 300)
+        self.low_battery = config.get("jobs.low_battery", 20)
+        self.backoff = config.get("jobs.backoff", 4)
+        self.path = Path(config.get("jobs.state", str(JOBS_PATH))).expanduser()
+        self.battery = battery
+        self.clock = clock
+        self.state = load_state(self.path)
+        self._dirty = set()  # job ids whose state this process changed
+        self.jobs = []
+        self.wakeups = 0
+        self.task = None
+        self._changed = None
+        self.reload(gateway)
+
+    def reload(self, gateway):
+        """Pick up the jobs of a new gateway's skills."""
+        self.gateway = gateway
+        self.jobs = load_jobs(gateway.skills, self.window, self.timeout)
+        now = self.clock()
+        for job in self.jobs:
+            st = self.state.setdefault(job.id, {"runs": 0, "failures": 0, "missed": 0, "deferred": 0})
+            if st.get("schedule") != job.schedule:
+                st.update(schedule=job.schedule, due=job.first(now))
+                self._dirty.add(job.id)
+        if self._changed:
+            self._changed.set()
+
+    def next_wakeup(self):
+        """Earliest deadline of any job, or None without jobs."""
+        return min((self.state[j.id]["due"] + j.window for j in self.jobs), default=None)
+
+    def start(self):
+        self._changed = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+        return self
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def run(self):
+        while True:
+            wake = self.next_wakeup()
+            delay = MAX_SLEEP if wake is None else wake - self.clock()
+            if delay > 0:
+                self._changed.clear()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), min(delay, MAX_SLEEP))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.run_due()
+
+    async def run_due(self):
+        """Run every job that is due now, in one wakeup."""
+        now = self.clock()
+        due = [j for j in self.jobs if self.state[j.id]["due"] <= now]
+        if not due:
+            return []
+        self.wakeups += 1
+        with WAKE_LOCK.hold():
+            if any(j.on_low_battery != "run" for j in due) and await self._battery_low():
+                due = [j for j in due if not self._defer(j, now)]
+            await asyncio.gather(*(self._run(j, now) for j in due))
+        self._save()
+        return [j.id for j in due]
+
+    async def _battery_low(self):
+        reading = await self.battery()
+        if not reading or reading[0] is None:
+            return False
+        percent, charging = reading
+        return not charging and percent < self.low_battery
+
+    def _defer(self, job, now):
+        if job.on_low_battery == "run":
+            return False
+        st = self.state[job.id]
+        later = st.get("last_run", st["due"]) + job.period(st["due"]) * self.backoff
+        if later <= now:
+            return False
+        st["due"] = later
+        st["deferred"] += 1
+        self._dirty.add(job.id)
+        return True
+
+    async def _run(self, job, now):
+        st = self.state[job.id]
+        t0 = time.monotonic()
+        error = None
+        try:
+            if job.prompt:
+                # job.id is "skill/name"; conversation ids must be plain file names
+                conv_id = "job-" + re.sub(r"[^A-Za-z0-9._-]", "_", job.id)
+                self.gateway.memory.delete_conversation(conv_id)
+                await asyncio.wait_for(self.gateway.handle_message(job.prompt, conv_id, "background"), job.timeout)
+            else:
+                scope = ToolScope.from_config(self.config.get("advanced.tool_limits") or {})
+                with scope.active():
+                    proc = await process.run(job.command, shell=True, timeout=job.timeout)
+                if proc.returncode:
+                    tail = proc.stderr.decode(errors="replace").strip()[-200:]
+                    error = f"exit code {proc.returncode}" + (f": {tail}" if tail else "")
+        except asyncio.TimeoutError:
+            error = f"timed out after {job.timeout:g}s"
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        if error:
+            log.warning(f"Job {job.id} failed: {error}")
+        st["due"], missed = job.after(st["due"], now)
+        st["missed"] += missed
+        st["runs"] += 1
+        st["failures"] += bool(error)
+        st.update(last_run=now, last_ms=round((time.monotonic() - t0) * 1000, 1), last_error=error)
+        self._dirty.add(job.id)
+
+    def _save(self):
+        """Write the jobs this process changed over the file as it is now;
+        every other job keeps what is on disk, which another process may
+        have updated since we loaded it."""
+        with file_lock(self.path.with_suffix(".lock")):
+            disk = load_state(self.path)
+            self.state.update((k, v) for k, v in disk.items() if k not in self._dirty)
+            atomic_write(self.path, json.dumps(self.state, indent=1))
+            self._dirty.clear()
+
+    def stats(self):
+        wake = self.next_wakeup()
+        return {
+            "jobs": len(self.jobs),
+            "wakeups": self.wakeups,
+            "next_in": round(max(0.0, wake - self.clock()), 1) if wake is not None else None,
+            "wake_lock": WAKE_LOCK.stats(),
+        }
@@ -0,0 +1,32 @@
+import re
+
+_PATH = re.compile(r"\.([A-Za-z_][\w-]*)|\[(\d+|\*)\]|\[['\"](.+?)['\"]\]")
+
+
+class JSONPathError(ValueError):
+    pass
+
+
+def json_path(data, path):
+    """A JSONPath subset: $, .key, ['key'], [n] and [*] (which maps the
+    rest of the path over a list)."""
+    path = path.strip()
+    if not path.startswith("$"):
+        raise JSONPathError(f"JSONPath must start with $: {path!r}")
+    rest = path[1:]
+    pos = 0
+    while pos < len(rest):
+        m = _PATH.match(rest, pos)
+        if not m:
+            raise JSONPathError(f"bad JSONPath {path!r}")
+        key, index, quoted = m.groups()
+        pos = m.end()
+        if index == "*":
+            if not isinstance(data, list):
+                raise JSONPathError(f"{path!r}: [*] on a non-list")
+            return [json_path(item, "$" + rest[pos:]) for item in data]
+        try:
+            data = data[int(index)] if index is not None else data[key if key is not None else quoted]
+        except (KeyError, IndexError, TypeError):
+            raise JSONPathError(f"{path!r} not found")
+    return data
@@ -1,6 +1,10 @@
 import json
+import time
 import httpx
-from dataclasses import dataclass, field
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass, field
+from .llm_cache import ResponseCache, encode_chunk, request_key
+from .ratelimit import RETRY_STATUS, RateLimiter, Ticket
 
 PROVIDERS = {
     "anthropic": ("https://api.anthropic.com", "anthropic"),
@@ -10,6 +14,7 @@ PROVIDERS = {
     "groq": ("https://api.groq.com/openai/v1", "openai"),
     "ollama": ("http://localhost:11434/v1", "openai"),
 }
+KEEPALIVE = 60
 
 
 @dataclass
@@ -24,6 +29,20 @@ class LLMResponse:
     text: str | None = None
     tool_calls: list[ToolCall] = field(default_factory=list)
     usage: dict = field(default_factory=dict)
+    cached: bool = False
+    route: dict = field(default_factory=dict)
+    throttle: dict = field(default_factory=dict)
+
+
+def _param_schema(v):
+    """JSON schema of one tool parameter, keeping a declared item or
+    object shape so nested arguments reach the model intact."""
+    prop = {"type": v.get("type", "string"), "description": v.get("description", "")}
+    if prop["type"] == "array":
+        prop["items"] = v.get("items", {"type": "string"})
+    if prop["type"] == "object" and "properties" in v:
+        prop["properties"] = v["properties"]
+    return prop
 
 
 class LLMConnector:
@@ -35,20 +54,132 @@ class LLMConnector:
         self.temperature = config.get("temperature", 0.3)
         base, self.fmt = PROVIDERS.get(self.provider, PROVIDERS["openai"])
         self.base_url = config.get("base_url", base)
-        self.client = httpx.AsyncClient(timeout=120)
+        # Ask OpenAI-style streams for a final usage chunk; turn off for
+        # servers that reject stream_options
+        self.stream_usage = config.get("stream_usage", True)
+        # Keep idle connections around long enough for a resident daemon
+        # to reuse them between turns
+        self.client = httpx.AsyncClient(timeout=120, limits=httpx.Limits(keepalive_expiry=KEEPALIVE))
+        self.last_used = 0.0
+        cache = config.get("cache") or {}
+        self.cache = None
+        self.cache_max_temperature = cache.get("max_temperature", 0.3)
+        if cache.get("enabled"):
+            self.cache = ResponseCache.from_config(cache)
+        self.limiter = RateLimiter.from_config(config.get("rate_limit") or {})
+
+    async def chat(self, system, messages, tools=None, cache=True) -> LLMResponse:
+        key = self._cache_key(system, messages, tools) if cache else None
+        if key:
+            hit = self.cache.get(key, "chat")
+            if hit:
+                return LLMResponse(hit["text"], [ToolCall(**tc) for tc in hit["tool_calls"]], hit["usage"], cached=True)
+        if self.fmt == "anthropic":
+            resp = await self._anthropic(system, messages, tools)
+        else:
+            resp = await self._openai(system, messages, tools)
+        if key:
+            self.cache.put(key, "chat", {
+                "text": resp.text,
+                "tool_calls": [asdict(tc) for tc in resp.tool_calls],
+                "usage": resp.usage,
+            })
+        return resp
 
-    async def chat(self, system, messages, tools=None) -> LLMResponse:
+    async def chat_stream(self, system, messages, tools=None, cache=True):
+        key = self._cache_key(system, messages, tools) if cache else None
+        if key:
+            hit = self.cache.get(key, "stream")
+            if hit:
+                for c in hit:
+                    if c["type"] == "tool_calls":
+                        c = {**c, "tool_calls": [ToolCall(**tc) for tc in c["tool_calls"]]}
+                    elif c["type"] == "done":
+                        c = {**c, "cached": True}
+                    yield c
+                return
         if self.fmt == "anthropic":
-            return await self._anthropic(system, messages, tools)
-        return await self._openai(system, messages, tools)
+            stream = self._stream_anthropic(system, messages, tools)
+        else:
+            stream = self._stream_openai(system, messages, tools)
+        recorded = []
+        async for c in stream:
+            if key:
+                recorded.append(encode_chunk(c))
+            yield c
+        # Only replay streams that ran to completion and produced something
+        # (an HTTP error surfaces as a bare "done")
+        if key and len(recorded) > 1 and recorded[-1]["type"] == "done":
+            self.cache.put(key, "stream", recorded)
 
-    async def chat_stream(self, system, messages, tools=None):
+    async def preconnect(self):
+        """Open a pooled connection to the provider ahead of a request, so
+        the request doesn't wait on DNS and the TLS handshake. A no-op while
+        the last request's connection is still alive."""
+        if time.monotonic() - self.last_used < KEEPALIVE - 5:
+            return
+        try:
+            await self.client.head(self.base_url, timeout=10)
+            self.last_used = time.monotonic()
+        except httpx.HTTPError:
+            pass
+
+    def rate_limits(self):
+        return {f"{self.provider}/{self.model}": self.limiter.stats()} if self.limiter else {}
+
+    @asynccontextmanager
+    async def _post(self, url, headers, body, stream=False):
+        """POST through the rate limiter. Throttled responses are queued and
+        retried; yields (response, throttle) where throttle records the
+        time spent waiting and the number of retries."""
+        self.last_used = time.monotonic()
+        lim = self.limiter
+        if not lim:
+            req = self.client.build_request("POST", url, headers=headers, json=body)
+            r = await self.client.send(req, stream=stream)
+            try:
+                yield r, {}
+            finally:
+                await r.aclose()
+                self.last_used = time.monotonic()
+            return
+        ticket = Ticket(lim.estimate(body, with_output=self.fmt != "anthropic"))
+        while True:
+            await lim.acquire(ticket)
+            try:
+                req = self.client.build_request("POST", url, headers=headers, json=body)
+                r = await self.client.send(req, stream=stream)
+            except BaseException:
+                lim.release(ticket)
+                raise
+            if r.status_code in RETRY_STATUS and ticket.retries < lim.max_retries:
+                lim.throttle(ticket, r.headers)
+                await r.aclose()
+                lim.release(ticket)
+                continue
+            lim.update(ticket, r.headers, ok=r.is_success)
+            break
+        throttle = {}
+        if ticket.waited >= 0.001:
+            throttle["wait_ms"] = round(ticket.waited * 1000, 1)
+        if ticket.retries:
+            throttle["retries"] = ticket.retries
+        try:
+            yield r, throttle
+        finally:
+            await r.aclose()
+            lim.release(ticket)
+            self.last_used = time.monotonic()
+
+    def _cache_key(self, system, messages, tools):
+        """Request hash, or None when this request must not be cached."""
+        if not self.cache or self.temperature > self.cache_max_temperature:
+            return None
         if self.fmt == "anthropic":
-            async for c in self._stream_anthropic(system, messages, tools):
-                yield c
+            body = self._anth_body(system, messages, tools)
         else:
-            async for c in self._stream_openai(system, messages, tools):
-                yield c
+            body = self._oai_body(system, messages, tools)
+        return request_key(self.fmt, self.base_url, body)
 
     # -- Anthropic ---------------------------------------------
 
@@ -74,28 +205,34 @@ class LLMConnector:
         return body
 
     async def _anthropic(self, system, messages, tools):
-        r = await self.client.post(
+        async with self._post(
             f"{self.base_url}/v1/messages",
-            headers=self._anth_headers(),
-            json=self._anth_body(system, messages, tools),
-        )
-        r.raise_for_status()
-        return self._parse_anth(r.json())
+            self._anth_headers(),
+            self._anth_body(system, messages, tools),
+        ) as (r, throttle):
+            r.raise_for_status()
+            resp = self._parse_anth(r.json())
+        resp.throttle = throttle
+        return resp
 
     async def _stream_anthropic(self, system, messages, tools):
-        async with self.client.stream(
-            "POST",
+        async with self._post(
             f"{self.base_url}/v1/messages",
-            headers=self._anth_headers(),
-            json=self._anth_body(system, messages, tools, stream=True),
-        ) as r:
-            text, tcs, cur, cur_json = "", [], None, ""
+            self._anth_headers(),
+            self._anth_body(system, messages, tools, stream=True),
+            stream=True,
+        ) as (r, throttle):
+            text, tcs, cur, cur_json, usage = "", [], None, "", {}
             async for line in r.aiter_lines():
                 if not line.startswith("data: "):
                     continue
                 d = json.loads(line[6:])
                 t = d.get("type")
-                if t == "content_block_start":
+                if t == "message_start":
+                    usage.update(d.get("message", {}).get("usage", {}))
+                elif t == "message_delta":
+                    usage.update(d.get("usage", {}))
+                elif t == "content_block_start":
                     b = d.get("content_block", {})
                     if b.get("type") == "tool_use":
                         cur = {"id": b["id"], "name": b["name"]}
@@ -114,7 +251,7 @@ class LLMConnector:
                     cur = None
             if tcs:
                 yield {"type": "tool_calls", "tool_calls": tcs}
-            yield {"type": "done", "text": text}
+            yield {"type": "done", "text": text, "usage": usage, "throttle": throttle}
 
     def _parse_anth(self, data) -> LLMResponse:
         text, tcs = None, []
@@ -128,10 +265,7 @@ class LLMConnector:
     def _tool_anth(self, t):
         props, req = {}, []
         for k, v in t.get("parameters", {}).items():
-            prop = {"type": v.get("type", "string"), "description": v.get("description", "")}
-            if prop["type"] == "array":
-                prop["items"] = {"type": "string"}
-            props[k] = prop
+            props[k] = _param_schema(v)
             if v.get("required"):
                 req.append(k)
         return {
@@ -181,7 +315,7 @@ class LLMConnector:
                 out.append(msg)
         return out
 
-    async def _openai(self, system, messages, tools):
+    def _oai_body(self, system, messages, tools, stream=False):
         body = {
             "model": self.model,
             "max_tokens": self.max_tokens,
@@ -190,36 +324,39 @@ class LLMConnector:
         }
         if tools:
             body["tools"] = [self._tool_oai(t) for t in tools]
-        r = await self.client.post(
+        if stream:
+            body["stream"] = True
+            if self.stream_usage:
+                body["stream_options"] = {"include_usage": True}
+        return body
+
+    async def _openai(self, system, messages, tools):
+        async with self._post(
             f"{self.base_url}/chat/completions",
-            headers=self._oai_headers(),
-            json=body,
-        )
-        r.raise_for_status()
-        return self._parse_oai(r.json())
+            self._oai_headers(),
+            self._oai_body(system, messages, tools),
+        ) as (r, throttle):
+            r.raise_for_status()
+            resp = self._parse_oai(r.json())
+        resp.throttle = throttle
+        return resp
 
     async def _stream_openai(self, system, messages, tools):
-        body = {
-            "model": self.model,
-            "max_tokens": self.max_tokens,
-            "temperature": self.temperature,
-            "messages": self._to_oai_msgs(system, messages),
-            "stream": True,
-        }
-        if tools:
-            body["tools"] = [self._tool_oai(t) for t in tools]
-        async with self.client.stream(
-            "POST",
+        async with self._post(
             f"{self.base_url}/chat/completions",
-            headers=self._oai_headers(),
-            json=body,
-        ) as r:
-            text, tc_data = "", {}
+            self._oai_headers(),
+            self._oai_body(system, messages, tools, stream=True),
+            stream=True,
+        ) as (r, throttle):
+            text, tc_data, usage = "", {}, {}
             async for line in r.aiter_lines():
                 if not line.startswith("data: ") or line.strip() == "data: [DONE]":
                     continue
                 d = json.loads(line[6:])
-                delta = d.get("choices", [{}])[0].get("delta", {})
+                if d.get("usage"):
+                    usage = d["usage"]
+                # The usage chunk that ends the stream has no choices
+                delta = (d.get("choices") or [{}])[0].get("delta", {})
                 if delta.get("content"):
                     text += delta["content"]
                     yield {"type": "text", "text": delta["content"]}
@@ -240,7 +377,7 @@ class LLMConnector:
                     args = json.loads(d["args"]) if d["args"] else {}
                     tcs.append(ToolCall(d["id"], d["name"], args))
                 yield {"type": "tool_calls", "tool_calls": tcs}
-            yield {"type": "done", "text": text}
+            yield {"type": "done", "text": text, "usage": usage, "throttle": throttle}
 
     def _parse_oai(self, data) -> LLMResponse:
         msg = data["choices"][0]["message"]
@@ -253,12 +390,9 @@ class LLMConnector:
     def _tool_oai(self, t):
         props, req = {}, []
         for k, v in t.get("parameters", {}).items():
-            prop = {"type": v.get("type", "string"), "description": v.get("description", "")}
-            if prop["type"] == "array":
-                prop["items"] = {"type": "string"}
             if v.get("required"):
                 req.append(k)
-            props[k] = prop
+            props[k] = _param_schema(v)
         return {
             "type": "function",
             "function": {
@@ -270,3 +404,5 @@ class LLMConnector:
 
     async def close(self):
         await self.client.aclose()
+        if self.cache:
+            self.cache.close()
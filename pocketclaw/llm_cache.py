@@ -0,0 +1,123 @@
+import hashlib
+import json
+import time
+from dataclasses import asdict
+from pathlib import Path
+from .config import POCKETCLAW_DIR
+from .storage import connect_sqlite
+
+CACHE_PATH = POCKETCLAW_DIR / "cache" / "llm.db"
+
+
+def request_key(*parts):
+    """Stable hash of a request: dict keys sorted, no whitespace."""
+    blob = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def encode_chunk(chunk):
+    if chunk.get("type") == "tool_calls":
+        return {**chunk, "tool_calls": [asdict(tc) for tc in chunk["tool_calls"]]}
+    return chunk
+
+
+class ResponseCache:
+    """On-disk LRU of LLM responses keyed by request hash.
+
+    Entries expire after ttl seconds; the least recently used are evicted
+    once the cache holds more than max_entries or max_bytes of payload.
+    Hit/miss counters are kept in the database so every process sees them.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=500, max_bytes=20 * 1024 * 1024, ttl=86400):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.db = connect_sqlite(self.path)
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT, kind TEXT, data TEXT, size INTEGER, created REAL, used REAL, "
+                "PRIMARY KEY (key, kind))"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries(used)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, n INTEGER)")
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(
+            Path(cfg.get("path") or CACHE_PATH).expanduser(),
+            max_entries=cfg.get("max_entries", 500),
+            max_bytes=int(cfg.get("max_mb", 20) * 1024 * 1024),
+            ttl=cfg.get("ttl", 86400),
+        )
+
+    def _count(self, name):
+        self.db.execute(
+            "INSERT INTO counters VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET n = n + 1", (name,)
+        )
+
+    def get(self, key, kind):
+        now = time.time()
+        with self.db:
+            row = self.db.execute(
+                "SELECT data, created FROM entries WHERE key = ? AND kind = ?", (key, kind)
+            ).fetchone()
+            if row and self.ttl and now - row[1] > self.ttl:
+                self.db.execute("DELETE FROM entries WHERE key = ? AND kind = ?", (key, kind))
+                row = None
+            if row:
+                self.db.execute("UPDATE entries SET used = ? WHERE key = ? AND kind = ?", (now, key, kind))
+            self._count("hits" if row else "misses")
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, kind, data):
+        blob = json.dumps(data, default=str)
+        now = time.time()
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind, blob, len(blob), now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        if self.ttl:
+            self.db.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl,))
+        n, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if n <= self.max_entries and size <= self.max_bytes:
+            return
+        drop = []
+        for key, kind, sz in self.db.execute("SELECT key, kind, size FROM entries ORDER BY used"):
+            if n <= self.max_entries and size <= self.max_bytes:
+                break
+            drop.append((key, kind))
+            n, size = n - 1, size - sz
+        self.db.executemany("DELETE FROM entries WHERE key = ? AND kind = ?", drop)
+        self.db.execute(
+            "INSERT INTO counters VALUES ('evictions', ?) "
+            "ON CONFLICT(name) DO UPDATE SET n = n + excluded.n", (len(drop),)
+        )
+
+    def stats(self):
+        n, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        counters = dict(self.db.execute("SELECT name, n FROM counters"))
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "entries": n,
+            "bytes": size,
+            "hits": hits,
+            "misses": misses,
+            "evictions": counters.get("evictions", 0),
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+        }
+
+    def clear(self):
+        with self.db:
+            self.db.execute("DELETE FROM entries")
+            self.db.execute("DELETE FROM counters")
+
+    def close(self):
+        self.db.close()
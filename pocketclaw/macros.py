@@ -0,0 +1,308 @@
+import asyncio
+import contextvars
+import json
+import re
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from .config import POCKETCLAW_DIR
+from .storage import atomic_write, file_lock
+
+MACROS_PATH = POCKETCLAW_DIR / "macros.json"
+
+# Tools that manage state rather than do the task; never part of a macro
+NOT_RECORDED = {"macro", "memory", "confirm"}
+# Tools a replay runs only after the user confirms again, as the model
+# has to before running them itself
+NEEDS_CONFIRM = {"run_shell", "run_python", "write_file", "edit_file"}
+# Tools that only look, so only the ones after the last action matter
+OBSERVE = {"screen_read"}
+
+_EXIT = re.compile(r"\[exit code: (-?\d+)\]\s*$")
+_PARAM = re.compile(r"\{(\w+)\}")
+
+_trace = contextvars.ContextVar("macro_trace", default=None)
+
+
+def succeeded(result):
+    if not isinstance(result, str):
+        return True
+    m = _EXIT.search(result)
+    return not result.startswith("Error") and not (m and m.group(1) != "0")
+
+
+class Trace:
+    """Successful tool calls of a conversation's current and last turn."""
+
+    def __init__(self):
+        self.steps = []
+        self.previous = []
+
+    def start(self):
+        if self.steps:
+            self.previous, self.steps = self.steps, []
+
+    def add(self, name, args, result):
+        if name == "confirm":
+            # Kept as a marker so the macro asks again before the steps after it
+            self.steps.append({"tool": "confirm", "args": dict(args)})
+        elif name not in NOT_RECORDED and succeeded(result):
+            self.steps.append({"tool": name, "args": dict(args)})
+
+    def last(self):
+        return self.steps or self.previous
+
+    @contextmanager
+    def active(self):
+        """Make this the trace the macro tool records from."""
+        token = _trace.set(self)
+        try:
+            yield self
+        finally:
+            _trace.reset(token)
+
+    @staticmethod
+    def current():
+        return _trace.get() or Trace()
+
+
+def _guard(step):
+    """Screen texts that must be visible before step can run."""
+    if step["tool"] == "screen_tap_element" and "text" in step["args"]:
+        return [step["args"]["text"]]
+    return []
+
+
+def _substitute(value, params):
+    if isinstance(value, str):
+        return _PARAM.sub(lambda m: str(params.get(m.group(1), m.group(0))), value)
+    if isinstance(value, dict):
+        return {k: _substitute(v, params) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_substitute(v, params) for v in value]
+    return value
+
+
+def _literal(value):
+    """Regex for value as a whole word, so "5" doesn't rewrite "file5.txt"."""
+    return re.compile(r"(?<!\w)" + re.escape(str(value)) + r"(?!\w)")
+
+
+def _parameterise(value, params, used):
+    if isinstance(value, str):
+        for name, literal in params.items():
+            value, n = literal.subn("{" + name + "}", value)
+            if n:
+                used.add(name)
+        return value
+    if isinstance(value, dict):
+        return {k: _parameterise(v, params, used) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_parameterise(v, params, used) for v in value]
+    return value
+
+
+def needs_confirm(step):
+    if step["tool"] == "http_request":
+        return str(step["args"].get("method", "GET")).upper() not in ("GET", "HEAD")
+    return step["tool"] in NEEDS_CONFIRM
+
+
+def compile_steps(trace, params=None):
+    """Macro steps from a recorded trace: arguments with the given
+    parameter values replaced by {name}, and looks at the screen dropped
+    except after the last action (the guards re-check the screen). A
+    parameter whose value appears in no argument is an error."""
+    literals = {name: _literal(v) for name, v in (params or {}).items() if str(v)}
+    if len(literals) < len(params or {}):
+        raise ValueError("parameter values can't be empty")
+    trace = [s for s in trace if s["tool"] != "confirm"]
+    last_action = max((i for i, s in enumerate(trace) if s["tool"] not in OBSERVE), default=-1)
+    steps, used = [], set()
+    for i, s in enumerate(trace):
+        if s["tool"] in OBSERVE and i < last_action:
+            continue
+        step = {"tool": s["tool"], "args": _parameterise(s["args"], literals, used)}
+        if _guard(step):
+            step["expect"] = _guard(step)
+        if not steps or steps[-1] != step:
+            steps.append(step)
+    unused = sorted(set(literals) - used)
+    if unused:
+        raise ValueError(f"param {unused[0]!r} value {params[unused[0]]!r} isn't a whole word in any recorded argument")
+    return steps
+
+
+def _visible(screen, texts):
+    try:
+        elements = json.loads(screen).get("elements", [])
+    except (ValueError, AttributeError):
+        return False
+    shown = " ".join(f"{e.get('text', '')} {e.get('description', '')}" for e in elements).lower()
+    return all(t.lower() in shown for t in texts)
+
+
+class MacroStore:
+    """Named tool sequences recorded from successful turns and replayed
+    without the LLM.
+
+    Each step that acts on a screen element has a guard: the element must
+    be on screen (polled for up to guard_timeout seconds while the app
+    catches up). A failed guard stops the replay and hands the current
+    screen back to the LLM to carry on from there.
+    """
+
+    def __init__(self, config):
+        self.path = Path(config.get("macros.path", str(MACROS_PATH))).expanduser()
+        self.guard_timeout = config.get("macros.guard_timeout", 5)
+        self.poll = config.get("macros.poll_ms", 300) / 1000
+        self.traces = {}
+        self.macros = self._read()
+
+    def trace(self, conv_id):
+        """The Trace for conv_id, started for a new turn."""
+        tr = self.traces.pop(conv_id, None) or Trace()
+        self.traces[conv_id] = tr  # most recently used last
+        while len(self.traces) > 100:
+            self.traces.pop(next(iter(self.traces)))
+        tr.start()
+        return tr
+
+    def _read(self):
+        try:
+            return json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+
+    def _update(self, name, change):
+        """Set macro name to change(current macro or None), or drop it if
+        that returns None, re-reading the file under the lock so saves from
+        other processes aren't lost. Returns the macro as it was."""
+        with file_lock(self.path.with_suffix(".lock")):
+            self.macros = self._read()
+            old = self.macros.get(name)
+            new = change(old)
+            if new is None:
+                self.macros.pop(name, None)
+            else:
+                self.macros[name] = new
+            atomic_write(self.path, json.dumps(self.macros, indent=1, ensure_ascii=False))
+        return old
+
+    def _count(self, name, *counters):
+        self._update(name, lambda m: m and {**m, **{c: m.get(c, 0) + 1 for c in counters}})
+
+    def record(self, name, trace, description="", params=None):
+        try:
+            steps = compile_steps(trace.last(), params)
+        except ValueError as e:
+            return f"Error: {e}"
+        if not steps:
+            return "Error: nothing to record - no successful tool calls in this or the last turn"
+        confirms = [str(s["args"].get("action", "")) for s in trace.last() if s["tool"] == "confirm"]
+        macro = {
+            "description": description,
+            "params": sorted(params or {}),
+            "steps": steps,
+            "confirm": confirms + [f"{s['tool']} {json.dumps(s['args'], ensure_ascii=False)[:100]}"
+                                   for s in steps if needs_confirm(s)],
+            "created": round(time.time()),
+            "runs": 0,
+            "fallbacks": 0,
+        }
+        self._update(name, lambda _: macro)
+        return f"Saved macro '{name}' ({len(steps)} steps: {', '.join(s['tool'] for s in steps)})"
+
+    async def replay(self, name, params, tools, call=None, confirmed=False):
+        """Run a macro's steps through call(tool, args) (by default the
+        handler in tools). Returns the output of the final look at the
+        screen (or the last step), or an Error naming the step whose guard
+        failed, with the screen as it is now."""
+        self.macros = self._read()
+        macro = self.macros.get(name)
+        if not macro:
+            return f"Error: no macro named '{name}'"
+        missing = [p for p in macro["params"] if p not in (params or {})]
+        if missing:
+            return f"Error: macro '{name}' needs params: {', '.join(missing)}"
+        if macro.get("confirm") and not confirmed:
+            return (f"Error: macro '{name}' needs the user's confirmation for: {'; '.join(macro['confirm'])}. "
+                    f"Ask with the confirm tool, then run it again with confirmed=true.")
+        if call is None:
+            async def call(tool, args):
+                return await tools[tool](**args)
+        looks, last = [], ""
+        steps = macro["steps"]
+        for i, step in enumerate(steps, 1):
+            handler = tools.get(step["tool"])
+            if handler is None:
+                return self._stop(macro, name, i, f"tool {step['tool']} is not available", "")
+            expect = _substitute(step.get("expect", []), params)
+            if expect:
+                screen = await self._wait_for(expect, tools)
+                if screen is not None and not _visible(screen, expect):
+                    return self._stop(macro, name, i, f"{', '.join(map(repr, expect))} not on screen "
+                                      f"after {self.guard_timeout}s", screen)
+            try:
+                result = await call(step["tool"], _substitute(step["args"], params))
+            except Exception as e:
+                result = f"Error: {e}"
+            if not succeeded(result):
+                return self._stop(macro, name, i, f"{step['tool']} failed: {result}", "")
+            if step["tool"] in OBSERVE:
+                looks.append(result)
+            else:
+                looks, last = [], result
+        self._count(name, "runs")
+        return f"Macro '{name}' ran {len(steps)} steps.\n" + "\n".join(map(str, looks or [last]))
+
+    async def _wait_for(self, texts, tools):
+        """The screen once texts are visible or the guard times out; None
+        if the screen can't be read at all."""
+        read = tools.get("screen_read")
+        if read is None:
+            return None
+        deadline = time.monotonic() + self.guard_timeout
+        while True:
+            screen = await read()
+            if _visible(screen, texts) or time.monotonic() >= deadline:
+                return screen
+            await asyncio.sleep(self.poll)
+
+    def _stop(self, macro, name, i, why, screen):
+        self._count(name, "runs", "fallbacks")
+        done = f"Steps 1-{i - 1} done. " if i > 1 else ""
+        tail = f"\nCurrent screen:\n{screen}" if screen else ""
+        return (f"Error: macro '{name}' stopped at step {i}/{len(macro['steps'])}: {why}. "
+                f"{done}Continue the task from here.{tail}")
+
+    def describe(self):
+        """One line per macro for the macro tool's description."""
+        lines = []
+        for name, m in sorted(self.macros.items()):
+            params = f" (params: {', '.join(m['params'])})" if m["params"] else ""
+            lines.append(f"'{name}'{params}: {m['description'] or ', '.join(s['tool'] for s in m['steps'])}")
+        return "; ".join(lines)
+
+    async def handle_tool(self, trace, tools, action, name=None, params=None, description="", call=None,
+                          confirmed=False):
+        if isinstance(params, str):
+            try:
+                params = json.loads(params) if params.strip() else {}
+            except ValueError:
+                return "Error: params must be an object of name -> value"
+        if params is not None and not isinstance(params, dict):
+            return "Error: params must be an object of name -> value"
+        if action == "list":
+            return self.describe() or "No macros saved."
+        if not name:
+            return "Error: name is required"
+        if action == "save":
+            return self.record(name, trace, description, params)
+        if action == "run":
+            return await self.replay(name, params or {}, tools, call, confirmed)
+        if action == "delete":
+            if self._update(name, lambda _: None) is None:
+                return f"Error: no macro named '{name}'"
+            return f"Deleted macro '{name}'"
+        return f"Error: unknown action '{action}'"
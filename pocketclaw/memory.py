@@ -1,36 +1,130 @@
 import json
+import re
+import zlib
 from pathlib import Path
 from datetime import datetime
+from . import vectors
+from .facts import FactStore
+from .storage import JSONLLog, check_conv_id, get_backend
+from .tools.cache import read_only
 
 
 class MemoryStore:
     def __init__(self, config):
         self.base = Path(config.get("memory.path", "~/.pocketclaw/memory")).expanduser()
         self.base.mkdir(parents=True, exist_ok=True)
-        (self.base / "conversations").mkdir(exist_ok=True)
         self.max_messages = config.get("memory.max_conversation_messages", 50)
+        self.backend = get_backend(config.get("memory.backend", "json"), self.base, self.max_messages)
+        self._persisted = {}
+        self.recall_limit = config.get("memory.recall_limit", 10)
+        self.context_max_facts = config.get("memory.context_max_facts", 20)
+        self.context_token_budget = config.get("memory.context_token_budget", 500)
+        self.facts = FactStore(self.base / "facts.db", legacy_json=self.base / "facts.json")
+        self.history = JSONLLog(self.base / "facts_history.jsonl",
+                               config.get("memory.history_max_entries", 1000))
+        legacy = self.facts.get("facts_learned")
+        if legacy is not None:
+            if legacy:
+                self.history.append(*legacy)
+            self.facts.delete("facts_learned")
+
+        # Optional semantic layer (needs numpy): finds "spouse" for "wife"
+        self.fact_vectors = self.turn_vectors = None
+        self.semantic_min_score = config.get("memory.semantic.min_score", 0.25)
+        if config.get("memory.semantic.enabled", True) and vectors.available():
+            dim = config.get("memory.semantic.dim", 256)
+            (self.base / "vectors").mkdir(exist_ok=True)
+            self.fact_vectors = vectors.VectorIndex(self.base / "vectors" / "facts", dim)
+            if self.fact_vectors.version != self.facts.digest():
+                self._reindex_facts()
+            if config.get("memory.semantic.index_conversations", False):
+                self.turn_vectors = vectors.VectorIndex(self.base / "vectors" / "turns", dim)
+
+    def _reindex_facts(self):
+        self.fact_vectors.clear()
+        self.fact_vectors.add(((k, f"{k.replace('_', ' ')} {v}", None) for k, v in self.facts.all().items()),
+                              version=self.facts.digest())
+
+    def _index_turns(self, conv_id, messages):
+        items = []
+        for m in messages:
+            content = m.get("content")
+            if isinstance(content, list):
+                content = "\n".join(b.get("text", "") for b in content if b.get("type") == "text")
+            if m.get("role") not in ("user", "assistant") or not content:
+                continue
+            key = f"{conv_id}:{zlib.crc32(content.encode()):08x}"
+            items.append((key, content[:1000], {"conv": conv_id, "role": m["role"], "text": content[:300]}))
+        if items:
+            self.turn_vectors.add(items)
+
+    def related_facts(self, query, limit):
+        """Facts relevant to query: FTS and semantic hits merged by
+        reciprocal rank fusion. Returns [(key, value)]."""
+        ranked = {}
+        for rank, (k, v, _) in enumerate(self.facts.search(query, limit=limit)):
+            ranked[k] = [1 / (60 + rank), v]
+        if self.fact_vectors is not None:
+            hits = self.fact_vectors.search(query, limit, self.semantic_min_score)
+            for rank, (k, _, _) in enumerate(hits):
+                entry = ranked.setdefault(k, [0.0, None])
+                entry[0] += 1 / (60 + rank)
+        out = []
+        for k, (_, v) in sorted(ranked.items(), key=lambda kv: -kv[1][0])[:limit]:
+            if v is None:
+                v = self.facts.get(k)
+                if v is None:
+                    continue
+            out.append((k, v))
+        return out
+
+    def related_turns(self, query, limit=3):
+        if self.turn_vectors is None or not query:
+            return []
+        return [meta for _, _, meta in self.turn_vectors.search(query, limit, self.semantic_min_score)]
 
     def get_conversation(self, conv_id):
-        path = self.base / "conversations" / f"{conv_id}.json"
-        if path.exists():
-            msgs = json.loads(path.read_text(encoding='utf-8'))
-            return msgs[-self.max_messages:]
-        return []
+        msgs = self.backend.load(check_conv_id(conv_id), self.max_messages)
+        self._persisted[conv_id] = len(msgs)
+        return msgs
 
     def save_conversation(self, conv_id, messages):
-        path = self.base / "conversations" / f"{conv_id}.json"
-        path.write_text(encoding='utf-8', data=json.dumps(messages, indent=2, default=str))
+        # Callers append to the list they loaded, so only the tail is new.
+        # Appending (rather than rewriting) keeps turns saved concurrently
+        # by another process.
+        known = self._persisted.get(conv_id, 0)
+        if len(messages) >= known:
+            self.backend.append(conv_id, messages[known:])
+        else:
+            self.backend.replace(conv_id, messages)
+        if self.turn_vectors is not None:
+            self._index_turns(conv_id, messages[known:])
+        self._persisted[conv_id] = len(messages)
+
+    def delete_conversation(self, conv_id):
+        self.backend.delete(conv_id)
+        self._persisted.pop(conv_id, None)
+        if self.turn_vectors is not None:
+            self.turn_vectors.delete_prefix(f"{conv_id}:")
+
+    def clear_conversations(self):
+        for conv_id in self.backend.list():
+            self.backend.delete(conv_id)
+        self._persisted.clear()
+        if self.turn_vectors is not None:
+            self.turn_vectors.clear()
 
     def get_identity(self):
         path = self.base / "identity.md"
         return path.read_text(encoding='utf-8') if path.exists() else ""
 
     def get_facts(self):
-        path = self.base / "facts.json"
-        return json.loads(path.read_text(encoding='utf-8')) if path.exists() else {}
+        return self.facts.all()
 
     def save_facts(self, facts):
-        (self.base / "facts.json").write_text(encoding='utf-8', data=json.dumps(facts, indent=2))
+        self.facts.replace(facts)
+        if self.fact_vectors is not None:
+            self._reindex_facts()
 
     def get_context(self):
         parts = []
@@ -39,31 +133,69 @@ class MemoryStore:
             parts.append(identity)
         facts = self.get_facts()
         if facts:
-            items = [f"- {k}: {v}" for k, v in facts.items() if k != "facts_learned"]
-            if items:
-                parts.append("## Known Facts\n" + "\n".join(items))
+            items = [f"- {k}: {v}" for k, v in facts.items()]
+            parts.append("## Known Facts\n" + "\n".join(items))
         return "\n\n".join(parts)
 
-    async def handle_tool(self, action, key, value=None):
-        facts = self.get_facts()
+    def get_prompt_facts(self, query=None, identity=None):
+        """Facts for the system prompt: ranked by relevance to `query`,
+        topped up with the most recent ones, skipping anything already in
+        identity.md, capped by count and an approximate token budget."""
+        identity = (self.get_identity() if identity is None else identity).lower()
+        candidates = []
+        if query:
+            candidates += self.related_facts(query, self.context_max_facts)
+        candidates += self.facts.recent(self.context_max_facts)
+
+        lines, seen, budget = [], set(), self.context_token_budget
+        for k, v in candidates:
+            if k in seen or len(lines) >= self.context_max_facts:
+                continue
+            seen.add(k)
+            text = str(v).strip().lower()
+            if text and re.search(r"(?<!\w)" + re.escape(text) + r"(?!\w)", identity):
+                continue
+            line = f"- {k}: {v}"
+            cost = len(line) // 4 + 1
+            if cost > budget:
+                break
+            budget -= cost
+            lines.append(line)
+        for turn in self.related_turns(query):
+            line = f"- (earlier, {turn['role']}) {turn['text']}"
+            cost = len(line) // 4 + 1
+            if cost > budget:
+                break
+            budget -= cost
+            lines.append(line)
+        return "\n".join(lines)
+
+    @read_only
+    async def handle_tool(self, action, key, value=None, limit=None):
         if action == "remember":
-            facts[key] = value
-            facts.setdefault("facts_learned", []).append({
+            self.facts.set(key, value)
+            if self.fact_vectors is not None:
+                self.fact_vectors.add([(key, f"{key.replace('_', ' ')} {value}", None)],
+                                      version=self.facts.digest())
+            self.history.append({
                 "fact": f"{key}: {value}",
                 "date": datetime.now().isoformat()[:10],
             })
-            self.save_facts(facts)
             return f"Remembered: {key} = {value}"
         elif action == "recall":
-            matches = {
-                k: v for k, v in facts.items()
-                if key.lower() in k.lower() or key.lower() in str(v).lower()
-            }
-            return json.dumps(matches, indent=2) if matches else f"No facts matching '{key}'"
+            matches = dict(self.related_facts(key, int(limit or self.recall_limit)))
+            turns = self.related_turns(key)
+            if not matches and not turns:
+                return f"No facts matching '{key}'"
+            out = json.dumps(matches, indent=2)
+            if turns:
+                out += "\n\nRelated past messages:\n" + "\n".join(
+                    f"- [{t['conv']}] {t['role']}: {t['text']}" for t in turns)
+            return out
         elif action == "forget":
-            if key in facts:
-                del facts[key]
-                self.save_facts(facts)
+            if self.facts.delete(key):
+                if self.fact_vectors is not None:
+                    self.fact_vectors.delete(key, version=self.facts.digest())
                 return f"Forgot: {key}"
             return f"No fact '{key}' found"
         return f"Unknown action: {action}"
@@ -0,0 +1,269 @@
+import re
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from .config import POCKETCLAW_DIR
+from .storage import JSONLLog
+
+METRICS_PATH = POCKETCLAW_DIR / "metrics.jsonl"
+
+# USD per million (input, output) tokens, matched by model-name prefix.
+# Override or extend with metrics.prices in config.
+PRICES = {
+    "claude-opus-4": (15.0, 75.0),
+    "claude-sonnet-4": (3.0, 15.0),
+    "claude-3-7-sonnet": (3.0, 15.0),
+    "claude-3-5-sonnet": (3.0, 15.0),
+    "claude-3-5-haiku": (0.8, 4.0),
+    "claude-haiku-4": (1.0, 5.0),
+    "gpt-4.1-mini": (0.4, 1.6),
+    "gpt-4.1": (2.0, 8.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4o": (2.5, 10.0),
+    "o4-mini": (1.1, 4.4),
+    "deepseek-chat": (0.27, 1.1),
+    "deepseek-reasoner": (0.55, 2.19),
+    "gemini-2.5-flash": (0.3, 2.5),
+    "gemini-2.5-pro": (1.25, 10.0),
+    "llama-3.1-8b-instant": (0.05, 0.08),
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+}
+FREE_PROVIDERS = {"ollama"}
+
+
+def token_counts(usage):
+    """(input, output) tokens from an Anthropic- or OpenAI-style usage dict."""
+    usage = usage or {}
+    tin = usage.get("input_tokens", usage.get("prompt_tokens", 0)) or 0
+    tout = usage.get("output_tokens", usage.get("completion_tokens", 0)) or 0
+    return int(tin), int(tout)
+
+
+def cost(provider, model, tin, tout, prices=None):
+    """Estimated USD, or None when the model's price is unknown."""
+    if provider in FREE_PROVIDERS:
+        return 0.0
+    table = {**PRICES, **(prices or {})}
+    for prefix in sorted(table, key=len, reverse=True):
+        if model.startswith(prefix):
+            pin, pout = table[prefix]
+            return (tin * pin + tout * pout) / 1_000_000
+    return None
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+class TurnMetrics:
+    """Timing spans, LLM calls and tool calls for one gateway turn."""
+
+    def __init__(self, conv_id, provider, model, stream=False, prices=None):
+        self.conv_id = conv_id
+        self.provider = provider
+        self.model = model
+        self.stream = stream
+        self.prices = prices
+        self.started = time.time()
+        self._t0 = time.monotonic()
+        self.spans = {}
+        self.llm_calls = []
+        self.tool_calls = []
+        # Input tokens not sent because compaction elided old tool output
+        self.elided_tokens = 0
+        self.error = None
+
+    def add(self, name, started):
+        """Add the time since started (time.monotonic()) to span name."""
+        self.spans[name] = self.spans.get(name, 0.0) + (time.monotonic() - started) * 1000
+
+    @contextmanager
+    def span(self, name):
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, t0)
+
+    def llm(self, started, usage, first_token=None, cached=False, route=None, throttle=None):
+        """Record one LLM call. started/first_token are time.monotonic() values;
+        route is the Router's tag (provider, model, tier...) if one is in use;
+        throttle is the rate limiter's wait_ms/retries for the call."""
+        now = time.monotonic()
+        tin, tout = token_counts(usage)
+        gen = now - (first_token or started)
+        call = {
+            "ms": round((now - started) * 1000, 1),
+            "in": tin,
+            "out": tout,
+            "tok_s": round(tout / gen, 1) if tout and gen > 0 else None,
+            "cached": cached,
+        }
+        if first_token:
+            call["ttft_ms"] = round((first_token - started) * 1000, 1)
+        if route:
+            call["route"] = route
+        if throttle:
+            call.update(throttle)
+        self.llm_calls.append(call)
+
+    def tool(self, name, started, result, cached=False, usage=None):
+        """usage is the CPU time and peak RSS of processes the call ran."""
+        entry = {
+            "name": name,
+            "ms": round((time.monotonic() - started) * 1000, 1),
+            "ok": not (isinstance(result, str) and result.startswith("Error")),
+            "cached": cached,
+        }
+        if usage:
+            entry.update(usage)
+        m = re.search(r"\[exit code: (-?\d+)\]\s*$", result) if isinstance(result, str) else None
+        if m:
+            entry["exit"] = int(m.group(1))
+            entry["ok"] = entry["ok"] and entry["exit"] == 0
+        self.tool_calls.append(entry)
+
+    def record(self):
+        # Bill every call that reached a provider, including fast-model
+        # answers the router threw away before escalating
+        billed = []
+        for c in self.llm_calls:
+            route = c.get("route", {})
+            if not c["cached"]:
+                billed.append((route.get("provider", self.provider), route.get("model", self.model), c["in"], c["out"]))
+            w = route.get("wasted")
+            if w and "model" in w:
+                billed.append((w["provider"], w["model"], w.get("in", 0), w.get("out", 0)))
+        tin = sum(b[2] for b in billed)
+        tout = sum(b[3] for b in billed)
+        usd = 0.0
+        for provider, model, i, o in billed:
+            call_usd = cost(provider, model, i, o, self.prices)
+            usd = None if usd is None or call_usd is None else usd + call_usd
+        return {
+            "ts": round(self.started, 3),
+            "conv_id": self.conv_id,
+            "provider": self.provider,
+            "model": self.model,
+            "stream": self.stream,
+            "ms": round((time.monotonic() - self._t0) * 1000, 1),
+            "spans": {k: round(v, 1) for k, v in self.spans.items()},
+            "llm": self.llm_calls,
+            "tools": self.tool_calls,
+            "tokens_in": tin,
+            "tokens_out": tout,
+            "elided_tokens": self.elided_tokens,
+            "cost": round(usd, 6) if usd is not None else None,
+            "error": self.error,
+        }
+
+
+class MetricsLog:
+    """Rolling JSONL file of per-turn records."""
+
+    def __init__(self, config):
+        self.enabled = config.get("metrics.enabled", True)
+        self.prices = config.get("metrics.prices") or {}
+        self.log = JSONLLog(
+            Path(config.get("metrics.path", str(METRICS_PATH))).expanduser(),
+            config.get("metrics.max_entries", 5000),
+        )
+
+    def turn(self, conv_id, provider, model, stream=False):
+        return TurnMetrics(conv_id, provider, model, stream, self.prices)
+
+    def save(self, tm):
+        if not self.enabled:
+            return
+        self.log.path.parent.mkdir(parents=True, exist_ok=True)
+        self.log.append(tm.record())
+
+    def tail(self, n=500):
+        return self.log.tail(n)
+
+
+def summarize(records, prices=None):
+    """p50/p95 breakdown of a list of turn records. prices (metrics.prices)
+    extends the built-in table for the router's savings estimate."""
+    def dist(values):
+        values = [v for v in values if v is not None]
+        return {"n": len(values), "p50": percentile(values, 50), "p95": percentile(values, 95)}
+
+    llm = [c for r in records for c in r.get("llm", [])]
+    fresh = [c for c in llm if not c.get("cached")]
+    tools = {}
+    for r in records:
+        for t in r.get("tools", []):
+            tools.setdefault(t["name"], []).append(t)
+    spans = {}
+    for r in records:
+        for k, v in r.get("spans", {}).items():
+            spans.setdefault(k, []).append(v)
+    usage = {}
+    for r in records:
+        u = usage.setdefault(f"{r['provider']}/{r['model']}", {"turns": 0, "in": 0, "out": 0, "cost": 0.0, "priced": True})
+        u["turns"] += 1
+        u["in"] += r.get("tokens_in", 0)
+        u["out"] += r.get("tokens_out", 0)
+        if r.get("cost") is None:
+            u["priced"] = False
+        else:
+            u["cost"] += r["cost"]
+    return {
+        "router": _router_summary(records, prices),
+        "turns": len(records),
+        "errors": sum(1 for r in records if r.get("error")),
+        "turn_ms": dist([r["ms"] for r in records]),
+        "spans": {k: dist(v) for k, v in spans.items()},
+        "llm_ms": dist([c["ms"] for c in fresh]),
+        "ttft_ms": dist([c.get("ttft_ms") for c in fresh]),
+        "tok_s": dist([c.get("tok_s") for c in fresh]),
+        "llm_cached": len(llm) - len(fresh),
+        "elided_tokens": dist([r["elided_tokens"] for r in records if r.get("elided_tokens")]),
+        "throttle": {
+            "calls": sum(1 for c in fresh if c.get("wait_ms") or c.get("retries")),
+            "retries": sum(c.get("retries", 0) for c in fresh),
+            "wait_ms": dist([c.get("wait_ms") for c in fresh]),
+        },
+        "tools": {
+            name: {**dist([c["ms"] for c in calls]), "failed": sum(1 for c in calls if not c["ok"]),
+                   "cached": sum(1 for c in calls if c.get("cached")),
+                   "cpu_s": round(sum(c.get("cpu_s", 0) for c in calls), 3),
+                   "rss_mb": max((c["rss_mb"] for c in calls if "rss_mb" in c), default=None)}
+            for name, calls in tools.items()
+        },
+        "usage": usage,
+    }
+
+
+def _router_summary(records, prices=None):
+    """Calls per tier and estimated savings, or None if no routing was seen."""
+    routed = [(r, c) for r in records for c in r.get("llm", []) if c.get("route")]
+    if not routed:
+        return None
+    primary_ms = [c["ms"] for _, c in routed if c["route"]["tier"] == "primary" and not c.get("cached")]
+    typical = percentile(primary_ms, 50) if primary_ms else None
+    out = {"fast": 0, "primary": 0, "escalations": {}, "offloaded_tokens": 0, "saved_ms": 0.0, "saved_usd": 0.0}
+    for r, c in routed:
+        route = c["route"]
+        out[route["tier"]] += 1
+        if route["tier"] == "fast":
+            out["offloaded_tokens"] += c["in"] + c["out"]
+            if typical is not None:
+                out["saved_ms"] += typical - c["ms"]
+            primary_usd = cost(r["provider"], r["model"], c["in"], c["out"], prices)
+            fast_usd = cost(route["provider"], route["model"], c["in"], c["out"], prices)
+            if primary_usd is not None and fast_usd is not None:
+                out["saved_usd"] += primary_usd - fast_usd
+        if route.get("reason"):
+            out["escalations"][route["reason"]] = out["escalations"].get(route["reason"], 0) + 1
+        w = route.get("wasted")
+        if w:
+            out["saved_ms"] -= w.get("ms", 0)
+            out["saved_usd"] -= cost(w["provider"], w["model"], w.get("in", 0), w.get("out", 0), prices) or 0.0
+    out["saved_ms"] = round(out["saved_ms"], 1)
+    out["saved_usd"] = round(out["saved_usd"], 6)
+    return out
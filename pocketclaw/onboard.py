@@ -175,11 +175,9 @@ def _save_identity(name, vibe):
 
 
 def _save_facts(name):
-    import json
-    facts_path = POCKETCLAW_DIR / "memory" / "facts.json"
-    facts_path.parent.mkdir(parents=True, exist_ok=True)
-    facts = {}
-    if facts_path.exists():
-        facts = json.loads(facts_path.read_text(encoding='utf-8'))
-    facts["user_name"] = name
-    facts_path.write_text(json.dumps(facts, indent=2), encoding='utf-8')
+    from .facts import FactStore
+    mem_dir = POCKETCLAW_DIR / "memory"
+    mem_dir.mkdir(parents=True, exist_ok=True)
+    store = FactStore(mem_dir / "facts.db", legacy_json=mem_dir / "facts.json")
+    store.set("user_name", name)
+    store.close()
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import re
+import shlex
+import time
+from .jsonpath import JSONPathError, json_path
+from .macros import succeeded
+
+MAX_STEPS = 20
+# max_chars a step asks http_request for when later steps use its output,
+# so a JSON body isn't cut off before it's parsed
+PIPED_CHARS = 1 << 20
+# Arguments that are code: outputs go in only through a quoting filter
+CODE_ARGS = {"run_shell": ("command", "shell"), "run_python": ("code", "py")}
+
+# {{id}}, {{id | json: $.path}} or {{id | re: pattern}}, optionally
+# followed by | shell or | py to quote the value for a command or code
+_REF = re.compile(r"\{\{\s*([A-Za-z_][\w-]*)\s*(?:\|\s*(json|re)\s*:\s*(.*?))?\s*"
+                  r"(?:\|\s*(shell|py)\s*)?\}\}", re.DOTALL)
+_QUOTE = {"shell": shlex.quote, "py": repr}
+_STATUS = re.compile(r"\AHTTP (\d{3})\n")
+_EXIT_OK = re.compile(r"\s*\[exit code: 0\]\s*\Z")
+
+
+class PipelineError(Exception):
+    pass
+
+
+def payload(result):
+    """A tool result as data: without http_request's status line or
+    run_shell's trailing exit code."""
+    return _EXIT_OK.sub("", _STATUS.sub("", result, count=1))
+
+
+def _extract(output, kind, spec):
+    if kind is None:
+        return output
+    if kind == "json":
+        try:
+            data = json.loads(output)
+        except ValueError:
+            raise PipelineError("output is not JSON")
+        try:
+            value = json_path(data, spec)
+        except JSONPathError as e:
+            raise PipelineError(str(e))
+        return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    m = re.search(spec, output)
+    if not m:
+        raise PipelineError(f"/{spec}/ matched nothing")
+    return m.group(1) if m.groups() else m.group(0)
+
+
+def _refs(value):
+    if isinstance(value, str):
+        return {m.group(1) for m in _REF.finditer(value)}
+    if isinstance(value, dict):
+        return set().union(*map(_refs, value.values())) if value else set()
+    if isinstance(value, list):
+        return set().union(*map(_refs, value)) if value else set()
+    return set()
+
+
+def _fill(value, outputs):
+    if isinstance(value, str):
+        def sub(m):
+            try:
+                value = _extract(outputs[m.group(1)], m.group(2), m.group(3))
+                return _QUOTE[m.group(4)](value) if m.group(4) else value
+            except PipelineError as e:
+                raise PipelineError(f"{{{{{m.group(1)}}}}}: {e}")
+        return _REF.sub(sub, value)
+    if isinstance(value, dict):
+        return {k: _fill(v, outputs) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_fill(v, outputs) for v in value]
+    return value
+
+
+class Pipeline:
+    """A small DAG of tool calls run without the LLM.
+
+    Each step is {"id", "tool", "args"}; string args may reference earlier
+    outputs as {{id}}, {{id | json: $.path}} or {{id | re: pattern}}. In a
+    run_shell command or run_python code a reference must end in | shell
+    or | py, which quotes the value as a shell word or a Python literal.
+    Steps start as soon as the steps they reference have finished, so
+    independent branches run in parallel. A failed step skips everything
+    that depends on it. Only the output steps (default: those nothing
+    depends on) are returned.
+    """
+
+    def __init__(self, steps, output=None, forbidden=()):
+        if not isinstance(steps, list) or not steps:
+            raise PipelineError("steps must be a non-empty list")
+        if len(steps) > MAX_STEPS:
+            raise PipelineError(f"at most {MAX_STEPS} steps")
+        self.steps = {}
+        for i, step in enumerate(steps):
+            if not isinstance(step, dict) or "tool" not in step:
+                raise PipelineError(f"step {i + 1} needs a tool")
+            sid = str(step.get("id") or f"step{i + 1}")
+            if sid in self.steps:
+                raise PipelineError(f"duplicate step id {sid!r}")
+            if step["tool"] in forbidden:
+                raise PipelineError(f"{step['tool']} can't run inside a pipeline")
+            self.steps[sid] = {"tool": step["tool"], "args": step.get("args") or {}}
+            if step["tool"] in CODE_ARGS:
+                arg, quote = CODE_ARGS[step["tool"]]
+                code = self.steps[sid]["args"].get(arg)
+                if isinstance(code, str) and any(m.group(4) != quote for m in _REF.finditer(code)):
+                    raise PipelineError(f"step {sid!r}: outputs in {step['tool']} {arg} need | {quote}, "
+                                        f"e.g. {{{{id | {quote}}}}}")
+        self.deps = {sid: _refs(s["args"]) for sid, s in self.steps.items()}
+        for sid, deps in self.deps.items():
+            unknown = deps - self.steps.keys()
+            if unknown:
+                raise PipelineError(f"step {sid!r} references unknown step {sorted(unknown)[0]!r}")
+        self._check_acyclic()
+        needed = set().union(*self.deps.values())
+        for sid in needed:
+            if self.steps[sid]["tool"] == "http_request":
+                self.steps[sid]["args"] = {"max_chars": PIPED_CHARS, **self.steps[sid]["args"]}
+        self.output = list(output) if output else [sid for sid in self.steps if sid not in needed]
+        if any(o not in self.steps for o in self.output):
+            raise PipelineError("output names an unknown step")
+
+    def _check_acyclic(self):
+        state = {}
+
+        def visit(sid, path):
+            if state.get(sid) == "done":
+                return
+            if state.get(sid) == "active":
+                raise PipelineError(f"cycle: {' -> '.join(path + [sid])}")
+            state[sid] = "active"
+            for dep in self.deps[sid]:
+                visit(dep, path + [sid])
+            state[sid] = "done"
+
+        for sid in self.steps:
+            visit(sid, [])
+
+    async def run(self, call):
+        """call(tool, args) -> result runs one tool. Returns the report."""
+        t0 = time.monotonic()
+        outputs, errors = {}, {}
+        done = {sid: asyncio.get_running_loop().create_future() for sid in self.steps}
+
+        async def run_step(sid):
+            try:
+                for dep in self.deps[sid]:
+                    if not await done[dep]:
+                        errors[sid] = f"skipped: {dep} failed"
+                        return
+                try:
+                    args = _fill(self.steps[sid]["args"], outputs)
+                except PipelineError as e:
+                    errors[sid] = f"Error: {e}"
+                    return
+                result = await call(self.steps[sid]["tool"], args)
+                status = _STATUS.match(result) if isinstance(result, str) else None
+                if not succeeded(result) or (status and int(status.group(1)) >= 400):
+                    errors[sid] = result
+                    return
+                outputs[sid] = payload(result) if isinstance(result, str) else json.dumps(result)
+            finally:
+                done[sid].set_result(sid in outputs)
+
+        await asyncio.gather(*(run_step(sid) for sid in self.steps))
+        ok, skipped = len(outputs), sum(1 for e in errors.values() if e.startswith("skipped"))
+        lines = [f"Pipeline: {ok}/{len(self.steps)} steps ok"
+                 + (f", {len(errors) - skipped} failed" if len(errors) > skipped else "")
+                 + (f", {skipped} skipped" if skipped else "")
+                 + f" ({time.monotonic() - t0:.1f}s)"]
+        for sid in self.steps:
+            if sid in errors and not errors[sid].startswith("skipped"):
+                lines.append(f"[{sid}] {errors[sid]}")
+            elif sid in self.output:
+                lines.append(f"[{sid}]\n{outputs[sid]}" if sid in outputs else f"[{sid}] {errors[sid]}")
+        text = "\n".join(lines)
+        return f"Error: {text}" if errors else text
@@ -0,0 +1,241 @@
+import asyncio
+import json
+import random
+import re
+import time
+from datetime import datetime
+
+# Statuses that mean "slow down", not "this request is bad"
+RETRY_STATUS = (429, 503, 529)
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def _seconds(value, now=None):
+    """Seconds until a reset given as a number, an OpenAI-style duration
+    ("6m0s", "20ms") or an RFC 3339 timestamp (Anthropic). None if unreadable."""
+    if value is None:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = _DURATION.findall(value)
+    if parts and "".join(n + u for n, u in parts) == value:
+        return sum(float(n) * _UNITS[u] for n, u in parts)
+    try:
+        ts = datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+    return max(0.0, ts - (now or time.time()))
+
+
+def parse_headers(headers):
+    """{"requests" | "tokens": (limit, remaining, reset_s)} from Anthropic
+    (anthropic-ratelimit-*) or OpenAI-style (x-ratelimit-*) headers."""
+    out = {}
+    for kind, anth in (("requests", ("requests",)), ("tokens", ("input-tokens", "tokens"))):
+        for name in anth:
+            limit = headers.get(f"anthropic-ratelimit-{name}-limit")
+            if limit is not None:
+                out[kind] = (limit, headers.get(f"anthropic-ratelimit-{name}-remaining"),
+                             headers.get(f"anthropic-ratelimit-{name}-reset"))
+                break
+        else:
+            limit = headers.get(f"x-ratelimit-limit-{kind}")
+            if limit is not None:
+                out[kind] = (limit, headers.get(f"x-ratelimit-remaining-{kind}"),
+                             headers.get(f"x-ratelimit-reset-{kind}"))
+    parsed = {}
+    for kind, (limit, remaining, reset) in out.items():
+        try:
+            parsed[kind] = (int(limit), int(remaining), _seconds(reset))
+        except (TypeError, ValueError):
+            continue
+    return parsed
+
+
+class Bucket:
+    """Token bucket. Unknown until configured or seen in response headers;
+    an unknown bucket never makes anyone wait."""
+
+    def __init__(self, per_minute=0):
+        self.capacity = per_minute or None
+        self.rate = per_minute / 60 if per_minute else None
+        self.level = float(per_minute)
+        self.stamp = time.monotonic()
+
+    def _refill(self, now):
+        if self.capacity:
+            self.level = min(self.capacity, self.level + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait(self, amount, now):
+        """Seconds until amount is available."""
+        self._refill(now)
+        if not self.capacity:
+            return 0.0
+        # A request bigger than the whole bucket goes once it's full
+        short = min(amount, self.capacity) - self.level
+        return short / self.rate if short > 0 else 0.0
+
+    def take(self, amount):
+        if self.capacity:
+            self.level -= amount
+
+    def sync(self, limit, remaining, reset, pending, now):
+        """Adopt the provider's view. remaining was measured before our other
+        in-flight requests (pending) were counted, so subtract them."""
+        self._refill(now)
+        self.capacity = limit
+        if reset and limit > remaining:
+            self.rate = (limit - remaining) / reset
+        elif not self.rate:
+            self.rate = limit / 60
+        self.level = min(float(limit), remaining - pending)
+
+
+class Ticket:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.started = time.monotonic()
+        self.waited = 0.0
+        self.retries = 0
+
+
+class RateLimiter:
+    """Client-side limits for one provider/model.
+
+    Requests pass a request bucket, a token bucket (costed up front from the
+    request size) and an AIMD concurrency window: the window grows by about
+    one slot per window's worth of successes and halves on a 429. Buckets
+    follow the provider's rate-limit headers. A 429 holds every caller
+    until the reset the provider names, so retries don't pile up.
+    """
+
+    def __init__(self, max_concurrency=8, min_concurrency=1, rpm=0, tpm=0, max_retries=5, max_wait=60):
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.window = float(self.max_concurrency)
+        self.requests = Bucket(rpm)
+        self.tokens = Bucket(tpm)
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self.inflight = 0
+        self.queued = 0
+        self.pending_tokens = 0
+        self.blocked_until = 0.0
+        self.last_cut = 0.0
+        self.throttled = 0
+        self.waited = 0.0
+        self._changed = asyncio.Event()
+
+    @classmethod
+    def from_config(cls, cfg):
+        if not cfg.get("enabled", True):
+            return None
+        return cls(
+            max_concurrency=cfg.get("max_concurrency", 8),
+            min_concurrency=cfg.get("min_concurrency", 1),
+            rpm=cfg.get("rpm", 0),
+            tpm=cfg.get("tpm", 0),
+            max_retries=cfg.get("max_retries", 5),
+            max_wait=cfg.get("max_wait", 60),
+        )
+
+    @staticmethod
+    def estimate(body, with_output=False):
+        """Rough token cost of a request: ~4 characters per input token, plus
+        max_tokens for providers that count output against the same budget."""
+        tokens = len(json.dumps(body, ensure_ascii=False, default=str)) // 4
+        return tokens + (body.get("max_tokens", 0) if with_output else 0)
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _delay(self, tokens):
+        now = time.monotonic()
+        return max(self.blocked_until - now, self.requests.wait(1, now), self.tokens.wait(tokens, now))
+
+    async def acquire(self, ticket):
+        t0 = time.monotonic()
+        self.queued += 1
+        try:
+            while True:
+                delay = self._delay(ticket.tokens)
+                if delay <= 0 and self.inflight < int(self.window):
+                    break
+                changed = self._changed
+                try:
+                    await asyncio.wait_for(changed.wait(), delay if delay > 0 else None)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self.queued -= 1
+        self.requests.take(1)
+        self.tokens.take(ticket.tokens)
+        self.inflight += 1
+        self.pending_tokens += ticket.tokens
+        ticket.started = time.monotonic()
+        ticket.waited += ticket.started - t0
+        self.waited += ticket.started - t0
+        return ticket
+
+    def release(self, ticket):
+        self.inflight -= 1
+        self.pending_tokens -= ticket.tokens
+        self._notify()
+
+    def update(self, ticket, headers, ok=True):
+        """A response that wasn't throttled: sync buckets, and grow the
+        window if it succeeded."""
+        self._sync(ticket, headers)
+        if ok:
+            self.window = min(self.max_concurrency, self.window + 1 / self.window)
+
+    def throttle(self, ticket, headers):
+        """A 429/overloaded response: shrink the window (once per wave of
+        requests) and hold everyone until the provider's reset."""
+        self.throttled += 1
+        ticket.retries += 1
+        now = time.monotonic()
+        if ticket.started >= self.last_cut:
+            self.window = max(self.min_concurrency, self.window / 2)
+            self.last_cut = now
+        self._sync(ticket, headers)
+        delay = _seconds(headers.get("retry-after"))
+        if delay is None:
+            resets = [v[2] for v in parse_headers(headers).values() if v[1] <= 0 and v[2]]
+            delay = max(resets) if resets else min(self.max_wait, 2 ** (ticket.retries - 1))
+        delay = min(self.max_wait, delay) * random.uniform(1.0, 1.2)
+        self.blocked_until = max(self.blocked_until, now + delay)
+        return delay
+
+    def _sync(self, ticket, headers):
+        now = time.monotonic()
+        limits = parse_headers(headers)
+        if "requests" in limits:
+            self.requests.sync(*limits["requests"], self.inflight - 1, now)
+        if "tokens" in limits:
+            self.tokens.sync(*limits["tokens"], self.pending_tokens - ticket.tokens, now)
+
+    def stats(self):
+        now = time.monotonic()
+
+        def bucket(b):
+            b._refill(now)
+            return {"limit": b.capacity, "remaining": round(b.level)} if b.capacity else None
+
+        return {
+            "concurrency": round(self.window, 2),
+            "inflight": self.inflight,
+            "queued": self.queued,
+            "requests": bucket(self.requests),
+            "tokens": bucket(self.tokens),
+            "blocked_s": round(max(0.0, self.blocked_until - now), 1),
+            "throttled": self.throttled,
+            "waited_s": round(self.waited, 1),
+        }
@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import re
+import time
+from .llm import LLMConnector
+from .metrics import cost, token_counts
+
+log = logging.getLogger(__name__)
+
+_EXIT = re.compile(r"\[exit code: (-?\d+)\]\s*$")
+
+
+def _tool_failed(content):
+    content = content if isinstance(content, str) else str(content)
+    m = _EXIT.search(content)
+    return content.startswith("Error") or bool(m and m.group(1) != "0")
+
+
+class Router:
+    """Model cascade in front of two LLMConnectors.
+
+    Tool-selection steps go to the fast model. A step is escalated to the
+    primary model when the fast model fails, names an unknown tool or
+    leaves out required arguments (low confidence), when the previous
+    tool call failed, or when it produces the final user-facing reply
+    (unless final_reply is "fast"). Exposes the LLMConnector interface, so
+    the gateway doesn't know it's there.
+    """
+
+    def __init__(self, config):
+        llm = config.get("llm")
+        rc = config.get("llm.router", {})
+        self.primary = LLMConnector(llm)
+        fast = rc.get("fast") or {}
+        fast_provider = fast.get("provider", self.primary.provider)
+        fast_cfg = {
+            "provider": fast_provider,
+            "model": fast.get("model", self.primary.model),
+            "api_key": fast.get("api_key") or (self.primary.api_key if fast_provider == self.primary.provider else ""),
+            "max_tokens": llm.get("max_tokens", 4096),
+            "temperature": llm.get("temperature", 0.3),
+            "cache": llm.get("cache") or {},
+            "stream_usage": llm.get("stream_usage", True),
+            "rate_limit": llm.get("rate_limit") or {},
+        }
+        if fast.get("base_url"):
+            fast_cfg["base_url"] = fast["base_url"]
+        self.fast = LLMConnector(fast_cfg)
+        self.first_step = rc.get("first_step", "fast")
+        self.final_reply = rc.get("final_reply", "primary")
+        self.escalate_on_tool_error = rc.get("escalate_on_tool_error", True)
+        self.prices = config.get("metrics.prices") or {}
+        self.primary_ms = None  # moving average of primary call latency
+        self.counts = {"fast": 0, "primary": 0}
+        self.escalations = {}
+        self.saved_ms = 0.0
+        self.saved_usd = 0.0
+
+    @property
+    def provider(self):
+        return self.primary.provider
+
+    @property
+    def model(self):
+        return self.primary.model
+
+    # -- Policy ------------------------------------------------
+
+    def _route(self, messages):
+        """('fast' | 'primary', reason) for the next call."""
+        last = messages[-1] if messages else {}
+        content = last.get("content")
+        if last.get("role") == "user" and isinstance(content, list):
+            results = [b for b in content if b.get("type") == "tool_result"]
+            if self.escalate_on_tool_error and any(_tool_failed(b.get("content", "")) for b in results):
+                return "primary", "tool_error"
+            return "fast", None
+        return ("fast", None) if self.first_step == "fast" else ("primary", None)
+
+    def _accept(self, resp, tools):
+        """None if the fast model's answer can be used, else the reason."""
+        if not resp.tool_calls:
+            return None if self.final_reply == "fast" and resp.text else "final_reply"
+        defs = {t["name"]: t for t in tools or []}
+        for tc in resp.tool_calls:
+            if tc.name not in defs:
+                return "low_confidence"
+            required = [k for k, v in defs[tc.name].get("parameters", {}).items() if v.get("required")]
+            if not isinstance(tc.arguments, dict) or any(k not in tc.arguments for k in required):
+                return "low_confidence"
+        return None
+
+    # -- Accounting --------------------------------------------
+
+    def _cost(self, connector, usage):
+        return cost(connector.provider, connector.model, *token_counts(usage), self.prices)
+
+    def _fast_done(self, resp, ms):
+        self.counts["fast"] += 1
+        if self.primary_ms is not None:
+            self.saved_ms += self.primary_ms - ms
+        fast_usd, primary_usd = self._cost(self.fast, resp.usage), self._cost(self.primary, resp.usage)
+        if fast_usd is not None and primary_usd is not None:
+            self.saved_usd += primary_usd - fast_usd
+
+    def _wasted(self, reason, ms, usage):
+        self.escalations[reason] = self.escalations.get(reason, 0) + 1
+        self.saved_ms -= ms
+        self.saved_usd -= self._cost(self.fast, usage) or 0.0
+
+    def _primary_done(self, ms):
+        self.counts["primary"] += 1
+        self.primary_ms = ms if self.primary_ms is None else 0.8 * self.primary_ms + 0.2 * ms
+
+    def _tag(self, connector, tier, reason=None, wasted=None):
+        route = {"provider": connector.provider, "model": connector.model, "tier": tier}
+        if reason:
+            route["reason"] = reason
+        if wasted:
+            route["wasted"] = wasted
+        return route
+
+    # -- LLMConnector interface --------------------------------
+
+    async def _try_fast(self, system, messages, tools, cache):
+        """(response, None) if the fast model's answer stands, else
+        (None, (reason, wasted)) to escalate."""
+        t0 = time.monotonic()
+        try:
+            resp = await self.fast.chat(system, messages, tools, cache=cache)
+        except Exception as e:
+            log.warning(f"Fast model failed, escalating: {e}")
+            ms = (time.monotonic() - t0) * 1000
+            self._wasted("fast_error", ms, {})
+            return None, ("fast_error", {"ms": round(ms, 1), "provider": self.fast.provider, "model": self.fast.model})
+        ms = (time.monotonic() - t0) * 1000
+        reason = self._accept(resp, tools)
+        if reason is None:
+            self._fast_done(resp, ms)
+            resp.route = self._tag(self.fast, "fast")
+            return resp, None
+        usage = {} if resp.cached else resp.usage
+        self._wasted(reason, ms, usage)
+        tin, tout = token_counts(usage)
+        return None, (reason, {"ms": round(ms, 1), "provider": self.fast.provider,
+                               "model": self.fast.model, "in": tin, "out": tout})
+
+    async def chat(self, system, messages, tools=None, cache=True):
+        tier, reason = self._route(messages)
+        wasted = None
+        if tier == "fast":
+            resp, escalation = await self._try_fast(system, messages, tools, cache)
+            if resp:
+                return resp
+            reason, wasted = escalation
+        t0 = time.monotonic()
+        resp = await self.primary.chat(system, messages, tools, cache=cache)
+        self._primary_done((time.monotonic() - t0) * 1000)
+        resp.route = self._tag(self.primary, "primary", reason, wasted)
+        return resp
+
+    async def chat_stream(self, system, messages, tools=None, cache=True):
+        tier, reason = self._route(messages)
+        wasted = None
+        if tier == "fast":
+            # The fast model's answer is buffered: it may still be thrown
+            # away, so none of it can reach the user until it's accepted
+            resp, escalation = await self._try_fast(system, messages, tools, cache)
+            if resp:
+                if resp.text:
+                    yield {"type": "text", "text": resp.text}
+                if resp.tool_calls:
+                    yield {"type": "tool_calls", "tool_calls": resp.tool_calls}
+                yield {"type": "done", "text": resp.text or "", "usage": resp.usage,
+                       "cached": resp.cached, "route": resp.route, "throttle": resp.throttle}
+                return
+            reason, wasted = escalation
+        t0 = time.monotonic()
+        async for chunk in self.primary.chat_stream(system, messages, tools, cache=cache):
+            if chunk["type"] == "done":
+                self._primary_done((time.monotonic() - t0) * 1000)
+                chunk = {**chunk, "route": self._tag(self.primary, "primary", reason, wasted)}
+            yield chunk
+
+    def stats(self):
+        return {
+            "fast_model": f"{self.fast.provider}/{self.fast.model}",
+            "fast_calls": self.counts["fast"],
+            "primary_calls": self.counts["primary"],
+            "escalations": dict(self.escalations),
+            "saved_ms": round(self.saved_ms, 1),
+            "saved_usd": round(self.saved_usd, 6),
+        }
+
+    async def preconnect(self):
+        await asyncio.gather(self.fast.preconnect(), self.primary.preconnect())
+
+    def rate_limits(self):
+        return {**self.fast.rate_limits(), **self.primary.rate_limits()}
+
+    async def close(self):
+        await self.fast.close()
+        await self.primary.close()
@@ -0,0 +1,108 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+
+# Lower number = served first when LLM slots are contended
+LANES = {"interactive": 0, "normal": 1, "background": 2}
+
+
+class Scheduler:
+    """Per-conversation turn locks plus a bounded, priority-laned pool of
+    LLM call slots.
+
+    A turn holds its conversation's lock from load to save, so concurrent
+    requests on one conv_id run one after another instead of overwriting
+    each other. LLM calls across all conversations share max_concurrent
+    slots; waiters are served by lane, FIFO within a lane.
+    """
+
+    def __init__(self, max_concurrent=4):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self._active = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._convs = {}
+        self._queued = {lane: 0 for lane in LANES}
+        self.completed = 0
+        self.cancelled = 0
+        self.wait_time = 0.0
+
+    # -- Conversations -----------------------------------------
+
+    @asynccontextmanager
+    async def turn(self, conv_id):
+        entry = self._convs.setdefault(conv_id, {"lock": asyncio.Lock(), "tasks": set()})
+        task = asyncio.current_task()
+        entry["tasks"].add(task)
+        try:
+            async with entry["lock"]:
+                yield
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            entry["tasks"].discard(task)
+            if not entry["tasks"]:
+                self._convs.pop(conv_id, None)
+
+    def cancel(self, conv_id):
+        """Cancel every running or queued turn on conv_id. Returns the count."""
+        entry = self._convs.get(conv_id)
+        if not entry:
+            return 0
+        for task in entry["tasks"]:
+            task.cancel()
+        return len(entry["tasks"])
+
+    # -- LLM slots ---------------------------------------------
+
+    @asynccontextmanager
+    async def slot(self, priority="normal"):
+        lane = priority if priority in LANES else "normal"
+        t0 = time.monotonic()
+        if self._active < self.max_concurrent and not self._waiters:
+            self._active += 1
+        else:
+            fut = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (LANES[lane], next(self._seq), fut))
+            self._queued[lane] += 1
+            try:
+                await fut  # _release hands its slot over by resolving this
+            except asyncio.CancelledError:
+                if fut.done() and not fut.cancelled():
+                    self._release()
+                raise
+            finally:
+                self._queued[lane] -= 1
+        self.wait_time += time.monotonic() - t0
+        try:
+            yield
+        finally:
+            self.completed += 1
+            self._release()
+
+    def _release(self):
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._active -= 1
+
+    def metrics(self):
+        waiting_turns = sum(
+            len(e["tasks"]) - (1 if e["lock"].locked() else 0) for e in self._convs.values()
+        )
+        return {
+            "active": self._active,
+            "max_concurrent": self.max_concurrent,
+            "queued": sum(self._queued.values()),
+            "queued_by_lane": dict(self._queued),
+            "conversations": len(self._convs),
+            "waiting_turns": waiting_turns,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "avg_wait": round(self.wait_time / self.completed, 3) if self.completed else 0.0,
+        }
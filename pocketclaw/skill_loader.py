@@ -66,6 +66,8 @@ class SkillLoader:
                             "description": v.get("description", ""),
                             "required": v.get("required", False),
                         }
+                        # Nested schemas (array items, object fields) as written
+                        params[k].update((key, v[key]) for key in ("items", "properties") if key in v)
                 defs.append({
                     "name": tool["name"],
                     "description": tool.get("description", ""),
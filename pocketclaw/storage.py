@@ -0,0 +1,242 @@
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # not on Android/Linux
+    fcntl = None
+
+# Conversation ids end up in file names, so only these are allowed
+_CONV_ID = re.compile(r"[A-Za-z0-9._:-]{1,128}\Z")
+
+
+def check_conv_id(conv_id):
+    """conv_id if it is safe as a file name, else ValueError."""
+    if not isinstance(conv_id, str) or not _CONV_ID.match(conv_id) or ".." in conv_id:
+        raise ValueError(f"invalid conversation id {conv_id!r}: use 1-128 letters, digits, '.', '_', ':' or '-'")
+    return conv_id
+
+
+def connect_sqlite(path):
+    """Open a SQLite database tuned for several PocketClaw processes at once."""
+    db = sqlite3.connect(str(path), timeout=10, cached_statements=64)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("PRAGMA busy_timeout=10000")
+    return db
+
+
+def atomic_write(path, data):
+    """Write text to path via a temp file in the same dir + rename. data is
+    a string or an iterable of strings, written as they come; if it raises,
+    path is left as it was. Line endings are kept as given, and so is the
+    mode of an existing file."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding='utf-8', newline="") as f:
+            for piece in [data] if isinstance(data, str) else data:
+                f.write(piece)
+            f.flush()
+            os.fsync(f.fileno())
+        if path.exists():
+            shutil.copymode(path, tmp)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp, 0o666 & ~umask)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive flock on the lock file path (created if needed)."""
+    if fcntl is None:
+        yield
+        return
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as lf:
+        fcntl.flock(lf, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lf, fcntl.LOCK_UN)
+
+
+class JSONLLog:
+    """Append-only JSON-lines file, trimmed to its last max_entries.
+
+    Appends are O(1); the file is only rewritten (atomically) once it has
+    grown 10% past the limit.
+    """
+
+    def __init__(self, path, max_entries=1000):
+        self.path = Path(path)
+        self.max_entries = max(1, int(max_entries))
+        self._count = None
+
+    def _lines(self):
+        if not self.path.exists():
+            return []
+        return self.path.read_text(encoding='utf-8').splitlines()
+
+    def append(self, *entries):
+        with open(self.path, "a", encoding='utf-8') as f:
+            for e in entries:
+                f.write(json.dumps(e, ensure_ascii=False, default=str) + "\n")
+        if self._count is None:
+            self._count = len(self._lines())
+        else:
+            self._count += len(entries)
+        if self._count > self.max_entries * 1.1:
+            self.trim()
+
+    def trim(self):
+        lines = self._lines()[-self.max_entries:]
+        atomic_write(self.path, "".join(line + "\n" for line in lines))
+        self._count = len(lines)
+
+    def tail(self, n=20):
+        return [json.loads(line) for line in self._lines()[-n:] if line.strip()]
+
+
+class JSONBackend:
+    """One JSON file per conversation. Writes take an flock and replace the
+    file atomically, so concurrent processes never see a torn file."""
+
+    name = "json"
+
+    def __init__(self, base, max_messages=50):
+        self.dir = Path(base) / "conversations"
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.max_messages = max_messages
+
+    def _path(self, conv_id):
+        return self.dir / f"{check_conv_id(conv_id)}.json"
+
+    def _lock(self, conv_id):
+        return file_lock(self.dir / f".{check_conv_id(conv_id)}.lock")
+
+    def _read(self, conv_id):
+        path = self._path(conv_id)
+        if not path.exists():
+            return []
+        return json.loads(path.read_text(encoding='utf-8'))
+
+    def load(self, conv_id, limit=None):
+        msgs = self._read(conv_id)
+        return msgs[-limit:] if limit else msgs
+
+    def append(self, conv_id, messages):
+        if not messages:
+            return
+        with self._lock(conv_id):
+            msgs = self._read(conv_id) + list(messages)
+            if self.max_messages:
+                msgs = msgs[-self.max_messages:]
+            atomic_write(self._path(conv_id), json.dumps(msgs, indent=2, default=str))
+
+    def replace(self, conv_id, messages):
+        with self._lock(conv_id):
+            atomic_write(self._path(conv_id), json.dumps(messages, indent=2, default=str))
+
+    def list(self):
+        return sorted(p.stem for p in self.dir.glob("*.json"))
+
+    def delete(self, conv_id):
+        with self._lock(conv_id):
+            self._path(conv_id).unlink(missing_ok=True)
+        (self.dir / f".{conv_id}.lock").unlink(missing_ok=True)
+
+    def close(self):
+        pass
+
+
+class SQLiteBackend:
+    """All conversations in one WAL-mode database. A turn's new messages are
+    inserted in a single transaction; history is kept, loads read the tail."""
+
+    name = "sqlite"
+
+    def __init__(self, base, max_messages=50):
+        Path(base).mkdir(parents=True, exist_ok=True)
+        self.path = Path(base) / "memory.db"
+        self.db = connect_sqlite(self.path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "conv_id TEXT NOT NULL, seq INTEGER NOT NULL, data TEXT NOT NULL, "
+            "PRIMARY KEY (conv_id, seq)) WITHOUT ROWID"
+        )
+
+    def load(self, conv_id, limit=None):
+        rows = self.db.execute(
+            "SELECT data FROM messages WHERE conv_id = ? ORDER BY seq DESC LIMIT ?",
+            (conv_id, limit or -1),
+        ).fetchall()
+        return [json.loads(r[0]) for r in reversed(rows)]
+
+    def append(self, conv_id, messages):
+        if not messages:
+            return
+        # BEGIN IMMEDIATE takes the write lock before reading the last seq,
+        # so two writers can't pick the same sequence numbers.
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            last = self.db.execute(
+                "SELECT COALESCE(MAX(seq), -1) FROM messages WHERE conv_id = ?", (conv_id,)
+            ).fetchone()[0]
+            self.db.executemany(
+                "INSERT INTO messages (conv_id, seq, data) VALUES (?, ?, ?)",
+                [(conv_id, last + 1 + i, json.dumps(m, default=str)) for i, m in enumerate(messages)],
+            )
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+
+    def replace(self, conv_id, messages):
+        with self.db:
+            self.db.execute("DELETE FROM messages WHERE conv_id = ?", (conv_id,))
+            self.db.executemany(
+                "INSERT INTO messages (conv_id, seq, data) VALUES (?, ?, ?)",
+                [(conv_id, i, json.dumps(m, default=str)) for i, m in enumerate(messages)],
+            )
+
+    def list(self):
+        return [r[0] for r in self.db.execute("SELECT DISTINCT conv_id FROM messages ORDER BY conv_id")]
+
+    def delete(self, conv_id):
+        with self.db:
+            self.db.execute("DELETE FROM messages WHERE conv_id = ?", (conv_id,))
+
+    def close(self):
+        self.db.close()
+
+
+BACKENDS = {"json": JSONBackend, "sqlite": SQLiteBackend}
+
+
+def get_backend(name, base, max_messages=50):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown memory backend '{name}' (use: {', '.join(BACKENDS)})")
+    return BACKENDS[name](base, max_messages)
+
+
+def migrate(src, dst):
+    """Copy every conversation from one backend to another. Returns the count."""
+    n = 0
+    for conv_id in src.list():
+        dst.replace(conv_id, src.load(conv_id))
+        n += 1
+    return n
@@ -1,19 +1,95 @@
+import asyncio
 import os
+import shutil
 import signal
 import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 
 PID_FILE = Path.home() / ".pocketclaw" / "pocketclaw.pid"
 
 
+def _termux(cmd):
+    subprocess.run([cmd], capture_output=True)
+
+
+class WakeLock:
+    """termux-wake-lock held only while work is running. Holders nest; the
+    lock is dropped linger seconds after the last one leaves, so
+    back-to-back turns don't toggle it. The termux commands run off the
+    event loop."""
+
+    def __init__(self, linger=10, run=_termux):
+        self.linger = linger
+        self.run = run
+        self.enabled = shutil.which("termux-wake-lock") is not None
+        self.holders = 0
+        self.held = False
+        self.acquired = 0
+        self.held_s = 0.0
+        self._since = 0.0
+        self._drop = None
+        self._pool = ThreadPoolExecutor(1, "wake-lock")
+
+    def _command(self, cmd):
+        if self.enabled:
+            # One worker thread keeps lock/unlock in order
+            return self._pool.submit(self.run, cmd)
+
+    @contextmanager
+    def hold(self):
+        self.holders += 1
+        if self._drop:
+            self._drop.cancel()
+            self._drop = None
+        if not self.held:
+            self.held = True
+            self.acquired += 1
+            self._since = time.monotonic()
+            self._command("termux-wake-lock")
+        try:
+            yield
+        finally:
+            self.holders -= 1
+            if not self.holders:
+                try:
+                    self._drop = asyncio.get_running_loop().call_later(self.linger, self.release)
+                except RuntimeError:
+                    self.release()
+
+    def release(self, force=False):
+        """Drop the lock now, unless someone is holding it. force drops it
+        regardless and waits for termux-wake-unlock to finish."""
+        if self._drop:
+            self._drop.cancel()
+            self._drop = None
+        if force:
+            self.holders = 0
+        if self.held and not self.holders:
+            self.held = False
+            self.held_s += time.monotonic() - self._since
+            done = self._command("termux-wake-unlock")
+            if force and done:
+                done.result()
+
+    def stats(self):
+        held = self.held_s + (time.monotonic() - self._since if self.held else 0)
+        return {"held": self.held, "holders": self.holders, "acquired": self.acquired, "held_s": round(held, 1)}
+
+
+# One per process: Termux has a single wake lock, so every holder shares it
+WAKE_LOCK = WakeLock()
+
+
 class Supervisor:
     def start(self):
-        subprocess.run(["termux-wake-lock"], capture_output=True)
         PID_FILE.parent.mkdir(parents=True, exist_ok=True)
         PID_FILE.write_text(str(os.getpid()), encoding='utf-8')
 
     def stop(self):
-        subprocess.run(["termux-wake-unlock"], capture_output=True)
+        WAKE_LOCK.release(force=True)
         if PID_FILE.exists():
             PID_FILE.unlink()
 
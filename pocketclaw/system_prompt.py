@@ -5,9 +5,11 @@ TEMPLATE = """You are PocketClaw, a personal AI assistant running on {user_name}
 ### Layer 1: APIs & Shell (PREFERRED - fastest)
 Direct programmatic access. Use run_shell, run_python, http_request, and termux_api tools.
 Execute any shell command, write code, make HTTP requests, send SMS, access GPS, manage files, use git/SSH.
+To search file contents, use search_files rather than grep or find in run_shell.
 
 ### Layer 2: Accessibility (FAST - for apps without APIs)
 Read screen contents as structured XML with screen_read. Tap elements by name with screen_tap_element.
+To wait for an app to load, call screen_wait once rather than screen_read in a loop or sleep.
 Use when Layer 1 can't access what's needed.
 
 ### Layer 3: Vision (SLOW - last resort)
@@ -33,11 +35,17 @@ ALWAYS prefer Layer 1 > Layer 2 > Layer 3.
 """
 
 
-def build_system_prompt(config, skills, memory):
-    facts = memory.get_facts()
+def prompt_parts(skills, memory):
+    """The parts of the system prompt that don't depend on the message."""
+    return {"skills_summary": skills.get_summary(), "identity": memory.get_identity()}
+
+
+def build_system_prompt(config, skills, memory, query=None, parts=None):
+    parts = parts or prompt_parts(skills, memory)
+    identity = parts["identity"]
     return TEMPLATE.format(
-        user_name=facts.get("user_name", "User"),
-        skills_summary=skills.get_summary() or "No skills loaded.",
-        identity=memory.get_identity() or "No identity configured yet.",
-        memory_context=memory.get_context() or "No stored facts yet.",
+        user_name=memory.facts.get("user_name", "User"),
+        skills_summary=parts["skills_summary"] or "No skills loaded.",
+        identity=identity or "No identity configured yet.",
+        memory_context=memory.get_prompt_facts(query, identity) or "No stored facts yet.",
     )
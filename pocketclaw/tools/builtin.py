@@ -1,33 +1,41 @@
 import asyncio
+import json
+import os
+import shlex
+import shutil
 import httpx
 from pathlib import Path
+from ..storage import atomic_write
+from .cache import cacheable, invalidates
+from . import fetch, files, process
+from .search import search_files
 
 
-async def run_shell(command, timeout=30, working_dir=None):
-    proc = await asyncio.create_subprocess_shell(
-        command,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-        cwd=working_dir,
-    )
+@invalidates("*")
+async def run_shell(command, timeout=None, working_dir=None):
+    # The gateway caps every tool call at advanced.tool_timeout; timeout
+    # only asks for less
     try:
-        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+        proc = await process.run(command, shell=True, timeout=timeout and float(timeout), cwd=working_dir)
     except asyncio.TimeoutError:
-        proc.kill()
         return "Error: command timed out"
     result = ""
-    if stdout:
-        result += stdout.decode(errors="replace")
-    if stderr:
-        result += f"\nSTDERR:\n{stderr.decode(errors='replace')}"
+    if proc.stdout:
+        result += proc.stdout.decode(errors="replace")
+    if proc.stderr:
+        result += f"\nSTDERR:\n{proc.stderr.decode(errors='replace')}"
+    if proc.dropped:
+        result += f"\n[output truncated: {proc.dropped} bytes dropped]"
     result += f"\n[exit code: {proc.returncode}]"
     return result.strip()
 
 
-async def run_python(code, timeout=30):
-    return await run_shell(f"python3 -c {repr(code)}", timeout=timeout)
+@invalidates("*")
+async def run_python(code, timeout=None):
+    return await run_shell(f"python3 -c {shlex.quote(code)}", timeout=timeout)
 
 
+@cacheable("fs", path_arg="path")
 async def read_file(path, max_lines=None):
     try:
         p = Path(path).expanduser()
@@ -39,31 +47,61 @@ async def read_file(path, max_lines=None):
         return f"Error: {e}"
 
 
-async def write_file(path, content):
+@invalidates("fs", path_arg="path")
+async def write_file(path, content, mode="overwrite", piece=None, done=False):
+    # "stream" collects numbered pieces in <path>.part and moves it into
+    # place atomically on the call with done=true
     try:
         p = Path(path).expanduser()
-        p.parent.mkdir(parents=True, exist_ok=True)
-        p.write_text(content, encoding='utf-8')
-        return f"Written {len(content)} bytes to {path}"
+        if mode == "overwrite":
+            await asyncio.to_thread(atomic_write, p, content)
+            return f"Written {len(content)} bytes to {path}"
+        if mode == "append":
+            await asyncio.to_thread(_append, p, content)
+            return f"Appended {len(content)} bytes to {path}"
+        if mode != "stream":
+            return f"Error: unknown mode '{mode}'"
+        part = p.with_name(p.name + ".part")
+        if not piece or int(piece) < 1:
+            return "Error: mode 'stream' needs piece: 1 for the first piece, then 2, 3, ..."
+        if int(piece) == 1:
+            part.unlink(missing_ok=True)  # left over from an abandoned stream
+        elif not part.exists():
+            return f"Error: no stream started for {path}; send piece 1 first"
+        await asyncio.to_thread(_append, part, content)
+        if not done:
+            return f"Appended piece {piece} to {part} ({part.stat().st_size} bytes so far); finish with done=true"
+        size = part.stat().st_size
+        if p.exists():
+            shutil.copymode(p, part)  # as atomic_write does: keep e.g. +x
+        os.replace(part, p)
+        return f"Written {size} bytes to {path}"
     except Exception as e:
         return f"Error: {e}"
 
 
-async def edit_file(path, old_str, new_str):
+def _append(p, content):
+    p.parent.mkdir(parents=True, exist_ok=True)
+    with open(p, "a", encoding="utf-8", newline="") as f:
+        f.write(content)
+
+
+@invalidates("fs", path_arg="path")
+async def edit_file(path, old_str=None, new_str=None, edits=None):
     try:
-        p = Path(path).expanduser()
-        text = p.read_text(encoding='utf-8')
-        count = text.count(old_str)
-        if count == 0:
-            return "Error: old_str not found in file"
-        if count > 1:
-            return f"Error: old_str found {count} times (must be unique)"
-        p.write_text(text.replace(old_str, new_str, 1), encoding='utf-8')
-        return "File edited successfully"
+        if isinstance(edits, str):
+            edits = json.loads(edits)
+        if old_str is not None:
+            edits = [{"old_str": old_str, "new_str": new_str}] + list(edits or [])
+        if not edits:
+            return "Error: give old_str/new_str or edits"
+        await asyncio.to_thread(files.stream_edit, Path(path).expanduser(), edits)
+        return "File edited successfully" if len(edits) == 1 else f"File edited successfully ({len(edits)} edits)"
     except Exception as e:
         return f"Error: {e}"
 
 
+@cacheable("fs", path_arg="path")
 async def list_directory(path=".", recursive=False, max_depth=2):
     try:
         p = Path(path).expanduser()
@@ -86,11 +124,27 @@ async def list_directory(path=".", recursive=False, max_depth=2):
         return f"Error: {e}"
 
 
-async def http_request(method="GET", url="", headers=None, body=None, timeout=15):
+def _is_get(args):
+    return str(args.get("method", "GET")).upper() in ("GET", "HEAD")
+
+
+@cacheable("http", ttl=30, when=lambda args: _is_get(args) and not args.get("save_to"))
+@invalidates("http", "fs", path_arg="save_to", when=lambda args: not _is_get(args) or args.get("save_to"))
+async def http_request(method="GET", url="", headers=None, body=None, timeout=15, save_to=None, extract=None,
+                       max_chars=5000):
+    # The body is streamed and reading stops once max_chars are in, so a
+    # large response costs no more than the part that is returned
     try:
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            r = await client.request(method, url, headers=headers, content=body)
-            return f"HTTP {r.status_code}\n{r.text[:5000]}"
+        async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
+            if save_to:
+                return await fetch.download(client, method, url, headers, body, save_to)
+            async with client.stream(method, url, headers=headers, content=body) as r:
+                text, truncated = await fetch.read_body(r, int(max_chars), extract)
+                if truncated:
+                    length = r.headers.get("content-length")
+                    of = f" of {length} bytes" if length else ""
+                    text += f"\n[truncated at {max_chars} chars{of}; use save_to for the whole body]"
+                return f"HTTP {r.status_code}\n{text}"
     except Exception as e:
         return f"Error: {e}"
 
@@ -103,5 +157,6 @@ def get_builtin_tools(config):
         "write_file": write_file,
         "edit_file": edit_file,
         "list_directory": list_directory,
+        "search_files": search_files,
         "http_request": http_request,
     }
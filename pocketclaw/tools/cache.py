@@ -0,0 +1,100 @@
+import hashlib
+import json
+import time
+from pathlib import Path
+
+CACHED_FLAG = "[cached: identical call earlier this turn] "
+
+
+def cacheable(scope, ttl=60, path_arg=None, when=None):
+    """Mark a read-only tool whose result can be reused within a turn.
+
+    scope groups entries for invalidation ("fs", "screen", "http"). With
+    path_arg, entries are tied to that argument's path so writes only drop
+    overlapping reads. when(args) -> bool limits caching to some calls.
+    """
+    def wrap(fn):
+        fn.cacheable = {"scope": scope, "ttl": ttl, "path_arg": path_arg, "when": when}
+        return fn
+    return wrap
+
+
+def invalidates(*scopes, path_arg=None, when=None):
+    """Mark a tool that changes state. "*" drops every cached result; with
+    path_arg only entries on an overlapping path are dropped. A tool with
+    neither this nor @cacheable or @read_only is assumed to change
+    anything."""
+    def wrap(fn):
+        fn.invalidates = {"scopes": scopes or ("*",), "path_arg": path_arg, "when": when}
+        return fn
+    return wrap
+
+
+def read_only(fn):
+    """Mark a tool that changes nothing a cached result could depend on."""
+    fn.invalidates = None
+    return fn
+
+
+_EVERYTHING = {"scopes": ("*",), "path_arg": None, "when": None}
+
+
+def _resolve(path):
+    try:
+        return Path(str(path)).expanduser().resolve()
+    except (OSError, RuntimeError):
+        return None
+
+
+def _overlaps(a, b):
+    if a is None or b is None:
+        return True
+    return a == b or a.is_relative_to(b) or b.is_relative_to(a)
+
+
+class ToolCache:
+    """Results of cacheable tool calls for the length of one turn."""
+
+    def __init__(self):
+        self.entries = {}  # key -> (result, expires, scope, path)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(name, args):
+        blob = json.dumps([name, args], sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    @staticmethod
+    def _applies(policy, args):
+        return policy is not None and (policy["when"] is None or policy["when"](args))
+
+    def get(self, name, handler, args):
+        policy = getattr(handler, "cacheable", None)
+        if not self._applies(policy, args):
+            return None
+        entry = self.entries.get(self._key(name, args))
+        if entry and entry[1] > time.monotonic():
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        return None
+
+    def put(self, name, handler, args, result):
+        policy = getattr(handler, "cacheable", None)
+        if not self._applies(policy, args) or not isinstance(result, str) or result.startswith("Error"):
+            return
+        path = _resolve(args.get(policy["path_arg"], ".")) if policy["path_arg"] else None
+        self.entries[self._key(name, args)] = (result, time.monotonic() + policy["ttl"], policy["scope"], path)
+
+    def invalidate(self, handler, args):
+        policy = getattr(handler, "invalidates", _EVERYTHING)
+        if policy is _EVERYTHING and hasattr(handler, "cacheable"):
+            policy = None
+        if not self._applies(policy, args):
+            return
+        scopes = policy["scopes"]
+        path = _resolve(args.get(policy["path_arg"], "")) if policy["path_arg"] else None
+        for key, (_, _, scope, entry_path) in list(self.entries.items()):
+            if "*" in scopes or (scope in scopes and _overlaps(path, entry_path)):
+                del self.entries[key]
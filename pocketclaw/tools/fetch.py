@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import re
+import time
+from html.parser import HTMLParser
+from pathlib import Path
+from ..jsonpath import json_path
+from .process import report
+
+log = logging.getLogger(__name__)
+
+# Most of a body read to extract from: HTML stops early once enough text
+# is out, JSON has to be read whole
+MAX_HTML_BYTES = 4 << 20
+MAX_JSON_BYTES = 16 << 20
+PROGRESS_EVERY = 5  # seconds between download progress reports
+
+
+class HTMLText(HTMLParser):
+    """Readable text of an HTML page, fed incrementally: no scripts, styles
+    or markup, one line per block element."""
+
+    SKIP = {"script", "style", "noscript", "template", "svg", "head"}
+    BLOCK = {"p", "div", "br", "tr", "table", "ul", "ol", "dl", "dt", "dd", "section", "article", "header",
+             "footer", "nav", "main", "aside", "pre", "blockquote", "form", "h1", "h2", "h3", "h4", "h5", "h6",
+             "title", "hr", "figure", "figcaption"}
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self.size = 0
+        self.skip = 0
+
+    def _add(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self.skip += 1
+        elif tag == "li":
+            self._add("\n- ")
+        elif tag in self.BLOCK:
+            self._add("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self.skip = max(0, self.skip - 1)
+        elif tag in self.BLOCK:
+            self._add("\n")
+
+    def handle_data(self, data):
+        if not self.skip:
+            self._add(re.sub(r"\s+", " ", data))
+
+    def text(self):
+        lines = (line.strip() for line in "".join(self.parts).split("\n"))
+        return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+async def read_body(r, max_chars, extract=None):
+    """(text, truncated) from a streaming response, reading no more than
+    the return budget needs."""
+    if extract == "text":
+        parser, read, stopped = HTMLText(), 0, False
+        async for chunk in r.aiter_text():
+            parser.feed(chunk)
+            read += len(chunk)
+            if parser.size > max_chars * 2 or read > MAX_HTML_BYTES:
+                stopped = True
+                break
+        text = parser.text()
+        return text[:max_chars], stopped or len(text) > max_chars
+    if extract:
+        raw = b""
+        async for chunk in r.aiter_bytes():
+            raw += chunk
+            if len(raw) > MAX_JSON_BYTES:
+                raise ValueError(f"JSON body over {MAX_JSON_BYTES >> 20} MB; use save_to")
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            raise ValueError("response is not JSON")
+        value = json_path(data, extract)
+        text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+        return text[:max_chars], len(text) > max_chars
+    parts, size = [], 0
+    async for chunk in r.aiter_text():
+        parts.append(chunk)
+        size += len(chunk)
+        if size > max_chars:
+            break
+    text = "".join(parts)
+    return text[:max_chars], len(text) > max_chars
+
+
+def _validator(headers):
+    """What an If-Range header can check the resource against: a strong
+    ETag, else Last-Modified."""
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("last-modified")
+
+
+def _progress(got, total, secs):
+    rate = f"{got / 1e6 / max(secs, 1e-3):.1f} MB/s"
+    if total:
+        return f"{got} of {total} bytes ({100 * got // total}%) at {rate}"
+    return f"{got} bytes at {rate}"
+
+
+async def download(client, method, url, headers, body, save_to):
+    """Stream the response into save_to. The body goes to save_to.part
+    first; if that exists from an interrupted download, only the rest is
+    requested, with a Range header and an If-Range check against the
+    ETag or Last-Modified saved alongside it. A changed or unverifiable
+    resource is downloaded again from the start."""
+    dest = Path(save_to).expanduser()
+    part = dest.with_name(dest.name + ".part")
+    tag = dest.with_name(dest.name + ".part.tag")
+    offset = part.stat().st_size if part.exists() else 0
+    validator = tag.read_text(encoding="utf-8") if offset and tag.exists() else None
+    result = None
+    if offset and validator:
+        result = await _fetch(client, method, url, headers, body, dest, part, tag, offset, validator)
+    if result is None:
+        result = await _fetch(client, method, url, headers, body, dest, part, tag, 0, None)
+    return result
+
+
+async def _fetch(client, method, url, headers, body, dest, part, tag, offset, validator):
+    """One request for the body from offset on; None if a resumed
+    download has to start over."""
+    headers = dict(headers or {})
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator
+    t0 = last = time.monotonic()
+    done = 0
+    async with client.stream(method, url, headers=headers, content=body) as r:
+        if r.status_code == 416 and offset:
+            if _validator(r.headers) not in (None, validator):
+                return None
+            # Nothing left to send: the last run got everything but the rename
+            os.replace(part, dest)
+            tag.unlink(missing_ok=True)
+            return f"HTTP 200\nSaved {offset} bytes to {dest} (already complete)"
+        if r.status_code >= 400:
+            text, _ = await read_body(r, 500)
+            return f"HTTP {r.status_code}\n{text}"
+        if offset:
+            span = re.match(r"bytes (\d+)-", r.headers.get("content-range", ""))
+            if r.status_code != 206 or not span or int(span.group(1)) != offset \
+                    or _validator(r.headers) not in (None, validator):
+                # Changed since the last run, or the server ignored the range
+                return None
+        length = r.headers.get("content-length")
+        total = offset + int(length) if length and length.isdigit() else None
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if not offset:
+            validator = _validator(r.headers)
+            if validator:
+                tag.write_text(validator, encoding="utf-8")
+            else:
+                tag.unlink(missing_ok=True)
+        try:
+            with open(part, "ab" if offset else "wb") as f:
+                async for chunk in r.aiter_bytes():
+                    f.write(chunk)
+                    done += len(chunk)
+                    if time.monotonic() - last >= PROGRESS_EVERY:
+                        last = time.monotonic()
+                        progress = _progress(offset + done, total, last - t0)
+                        report(f"downloaded {progress}; call again with the same save_to to resume")
+                        log.info(f"Downloading {url}: {progress}")
+        except Exception as e:
+            return (f"Error: download interrupted at {_progress(offset + done, total, time.monotonic() - t0)} "
+                    f"({e or type(e).__name__}). Call again with the same save_to to resume.")
+    os.replace(part, dest)
+    tag.unlink(missing_ok=True)
+    secs = time.monotonic() - t0
+    resumed = f", resumed at byte {offset}" if offset else ""
+    return (f"HTTP {r.status_code}\nSaved {offset + done} bytes to {dest} "
+            f"({secs:.1f}s, {done / 1e6 / max(secs, 1e-3):.1f} MB/s{resumed})")
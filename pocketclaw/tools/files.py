@@ -0,0 +1,68 @@
+from ..storage import atomic_write
+
+# Characters read per chunk while editing
+CHUNK = 1 << 20
+
+
+class EditError(Exception):
+    pass
+
+
+def _normalise(edits):
+    out = []
+    for i, e in enumerate(edits, 1):
+        old, new = e.get("old_str"), e.get("new_str")
+        if not isinstance(old, str) or not old:
+            raise EditError(f"edit {i}: old_str must be a non-empty string")
+        if not isinstance(new, str):
+            raise EditError(f"edit {i}: new_str must be a string")
+        out.append((old, new))
+    return out
+
+
+def _edited(src, edits, counts, chunk):
+    """Pieces of src's text with edits applied, counting matches per edit.
+    The last longest-old_str - 1 characters of each chunk are held back so
+    matches across chunk boundaries are found."""
+    keep = max(len(old) for old, _ in edits) - 1
+    buf, eof = "", False
+    while not eof:
+        data = src.read(chunk)
+        eof = not data
+        buf += data
+        # A match starting before limit lies wholly inside buf
+        limit = len(buf) if eof else max(0, len(buf) - keep)
+        pos = 0
+        nxt = [buf.find(old) for old, _ in edits]
+        while True:
+            hits = [(at, -len(edits[k][0]), k) for k, at in enumerate(nxt) if 0 <= at < limit]
+            if not hits:
+                break
+            at, _, k = min(hits)
+            old, new = edits[k]
+            yield buf[pos:at]
+            yield new
+            counts[k] += 1
+            pos = at + len(old)
+            nxt = [j if j >= pos else buf.find(edits[n][0], pos) for n, j in enumerate(nxt)]
+        cut = max(pos, limit)
+        yield buf[pos:cut]
+        buf = buf[cut:]
+    problems = [(f"edit {k + 1}: " if len(edits) > 1 else "")
+                + ("old_str not found in file" if n == 0 else f"old_str found {n} times (must be unique)")
+                for k, n in enumerate(counts) if n != 1]
+    if problems:
+        # Raised inside atomic_write, so the original file stays as it was
+        raise EditError("; ".join(problems))
+
+
+def stream_edit(path, edits, chunk=CHUNK):
+    """Apply edits ({old_str, new_str}) to path in one streaming pass.
+
+    Each old_str must appear exactly once in the original file; edits
+    don't see each other's replacements and must not overlap. The file is
+    read chunk characters at a time and the result replaces it atomically
+    only if every edit matched once."""
+    edits = _normalise(edits)
+    with open(path, encoding="utf-8", newline="") as src:
+        atomic_write(path, _edited(src, edits, [0] * len(edits), chunk))
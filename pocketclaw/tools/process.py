@@ -0,0 +1,213 @@
+import asyncio
+import contextvars
+import os
+import resource
+import signal
+import subprocess
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+# Seconds between SIGTERM and SIGKILL when stopping a process group
+GRACE = 2.0
+
+_scope = contextvars.ContextVar("tool_scope", default=None)
+
+
+class ToolScope:
+    """Resource limits for the processes one tool call starts, and what
+    they used. Gateway._exec_tool makes one active around each call."""
+
+    def __init__(self, cpu_s=0, memory_mb=0, file_mb=0, output_mb=0):
+        self.cpu_s = cpu_s
+        self.memory_mb = memory_mb
+        self.file_mb = file_mb
+        self.output_bytes = int(output_mb * 1024 * 1024) or None
+        self.procs = 0
+        self.cpu_used = 0.0
+        self.peak_rss_mb = 0.0
+        self.progress = None  # last report() from the call, kept if it times out
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(cfg.get("cpu_s", 0), cfg.get("memory_mb", 0), cfg.get("file_mb", 0), cfg.get("output_mb", 0))
+
+    @contextmanager
+    def active(self):
+        token = _scope.set(self)
+        try:
+            yield self
+        finally:
+            _scope.reset(token)
+
+    def preexec(self):
+        """setrlimit() calls to run in the child before exec, or None."""
+        limits = []
+        if self.cpu_s:
+            limits.append((resource.RLIMIT_CPU, int(self.cpu_s)))
+        if self.memory_mb:
+            limits.append((resource.RLIMIT_AS, int(self.memory_mb * 1024 * 1024)))
+        if self.file_mb:
+            limits.append((resource.RLIMIT_FSIZE, int(self.file_mb * 1024 * 1024)))
+        if not limits:
+            return None
+
+        def apply():
+            for res, soft in limits:
+                _, hard = resource.getrlimit(res)
+                if hard != resource.RLIM_INFINITY:
+                    soft = min(soft, hard)
+                resource.setrlimit(res, (soft, hard))
+
+        return apply
+
+    def add(self, usage):
+        self.procs += 1
+        self.cpu_used += usage.ru_utime + usage.ru_stime
+        # ru_maxrss is KiB on Linux/Android
+        self.peak_rss_mb = max(self.peak_rss_mb, usage.ru_maxrss / 1024)
+
+    def usage(self):
+        """Telemetry for the tool call, or None if it started no process."""
+        if not self.procs:
+            return None
+        return {"cpu_s": round(self.cpu_used, 3), "rss_mb": round(self.peak_rss_mb, 1)}
+
+
+def report(progress):
+    """Note how far the running tool call has got. If the call times out,
+    the gateway adds the last note to the error it returns."""
+    scope = _scope.get()
+    if scope is not None:
+        scope.progress = progress
+
+
+def timed_by(arg, default, margin=10.0):
+    """Mark a tool that stops itself after its own arg seconds. The
+    gateway's cap on the call is raised to that plus margin, so a long
+    wait the model asked for isn't cut off at advanced.tool_timeout."""
+    def wrap(fn):
+        fn.timed_by = (arg, default, margin)
+        return fn
+    return wrap
+
+
+@dataclass
+class Completed:
+    returncode: int
+    stdout: bytes
+    stderr: bytes
+    dropped: int = 0  # output bytes past the scope's output cap
+
+
+def _signal_group(pgid, sig):
+    try:
+        os.killpg(pgid, sig)
+        return True
+    except (ProcessLookupError, PermissionError):
+        return False
+
+
+class _Child:
+    """A Popen child reaped with wait4(), which (unlike asyncio's child
+    watcher) hands back its resource usage. Exit is noticed through a
+    pidfd where the kernel has them, else by polling."""
+
+    def __init__(self, popen):
+        self.popen = popen
+        self.pid = popen.pid
+        self.usage = None
+        self.loop = asyncio.get_running_loop()
+        self.exited = self.loop.create_future()
+        self.pidfd = None
+        try:
+            self.pidfd = os.pidfd_open(self.pid)
+            self.loop.add_reader(self.pidfd, self._reap)
+        except (AttributeError, OSError):
+            self.loop.create_task(self._poll())
+
+    def _reap(self):
+        if self.exited.done():
+            return True
+        pid, status, usage = os.wait4(self.pid, os.WNOHANG)
+        if not pid:
+            return False
+        self.popen.returncode = os.waitstatus_to_exitcode(status)
+        self.usage = usage
+        if self.pidfd is not None:
+            self.loop.remove_reader(self.pidfd)
+            os.close(self.pidfd)
+        self.exited.set_result(self.popen.returncode)
+        return True
+
+    async def _poll(self):
+        delay = 0.005
+        while not self._reap():
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    async def wait(self):
+        return await asyncio.shield(self.exited)
+
+    async def kill_group(self, grace=GRACE):
+        """SIGTERM the child's process group, wait up to grace seconds for
+        the child to exit, then SIGKILL whatever is left in the group."""
+        if not _signal_group(self.pid, signal.SIGTERM):
+            return
+        try:
+            await asyncio.wait_for(self.wait(), grace)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            _signal_group(self.pid, signal.SIGKILL)
+        try:
+            await asyncio.wait_for(self.wait(), 1)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def _read(pipe, cap):
+    reader = asyncio.StreamReader()
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+    kept, dropped = bytearray(), 0
+    try:
+        # Past the cap, keep reading (and discarding) so the child never
+        # blocks on a full pipe
+        while chunk := await reader.read(1 << 16):
+            room = len(chunk) if cap is None else max(0, cap - len(kept))
+            kept += chunk[:room]
+            dropped += len(chunk) - min(room, len(chunk))
+    finally:
+        transport.close()
+    return bytes(kept), dropped
+
+
+async def run(cmd, shell=False, timeout=None, cwd=None, grace=GRACE):
+    """Run cmd in its own session, under the active ToolScope's limits.
+
+    On timeout (asyncio.TimeoutError is re-raised) or cancellation the
+    whole process group is stopped, grandchildren included.
+    """
+    scope = _scope.get()
+    popen = subprocess.Popen(
+        cmd, shell=shell, cwd=cwd,
+        stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        start_new_session=True,
+        preexec_fn=scope.preexec() if scope else None,
+    )
+    child = _Child(popen)
+    cap = scope.output_bytes if scope else None
+
+    async def communicate():
+        (out, d1), (err, d2) = await asyncio.gather(_read(popen.stdout, cap), _read(popen.stderr, cap))
+        code = await child.wait()
+        return Completed(code, out, err, d1 + d2)
+
+    try:
+        return await asyncio.wait_for(communicate(), timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        await child.kill_group(grace)
+        raise
+    finally:
+        if scope and child.usage:
+            scope.add(child.usage)
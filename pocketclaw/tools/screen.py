@@ -1,18 +1,24 @@
 import asyncio
 import json
 import re
+import time
+from .cache import cacheable, invalidates, read_only
+from . import process
 
+# screen_wait's poll interval: back to the minimum whenever the screen is
+# changing, growing by POLL_GROWTH each quiet poll up to the maximum
+MIN_POLL = 0.1
+MAX_POLL = 1.0
+POLL_GROWTH = 1.6
 
+
+@cacheable("screen", ttl=5)
 async def screen_read():
-    proc = await asyncio.create_subprocess_shell(
-        "uiautomator dump /dev/tty 2>/dev/null",
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-    stdout, _ = await proc.communicate()
-    return _parse_ui_xml(stdout.decode(errors="replace"))
+    proc = await process.run("uiautomator dump /dev/tty 2>/dev/null", shell=True)
+    return _parse_ui_xml(proc.stdout.decode(errors="replace"))
 
 
+@invalidates("screen")
 async def screen_tap_element(text, element_type=None, index=0):
     raw = await screen_read()
     elements = json.loads(raw).get("elements", [])
@@ -23,24 +29,26 @@ async def screen_tap_element(text, element_type=None, index=0):
             if element_type is None or el.get("type", "").lower().endswith(element_type.lower()):
                 matches.append(el)
     if not matches:
-        return f"Element '{text}' not found on screen"
+        return f"Error: element '{text}' not found on screen"
     if index >= len(matches):
-        return f"Only {len(matches)} matches, index {index} out of range"
+        return f"Error: only {len(matches)} matches, index {index} out of range"
     b = matches[index]["bounds"]
     x, y = (b[0] + b[2]) // 2, (b[1] + b[3]) // 2
-    await _tap(x, y)
-    return f"Tapped '{text}' at ({x}, {y})"
+    return await _tap(x, y) or f"Tapped '{text}' at ({x}, {y})"
 
 
+@invalidates("screen")
 async def screen_type_text(text, clear_first=False):
     if clear_first:
-        await asyncio.create_subprocess_shell("input keyevent KEYCODE_CTRL_LEFT+KEYCODE_A")
-        await asyncio.create_subprocess_shell("input keyevent KEYCODE_DEL")
+        error = (await _input("keyevent", "KEYCODE_CTRL_LEFT+KEYCODE_A")
+                 or await _input("keyevent", "KEYCODE_DEL"))
+        if error:
+            return error
     escaped = text.replace(" ", "%s").replace("&", "\\&")
-    await asyncio.create_subprocess_shell(f'input text "{escaped}"')
-    return f"Typed: {text}"
+    return await _input("text", escaped) or f"Typed: {text}"
 
 
+@invalidates("screen")
 async def screen_scroll(direction="down", amount=500):
     cx, cy = 540, 960
     moves = {
@@ -50,13 +58,15 @@ async def screen_scroll(direction="down", amount=500):
         "right": (cx - amount, cy, cx + amount, cy),
     }
     x1, y1, x2, y2 = moves.get(direction, moves["down"])
-    await asyncio.create_subprocess_shell(f"input swipe {x1} {y1} {x2} {y2} 300")
-    return f"Scrolled {direction}"
+    return await _input("swipe", x1, y1, x2, y2, 300) or f"Scrolled {direction}"
 
 
+@read_only
 async def screenshot(scale=0.5):
     path = "/tmp/pocketclaw_screen.png"
-    await asyncio.create_subprocess_shell(f"screencap -p {path}")
+    error = await _command(["screencap", "-p", path])
+    if error:
+        return error
     if scale < 1.0:
         try:
             from PIL import Image
@@ -68,13 +78,100 @@ async def screenshot(scale=0.5):
     return path
 
 
+async def current_activity():
+    """Foreground package/activity from the window manager, or None. Much
+    cheaper than a UI dump."""
+    proc = await process.run("dumpsys window 2>/dev/null | grep -E 'mCurrentFocus|mFocusedApp'", shell=True)
+    m = re.search(r"([\w.]+/[\w.$]+)", proc.stdout.decode(errors="replace"))
+    return m.group(1) if m else None
+
+
+def _shows(tree, text):
+    try:
+        elements = json.loads(tree).get("elements", [])
+    except (ValueError, AttributeError):
+        return False
+    text = text.lower()
+    return any(text in (el.get("text", "") + " " + el.get("description", "")).lower() for el in elements)
+
+
+# Invalidates so screen reads after the wait aren't answered from before it
+@invalidates("screen")
+@process.timed_by("timeout", 10)
+async def screen_wait(text=None, gone=None, activity=None, stable_ms=None, timeout=10):
+    """Wait until every given condition holds: text shown, gone not shown,
+    the foreground activity matching activity ("changed" = any other than
+    at the start), the UI unchanged for stable_ms. Returns the final screen."""
+    if not (text or gone or activity or stable_ms):
+        return "Error: give text, gone, activity or stable_ms"
+    start = time.monotonic()
+    deadline = start + float(timeout)
+    use_tree = bool(text or gone or stable_ms)
+    initial = await current_activity() if activity == "changed" else None
+    delay, polls = MIN_POLL, 0
+    act = tree = last = None
+    changed_at = start
+    while True:
+        polls += 1
+        now = time.monotonic()
+        moved = False
+        if activity:
+            prev, act = act, await current_activity()
+            moved = act != prev
+            if activity == "changed":
+                act_ok = act is not None and act != initial
+            else:
+                act_ok = act is not None and activity.lower() in act.lower()
+        else:
+            act_ok = True
+        # The UI dump only once the cheap activity probe is satisfied
+        if use_tree and act_ok:
+            last, tree = tree, await screen_read()
+            if tree != last:
+                moved, changed_at = True, now
+        met = act_ok and (
+            (not text or _shows(tree, text))
+            and (not gone or not _shows(tree, gone))
+            and (not stable_ms or (last is not None and (now - changed_at) * 1000 >= float(stable_ms)))
+        )
+        if met or now >= deadline:
+            break
+        delay = MIN_POLL if moved else min(MAX_POLL, delay * POLL_GROWTH)
+        if stable_ms:
+            delay = min(delay, max(MIN_POLL, changed_at + float(stable_ms) / 1000 - now))
+        await asyncio.sleep(max(0.0, min(delay, deadline - now)))
+
+    elapsed = time.monotonic() - start
+    state = (f"\nActivity: {act}" if act else "") + (f"\n{tree}" if tree else "")
+    if not met:
+        want = ", ".join(f"{k}={v!r}" for k, v in (("text", text), ("gone", gone), ("activity", activity),
+                                                    ("stable_ms", stable_ms)) if v)
+        return f"Error: screen_wait timed out after {elapsed:.1f}s ({polls} polls) waiting for {want}{state}"
+    return f"Condition met after {elapsed:.1f}s ({polls} polls){state}"
+
+
+@invalidates("screen")
 async def screen_tap_coordinates(x, y):
-    await _tap(x, y)
-    return f"Tapped ({x}, {y})"
+    return await _tap(x, y) or f"Tapped ({x}, {y})"
 
 
 async def _tap(x, y):
-    await asyncio.create_subprocess_shell(f"input tap {x} {y}")
+    return await _input("tap", x, y)
+
+
+async def _input(*args):
+    return await _command(["input", *map(str, args)])
+
+
+async def _command(argv):
+    """Run argv through process.run, under the tool call's limits and
+    killed with its process group on timeout or cancel. None if it
+    worked, else the error to return."""
+    proc = await process.run(argv)
+    if proc.returncode:
+        err = proc.stderr.decode(errors="replace").strip()[-200:]
+        return f"Error: {argv[0]} {argv[1]} failed (exit code {proc.returncode})" + (f": {err}" if err else "")
+    return None
 
 
 def _parse_ui_xml(xml):
@@ -104,6 +201,7 @@ def _parse_ui_xml(xml):
 def get_screen_tools(config):
     return {
         "screen_read": screen_read,
+        "screen_wait": screen_wait,
         "screen_tap_element": screen_tap_element,
         "screen_type_text": screen_type_text,
         "screen_scroll": screen_scroll,
@@ -0,0 +1,214 @@
+import asyncio
+import fnmatch
+import json
+import mmap
+import os
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from .cache import cacheable
+
+# Never worth searching, gitignored or not
+DEFAULT_IGNORES = {".git", ".hg", ".svn", "node_modules", "__pycache__", ".venv", "venv", ".tox",
+                   ".mypy_cache", ".pytest_cache", ".gradle", ".cache"}
+MAX_RESULTS = 50
+MAX_LINE = 300
+WORKERS = min(8, os.cpu_count() or 1)
+
+
+def _glob_regex(pattern):
+    """Regex for one .gitignore pattern, matched against a /-separated path
+    relative to the .gitignore's directory."""
+    anchored = "/" in pattern.rstrip("/")
+    pattern = pattern.strip("/")
+    out, i = [], 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 1:]:
+            end = pattern.index("]", i + 1)
+            out.append("[" + pattern[i + 1:end].replace("!", "^", 1) + "]")
+            i = end + 1
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return re.compile(("" if anchored else "(?:.*/)?") + "".join(out) + r"\Z")
+
+
+def read_gitignore(directory):
+    """(directory, regex, negated, dir_only) rules from directory/.gitignore."""
+    try:
+        with open(os.path.join(directory, ".gitignore"), encoding="utf-8", errors="replace") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+    rules = []
+    for line in lines:
+        line = line.rstrip()
+        if not line or line.startswith("#"):
+            continue
+        negated = line.startswith("!")
+        line = line[1:] if negated else line.removeprefix("\\")
+        rules.append((directory, _glob_regex(line), negated, line.endswith("/")))
+    return rules
+
+
+def ignored(path, is_dir, rules):
+    """Whether the last matching rule ignores path."""
+    result = False
+    for base, regex, negated, dir_only in rules:
+        if dir_only and not is_dir:
+            continue
+        if regex.match(os.path.relpath(path, base).replace(os.sep, "/")):
+            result = not negated
+    return result
+
+
+def walk(root, glob=None):
+    """Files under root, depth first in name order, skipping default
+    ignores and anything a .gitignore on the way down ignores."""
+    stack = [(root, read_gitignore(root))]
+    while stack:
+        directory, rules = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda e: e.name, reverse=True)
+        except OSError:
+            continue
+        for e in entries:
+            if e.name in DEFAULT_IGNORES:
+                continue
+            try:
+                is_dir = e.is_dir(follow_symlinks=False)
+                if not is_dir and not e.is_file():
+                    continue
+            except OSError:
+                continue
+            if rules and ignored(e.path, is_dir, rules):
+                continue
+            if is_dir:
+                stack.append((e.path, rules + read_gitignore(e.path)))
+            elif glob is None or fnmatch.fnmatch(e.name, glob):
+                yield e.path
+
+
+def _line(mm, start, end):
+    text = mm[start:end].decode("utf-8", errors="replace").rstrip("\r")
+    return text if len(text) <= MAX_LINE else text[:MAX_LINE] + "..."
+
+
+def search_file(path, regex, context=2, limit=MAX_RESULTS, stop=None):
+    """Matches in one file as dicts, at most one per line. Binary and empty
+    files have none."""
+    try:
+        with open(path, "rb") as f:
+            if b"\0" in f.read(8192) or os.fstat(f.fileno()).st_size == 0:
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                matches, line_no, counted, pos = [], 1, 0, 0
+                # pos is past the last line once it passes EOF; a match (zero
+                # width, like $ or x*) starting at EOF after a newline is on
+                # no line at all
+                while pos <= len(mm) and len(matches) < limit and not (stop and stop.is_set()):
+                    m = regex.search(mm, pos)
+                    if not m:
+                        break
+                    start = mm.rfind(b"\n", 0, m.start()) + 1
+                    if start == len(mm):
+                        break
+                    end = mm.find(b"\n", m.start())
+                    end = len(mm) if end < 0 else end
+                    line_no += mm[counted:start].count(b"\n")
+                    counted = start
+                    before, b = [], start
+                    for _ in range(context):
+                        if b == 0:
+                            break
+                        a = mm.rfind(b"\n", 0, b - 1) + 1
+                        before.insert(0, _line(mm, a, b - 1))
+                        b = a
+                    after, a = [], end
+                    for _ in range(context):
+                        if a >= len(mm) - 1:
+                            break
+                        nxt = mm.find(b"\n", a + 1)
+                        nxt = len(mm) if nxt < 0 else nxt
+                        after.append(_line(mm, a + 1, nxt))
+                        a = nxt
+                    matches.append({"line": line_no, "text": _line(mm, start, end), "before": before, "after": after})
+                    pos = end + 1
+                return matches
+    except (OSError, ValueError):
+        return []
+
+
+def search(pattern, path=".", glob=None, ignore_case=False, literal=False, context=2, max_results=MAX_RESULTS):
+    """Search the files under path in a thread pool. Stops walking once
+    max_results matches are in; files are ranked by how many matches they
+    have, then by path."""
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    regex = re.compile(re.escape(pattern.encode()) if literal else pattern.encode(), flags)
+    root = os.path.expanduser(path)
+    if os.path.isfile(root):
+        files, root = iter([root]), os.path.dirname(root) or "."
+    elif os.path.isdir(root):
+        files = walk(root, glob)
+    else:
+        raise FileNotFoundError(f"{path} does not exist")
+    stop = threading.Event()
+    found, lock = {}, threading.Lock()
+    counts = {"files": 0, "matches": 0}
+
+    def one(f):
+        if stop.is_set():
+            return
+        matches = search_file(f, regex, context, max_results, stop)
+        with lock:
+            counts["files"] += 1
+            if matches and not stop.is_set():
+                matches = matches[: max_results - counts["matches"]]
+                found[f] = matches
+                counts["matches"] += len(matches)
+                if counts["matches"] >= max_results:
+                    stop.set()
+
+    with ThreadPoolExecutor(WORKERS) as pool:
+        pending = set()
+        for f in files:
+            if stop.is_set():
+                break
+            pending.add(pool.submit(one, f))
+            if len(pending) >= WORKERS * 4:
+                pending = wait(pending, return_when=FIRST_COMPLETED).not_done
+        wait(pending)
+
+    ranked = sorted(found.items(), key=lambda kv: (-len(kv[1]), kv[0]))
+    return {
+        "matches": [{"path": os.path.relpath(f, root), **m} for f, ms in ranked for m in ms],
+        "files": len(found),
+        "searched": counts["files"],
+        "truncated": stop.is_set(),
+    }
+
+
+@cacheable("fs", path_arg="path")
+async def search_files(pattern, path=".", glob=None, ignore_case=False, literal=False, context=2,
+                       max_results=MAX_RESULTS):
+    try:
+        result = await asyncio.to_thread(search, pattern, path, glob, bool(ignore_case), bool(literal),
+                                         max(0, int(context)), max(1, int(max_results)))
+    except re.error as e:
+        return f"Error: bad pattern: {e}"
+    except Exception as e:
+        return f"Error: {e}"
+    return json.dumps(result, ensure_ascii=False)
@@ -0,0 +1,235 @@
+import json
+import re
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from .storage import atomic_write, file_lock
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Small bundled concept table so everyday paraphrases land on the same
+# feature ("wife" ~ "spouse") without downloading an embedding model.
+_CONCEPT_GROUPS = [
+    "spouse wife husband partner married girlfriend boyfriend fiance fiancee",
+    "mother mom mum mam mama mommy",
+    "father dad papa daddy",
+    "child kid son daughter children kids",
+    "sibling brother sister bro sis",
+    "grandparent grandma grandpa grandmother grandfather granny nan",
+    "friend buddy mate pal bestie",
+    "name called named nickname",
+    "birthday born birth bday birthdate anniversary",
+    "home house address live lives living apartment flat",
+    "city town location place hometown",
+    "job work occupation employer company office career profession",
+    "phone mobile cell number telephone",
+    "email mail inbox gmail",
+    "car vehicle drive auto",
+    "pet dog cat puppy kitten",
+    "doctor gp physician dentist clinic",
+    "allergy allergic allergies intolerance",
+    "food eat diet meal cuisine vegetarian vegan",
+    "coffee espresso latte cappuccino",
+    "drink tea beer wine",
+    "music song band artist playlist spotify",
+    "bank account balance money finance",
+    "language speak speaks fluent",
+    "timezone zone tz",
+    "wake alarm morning",
+    "exercise gym workout run running fitness",
+    "school university college uni study studies",
+    "salary income pay wage",
+    "project repo repository code",
+    "favourite favorite prefer preference likes like",
+    "hate dislike dislikes avoid",
+    "weather forecast temperature",
+    "crypto bitcoin btc ethereum eth wallet",
+    "travel trip flight holiday vacation",
+]
+_CONCEPTS = {}
+for _i, _group in enumerate(_CONCEPT_GROUPS):
+    for _w in _group.split():
+        _CONCEPTS[_w] = f"~{_i}"
+
+_STOP = set(
+    "a an the and or but of to in on at for from with by is are was were be been am do does did "
+    "i me my mine you your we our us he she it its they them their this that these those what "
+    "whats which who whom when where why how s t can could will would should shall may might "
+    "please tell know remember about as if so than then there here up down out over just".split()
+)
+
+
+def available():
+    return np is not None
+
+
+def _features(text):
+    for tok in re.findall(r"\w+", text.lower()):
+        if tok in _STOP:
+            continue
+        yield tok, 1.0
+        concept = _CONCEPTS.get(tok) or _CONCEPTS.get(tok.rstrip("s"))
+        if concept:
+            yield concept, 1.5
+        if len(tok) > 3:
+            padded = f"<{tok}>"
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3], 0.3
+
+
+def embed(text, dim=256):
+    """Signed feature-hashing embedding of words, concepts and trigrams."""
+    vec = np.zeros(dim, dtype=np.float32)
+    for feat, weight in _features(text):
+        h = zlib.crc32(feat.encode())
+        vec[h % dim] += weight if h & 0x80000000 else -weight
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm else vec
+
+
+class VectorIndex:
+    """Unit vectors in a memory-mapped .npy matrix plus a JSON key table.
+
+    Rows are added or overwritten in place; deletes leave a zeroed slot
+    that the next add reuses. The matrix grows by doubling. Several
+    processes can share an index: changes are made under an flock on
+    fresh state, and the key table and matrix are re-read whenever
+    another process has replaced them. version is a caller-chosen tag
+    saved with the index, e.g. a digest of what it was built from.
+    """
+
+    def __init__(self, path, dim=256):
+        self.path = Path(path)
+        self.dim = dim
+        self._npy = self.path.with_suffix(".npy")
+        self._meta = self.path.with_suffix(".json")
+        self._lock = self.path.with_suffix(".lock")
+        self._stamp = None
+        self.keys, self.meta, self.version = [], [], None
+        self.rows = None
+        with file_lock(self._lock):
+            if not self._load():
+                self._reset()
+
+    def __len__(self):
+        self._load()
+        return len(self._slot)
+
+    def _load(self):
+        """Re-read the key table and re-map the matrix if the files were
+        replaced since we last saw them. False if there is no usable index."""
+        try:
+            st = self._meta.stat()
+        except OSError:
+            return False
+        stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if stamp == self._stamp:
+            return True
+        try:
+            data = json.loads(self._meta.read_text(encoding='utf-8'))
+            if data.get("dim") != self.dim:
+                return False
+            self.rows = np.load(self._npy, mmap_mode="r+")
+        except (OSError, ValueError):
+            return False
+        self.keys, self.meta, self.version = data["keys"], data["meta"], data.get("version")
+        self._slot = {k: i for i, k in enumerate(self.keys) if k is not None}
+        self._free = [i for i, k in enumerate(self.keys) if k is None]
+        self._stamp = stamp
+        return True
+
+    def _reset(self):
+        self.keys, self.meta, self._slot, self._free = [], [], {}, []
+        self.rows = None
+        self._alloc(64)
+        self._save()
+
+    @contextmanager
+    def _changing(self, version=None):
+        """Hold the lock on up-to-date state, then save."""
+        with file_lock(self._lock):
+            if not self._load():
+                self._reset()
+            yield
+            if version is not None:
+                self.version = version
+            self._save()
+
+    def _alloc(self, capacity):
+        old = self.rows
+        tmp = self._npy.with_name(self._npy.name + ".grow")
+        rows = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(capacity, self.dim))
+        if old is not None:
+            rows[:len(old)] = old
+            del old
+        rows.flush()
+        del rows
+        tmp.replace(self._npy)
+        self.rows = np.load(self._npy, mmap_mode="r+")
+
+    def _free_slot(self):
+        if self._free:
+            return self._free.pop()
+        if len(self.keys) >= len(self.rows):
+            self._alloc(len(self.rows) * 2)
+        self.keys.append(None)
+        self.meta.append(None)
+        return len(self.keys) - 1
+
+    def add(self, items, version=None):
+        """items: iterable of (key, text, meta). Existing keys are overwritten."""
+        with self._changing(version):
+            for key, text, meta in items:
+                i = self._slot.get(key)
+                if i is None:
+                    i = self._free_slot()
+                    self._slot[key] = i
+                self.rows[i] = embed(text, self.dim)
+                self.keys[i], self.meta[i] = key, meta
+
+    def _delete(self, keys):
+        for key in keys:
+            i = self._slot.pop(key, None)
+            if i is not None:
+                self.rows[i] = 0
+                self.keys[i], self.meta[i] = None, None
+                self._free.append(i)
+
+    def delete(self, *keys, version=None):
+        with self._changing(version):
+            self._delete(keys)
+
+    def delete_prefix(self, prefix, version=None):
+        """Delete every key starting with prefix, as seen under the lock."""
+        with self._changing(version):
+            self._delete([k for k in self._slot if k.startswith(prefix)])
+
+    def clear(self, version=None):
+        with file_lock(self._lock):
+            self.version = version
+            self._reset()
+
+    def search(self, text, k=10, min_score=0.0):
+        """Cosine top-k. Returns [(key, score, meta)], best first."""
+        self._load()
+        n = len(self.keys)
+        if not n or not self._slot:
+            return []
+        scores = self.rows[:n] @ embed(text, self.dim)
+        k = min(k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        hits = []
+        for i in top[np.argsort(-scores[top])]:
+            if self.keys[i] is not None and scores[i] > min_score:
+                hits.append((self.keys[i], float(scores[i]), self.meta[i]))
+        return hits
+
+    def _save(self):
+        self.rows.flush()
+        atomic_write(self._meta, json.dumps({"dim": self.dim, "version": self.version,
+                                             "keys": self.keys, "meta": self.meta}))
+        st = self._meta.stat()
+        self._stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
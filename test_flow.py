@@ -6,6 +6,7 @@ No API key needed. Proves the system works end to end.
 
 import asyncio
 import json
+import time
 import sys
 import os
 
@@ -19,6 +20,8 @@ from pocketclaw.system_prompt import build_system_prompt
 from pocketclaw.tools.builtin import get_builtin_tools
 from pocketclaw.tools.screen import get_screen_tools
 from pocketclaw.android import get_android_tools
+from pocketclaw.gateway import Gateway
+from pocketclaw.llm import LLMResponse, ToolCall
 
 # ── Colours ───────────────────────────────────────────────
 G = "\033[32m"
@@ -40,6 +43,50 @@ def section(msg):
     print(f"\n{C}── {msg} ──{R}")
 
 
+class MockLLM:
+    """Stands in for LLMConnector. `script` is a list of (text, [(tool, args)])
+    replies; once it runs out every reply is plain 'done'."""
+
+    provider, model = "mock", "mock-1"
+
+    def __init__(self, script=None, delay=0):
+        self.script = list(script or [])
+        self.delay = delay
+        self.calls = 0
+
+    def _next(self):
+        self.calls += 1
+        text, tools = self.script.pop(0) if self.script else ("done", [])
+        tcs = [ToolCall(f"call_{self.calls}_{i}", name, args) for i, (name, args) in enumerate(tools)]
+        return LLMResponse(text, tcs)
+
+    async def chat(self, system, messages, tools=None, cache=True):
+        await asyncio.sleep(self.delay)
+        return self._next()
+
+    async def chat_stream(self, system, messages, tools=None, cache=True):
+        await asyncio.sleep(self.delay)
+        r = self._next()
+        if r.text:
+            yield {"type": "text", "text": r.text}
+        if r.tool_calls:
+            yield {"type": "tool_calls", "tool_calls": r.tool_calls}
+        yield {"type": "done", "text": r.text or ""}
+
+    async def close(self):
+        pass
+
+
+def mock_gateway(mem_path, script=None, delay=0, config=None):
+    c = config or Config()
+    c.set("skills.paths", ["./skills/builtin"])
+    c.set("memory.path", mem_path)
+    c.set("metrics.path", f"{mem_path}/metrics.jsonl")
+    gw = Gateway(c)
+    gw.llm = MockLLM(script, delay)
+    return gw
+
+
 # ── Tests ─────────────────────────────────────────────────
 
 def test_config():
@@ -80,6 +127,17 @@ def test_skill_loader():
     assert "termux_api" in tool_names, "termux_api defined"
     ok(f"{len(defs)} tool definitions parsed")
 
+    from pocketclaw.llm import LLMConnector
+    edit = next(t for t in defs if t["name"] == "edit_file")
+    llm = LLMConnector({"provider": "openai", "api_key": "x", "model": "gpt-4o"})
+    oai = llm._tool_oai(edit)["function"]["parameters"]["properties"]["edits"]
+    anth = llm._tool_anth(edit)["input_schema"]["properties"]["edits"]
+    for schema in (oai, anth):
+        assert schema["items"]["type"] == "object", schema
+        assert set(schema["items"]["properties"]) == {"old_str", "new_str"}, schema
+        assert schema["items"]["required"] == ["old_str", "new_str"], schema
+    ok("Nested parameter schemas (edit_file edits: [{old_str, new_str}]) reach both provider formats")
+
     summary = loader.get_summary()
     assert "shell" in summary.lower(), "summary contains shell"
     ok("Skill summary generated")
@@ -121,6 +179,151 @@ def test_memory():
     shutil.rmtree("/tmp/pocketclaw_test_memory", ignore_errors=True)
 
 
+def test_storage_backends():
+    section("Storage Backends")
+    from pocketclaw.storage import get_backend, migrate
+    import shutil
+    base = "/tmp/pocketclaw_test_storage"
+    shutil.rmtree(base, ignore_errors=True)
+
+    for name in ("json", "sqlite"):
+        c = Config()
+        c.set("memory.path", f"{base}/{name}")
+        c.set("memory.backend", name)
+        mem = MemoryStore(c)
+        msgs = mem.get_conversation("conv")
+        msgs += [{"role": "user", "content": "one"}, {"role": "assistant", "content": "two"}]
+        mem.save_conversation("conv", msgs)
+
+        # A second process appends a turn to the same conversation meanwhile
+        other = MemoryStore(c)
+        theirs = other.get_conversation("conv")
+        theirs.append({"role": "user", "content": "three"})
+        other.save_conversation("conv", theirs)
+
+        msgs.append({"role": "user", "content": "four"})
+        mem.save_conversation("conv", msgs)
+        loaded = [m["content"] for m in MemoryStore(c).get_conversation("conv")]
+        assert loaded == ["one", "two", "three", "four"], f"{name}: no lost turns ({loaded})"
+        ok(f"{name}: concurrent saves keep every turn")
+
+        for bad in ("../../escaped", "a/b", "..", "", "x" * 129):
+            try:
+                mem.get_conversation(bad)
+                assert False, f"{name}: {bad!r} accepted"
+            except ValueError:
+                pass
+        src = get_backend(name, f"{base}/{name}")
+        for call in (lambda: src.append("../up", [{"role": "user", "content": "x"}]), lambda: src.delete("../up")):
+            try:
+                call()
+                assert name == "sqlite", "json backend checks ids at the file boundary"
+            except ValueError:
+                pass
+        assert not os.path.exists(f"{base}/{name}/up.json")
+        ok(f"{name}: conversation ids that aren't safe file names are rejected")
+
+    src = get_backend("json", f"{base}/json")
+    dst = get_backend("sqlite", f"{base}/migrated")
+    assert migrate(src, dst) == 1, "one conversation migrated"
+    assert len(dst.load("conv")) == 4 and len(dst.load("conv", 2)) == 2, "migrated + tail load"
+    dst.close()
+    ok("Migration json -> sqlite")
+
+    shutil.rmtree(base, ignore_errors=True)
+
+
+def test_fact_store():
+    section("Fact Store")
+    from pocketclaw.facts import FactStore
+    import shutil
+    shutil.rmtree("/tmp/pocketclaw_test_facts", ignore_errors=True)
+    os.makedirs("/tmp/pocketclaw_test_facts")
+
+    legacy = "/tmp/pocketclaw_test_facts/facts.json"
+    with open(legacy, "w") as f:
+        json.dump({"user_name": "Sam"}, f)
+    store = FactStore("/tmp/pocketclaw_test_facts/facts.db", legacy_json=legacy)
+    assert store.get("user_name") == "Sam", "legacy json imported"
+    assert not os.path.exists(legacy), "legacy json moved aside"
+    ok("Imports legacy facts.json")
+
+    store.update({f"note_{i}": f"filler entry number {i}" for i in range(2000)})
+    store.update({"home_city": "New York", "birthday": "March 3rd", "wife_name": "Alex"})
+    assert store.count() == 2004, "bulk update"
+    ok(f"Atomic bulk update ({store.count()} facts)")
+
+    hits = store.search("birthday")
+    assert hits and hits[0][0] == "birthday", "token query"
+    hits = store.search("birth*")
+    assert hits and hits[0][0] == "birthday", "prefix query"
+    hits = store.search('"new york"')
+    assert [h[0] for h in hits] == ["home_city"], "phrase query"
+    hits = store.search("wife_name")
+    assert hits[0][1] == "Alex", "multi-word key"
+    assert len(store.search("filler", limit=5)) == 5, "limit respected"
+    ok("Token, prefix and phrase queries ranked and capped")
+
+    assert store.delete("birthday") and not store.search("birthday"), "delete updates index"
+    ok("Delete removes from index")
+
+    store.close()
+    shutil.rmtree("/tmp/pocketclaw_test_facts", ignore_errors=True)
+
+
+def test_semantic_memory():
+    section("Semantic Memory")
+    from pocketclaw import vectors
+    if not vectors.available():
+        ok("numpy not installed - semantic layer disabled, skipping")
+        return
+    import shutil
+    shutil.rmtree("/tmp/pocketclaw_test_semantic", ignore_errors=True)
+    c = Config()
+    c.set("memory.path", "/tmp/pocketclaw_test_semantic")
+    c.set("memory.semantic.index_conversations", True)
+    mem = MemoryStore(c)
+
+    for i in range(300):
+        asyncio.run(mem.handle_tool("remember", f"note_{i}", f"misc detail number {i}"))
+    asyncio.run(mem.handle_tool("remember", "spouse", "Alex"))
+    asyncio.run(mem.handle_tool("remember", "mum_birthday", "12 May"))
+    result = asyncio.run(mem.handle_tool("recall", "what's my wife's name"))
+    assert "Alex" in result, "wife finds spouse"
+    result = asyncio.run(mem.handle_tool("recall", "when was my mother born"))
+    assert "12 May" in result, "mother born finds mum_birthday"
+    ok("Recall finds paraphrased facts")
+
+    asyncio.run(mem.handle_tool("forget", "spouse"))
+    assert all(k != "spouse" for k, _, _ in mem.fact_vectors.search("wife")), "delete"
+    mem2 = MemoryStore(c)
+    assert len(mem2.fact_vectors) == mem.facts.count(), "index reloaded from disk"
+    ok(f"Incremental delete and mmap reload ({len(mem2.fact_vectors)} vectors)")
+
+    mem.facts.set("note_0", "sister is called Robin")
+    assert mem.facts.count() == len(mem.fact_vectors), "same count, different content"
+    mem3 = MemoryStore(c)
+    assert any(k == "note_0" for k, _, _ in mem3.fact_vectors.search("my sibling")), "reindexed on digest"
+    ok("Changed facts reindexed even when the count matches")
+
+    a = vectors.VectorIndex("/tmp/pocketclaw_test_semantic/shared", 64)
+    b = vectors.VectorIndex("/tmp/pocketclaw_test_semantic/shared", 64)
+    a.add((f"k{i}", f"item {i}", None) for i in range(100))  # grows past b's mapping
+    assert len(b) == 100 and len(b.search("item", 100)) == 100, "b sees a's growth"
+    b.add([("dentist", "dentist appointment", {"n": 1})])
+    b.delete_prefix("k1")
+    assert a.search("dentist", 1)[0][2] == {"n": 1} and len(a) == 90, "a sees b's changes"
+    ok("Indexes shared between instances stay in sync")
+
+    msgs = [{"role": "user", "content": "my dentist appointment is on friday"}]
+    mem.save_conversation("sem", msgs)
+    context = mem.get_prompt_facts("when do I see the doctor?")
+    assert "dentist appointment" in context, "past turn injected"
+    ok("Past conversation turns retrieved")
+
+    shutil.rmtree("/tmp/pocketclaw_test_semantic", ignore_errors=True)
+
+
 def test_system_prompt():
     section("System Prompt")
     c = Config()
@@ -136,6 +339,31 @@ def test_system_prompt():
     assert "shell" in prompt.lower(), "has skills"
     ok(f"System prompt generated ({len(prompt)} chars)")
 
+    # Facts are ranked, capped and deduplicated against identity
+    with open("/tmp/pocketclaw_test_prompt/identity.md", "w") as f:
+        f.write("# Me\n- Location: Lisbon\n")
+    c.set("memory.context_max_facts", 5)
+    mem = MemoryStore(c)
+    for i in range(50):
+        asyncio.run(mem.handle_tool("remember", f"note_{i}", f"unrelated detail {i}"))
+    asyncio.run(mem.handle_tool("remember", "home_city", "Lisbon"))
+    asyncio.run(mem.handle_tool("remember", "favourite_coffee", "flat white"))
+    prompt = build_system_prompt(c, loader, mem, "order my usual coffee")
+    assert "favourite_coffee" in prompt, "relevant fact injected"
+    assert "home_city" not in prompt, "identity duplicate skipped"
+    assert prompt.count("- note_") <= 4, "fact count capped"
+    assert prompt.count("Location: Lisbon") == 1, "identity included once"
+    ok("Prompt facts ranked, capped and deduplicated")
+
+    c.set("memory.history_max_entries", 20)
+    mem = MemoryStore(c)
+    for i in range(30):
+        asyncio.run(mem.handle_tool("remember", "counter", str(i)))
+    assert len(mem.history.tail(100)) <= 22, "history trimmed"
+    assert mem.history.tail(1)[0]["fact"] == "counter: 29", "latest kept"
+    assert "facts_learned" not in mem.get_facts(), "history kept out of facts"
+    ok("Fact history is an append-only log with retention")
+
     # Cleanup
     import shutil
     shutil.rmtree("/tmp/pocketclaw_test_prompt", ignore_errors=True)
@@ -244,11 +472,1621 @@ def test_tool_pipeline():
     shutil.rmtree("/tmp/pocketclaw_test_pipeline", ignore_errors=True)
 
 
+def test_tool_cache():
+    section("Tool Result Cache")
+    import shutil
+    base = "/tmp/pocketclaw_test_toolcache"
+    shutil.rmtree(base, ignore_errors=True)
+    os.makedirs(f"{base}/work")
+    f = f"{base}/work/notes.txt"
+    with open(f, "w") as fh:
+        fh.write("v1")
+
+    script = [
+        ("", [("read_file", {"path": f}), ("read_file", {"path": f}), ("list_directory", {"path": f"{base}/work"})]),
+        ("", [("write_file", {"path": f"{base}/work/new.txt", "content": "x"})]),
+        ("", [("read_file", {"path": f}), ("list_directory", {"path": f"{base}/work"})]),
+        ("", [("edit_file", {"path": f, "old_str": "v1", "new_str": "v2"})]),
+        ("", [("read_file", {"path": f})]),
+        ("", [("run_shell", {"command": "true"}), ("list_directory", {"path": f"{base}/work"})]),
+        ("done", []),
+    ]
+    c = Config()
+    c.set("memory.max_conversation_messages", 200)
+    gw = mock_gateway(f"{base}/mem", script, config=c)
+    asyncio.run(gw.handle_message("go", "tc"))
+    results = [
+        b["content"] for m in gw.memory.get_conversation("tc")
+        if isinstance(m["content"], list) for b in m["content"] if b.get("type") == "tool_result"
+    ]
+    assert results[0] == "v1" and results[1].startswith("[cached") and results[1].endswith("v1"), results[:2]
+    ok("Repeated read_file in one turn is served from cache and flagged")
+    assert results[4].startswith("[cached") and "new.txt" in results[5], results[4:6]
+    ok("Writing new.txt keeps the notes.txt read, drops the directory listing")
+    assert results[7] == "v2", results[7]
+    ok("edit_file invalidates the edited path")
+    assert not results[9].startswith("[cached"), results[9]
+    ok("run_shell invalidates everything")
+
+    gw.llm.script = [("", [("read_file", {"path": f})]), ("done", [])]
+    asyncio.run(gw.handle_message("read", "tc2"))
+    with open(f, "w") as fh:
+        fh.write("v3")
+    gw.llm.script = [("", [("read_file", {"path": f})]), ("done", [])]
+    asyncio.run(gw.handle_message("read again", "tc2"))
+    last = [m for m in gw.memory.get_conversation("tc2") if isinstance(m["content"], list)][-1]
+    assert last["content"][0]["content"] == "v3", last
+    ok("Cache is scoped to a single turn")
+
+    async def skill_tool():  # an undecorated skill handler that writes
+        with open(f, "w") as fh:
+            fh.write("v4")
+        return "written"
+
+    gw.tools["skill_tool"] = skill_tool
+    gw.llm.script = [("", [("read_file", {"path": f})]), ("", [("memory", {"action": "recall", "key": "x"})]),
+                     ("", [("read_file", {"path": f})]), ("", [("skill_tool", {})]), ("", [("read_file", {"path": f})]),
+                     ("done", [])]
+    asyncio.run(gw.handle_message("skill", "tc3"))
+    results = [b["content"] for m in gw.memory.get_conversation("tc3")
+               if isinstance(m["content"], list) for b in m["content"] if b.get("type") == "tool_result"]
+    assert results[2].startswith("[cached") and results[4] == "v4", results
+    ok("Undecorated tools invalidate everything; read-only ones like memory don't")
+    shutil.rmtree(base, ignore_errors=True)
+
+
+def test_metrics():
+    section("Turn Metrics")
+    import httpx
+    import shutil
+    from pocketclaw.llm import LLMConnector
+    from pocketclaw.metrics import cost, summarize, token_counts
+    base = "/tmp/pocketclaw_test_metrics"
+    shutil.rmtree(base, ignore_errors=True)
+
+    gw = mock_gateway(base, [("", [("run_shell", {"command": "exit 3"}), ("read_file", {"path": "/nonexistent"})]), ("ok", [])])
+    asyncio.run(gw.handle_message("go", "m1"))
+
+    async def stream():
+        return [c async for c in gw.handle_message_stream("stream", "m1")]
+
+    asyncio.run(stream())
+    records = gw.metrics.tail()
+    assert len(records) == 2, records
+    turn, streamed = records
+    assert {"build", "queue", "save"} <= set(turn["spans"]), turn["spans"]
+    assert len(turn["llm"]) == 2 and streamed["stream"] and "ttft_ms" in streamed["llm"][0], streamed
+    shell, read = turn["tools"]
+    assert shell["exit"] == 3 and not shell["ok"] and not read["ok"], turn["tools"]
+    ok(f"Turn record: spans {sorted(turn['spans'])}, 2 LLM calls, tool exit status")
+
+    st = summarize(records)
+    assert st["turns"] == 2 and st["tools"]["run_shell"]["failed"] == 1 and st["ttft_ms"]["n"] == 1, st
+    ok(f"Summary: turn p50 {st['turn_ms']['p50']}ms, p95 {st['turn_ms']['p95']}ms")
+
+    assert token_counts({"prompt_tokens": 5, "completion_tokens": 2}) == (5, 2)
+    assert abs(cost("anthropic", "claude-sonnet-4-20250514", 1_000_000, 100_000) - 4.5) < 1e-9
+    assert cost("ollama", "llama3", 10, 10) == 0.0 and cost("custom", "mystery", 1, 1) is None
+    ok("Token + cost accounting per provider")
+
+    def handler(request):
+        body = json.loads(request.content)
+        assert body["stream_options"] == {"include_usage": True}
+        return httpx.Response(200, text=(
+            'data: {"choices":[{"delta":{"content":"hi"}}]}\n\n'
+            'data: {"choices":[],"usage":{"prompt_tokens":9,"completion_tokens":1}}\n\n'
+            'data: [DONE]\n\n'
+        ))
+
+    async def openai_stream():
+        llm = LLMConnector({"provider": "openai", "api_key": "x", "model": "gpt-4o"})
+        llm.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        chunks = [c async for c in llm.chat_stream("sys", [{"role": "user", "content": "hey"}])]
+        await llm.close()
+        return chunks
+
+    chunks = asyncio.run(openai_stream())
+    assert chunks[-1]["usage"] == {"prompt_tokens": 9, "completion_tokens": 1}, chunks
+    ok("OpenAI-style stream reports usage")
+    shutil.rmtree(base, ignore_errors=True)
+
+
+def test_llm_cache():
+    section("LLM Response Cache")
+    import httpx
+    import shutil
+    from pocketclaw.llm import LLMConnector
+    base = "/tmp/pocketclaw_test_llmcache"
+    shutil.rmtree(base, ignore_errors=True)
+    hits = {"n": 0}
+
+    def handler(request):
+        hits["n"] += 1
+        body = json.loads(request.content)
+        if body.get("stream"):
+            sse = (
+                'data: {"type":"message_start","message":{"usage":{"input_tokens":12,"output_tokens":1}}}\n\n'
+                'data: {"type":"content_block_delta","delta":{"type":"text_delta","text":"Hel"}}\n\n'
+                'data: {"type":"content_block_delta","delta":{"type":"text_delta","text":"lo"}}\n\n'
+                'data: {"type":"content_block_start","content_block":{"type":"tool_use","id":"t1","name":"battery"}}\n\n'
+                'data: {"type":"content_block_stop"}\n\n'
+                'data: {"type":"message_delta","usage":{"output_tokens":7}}\n\n'
+            )
+            return httpx.Response(200, text=sse)
+        return httpx.Response(200, json={
+            "content": [{"type": "text", "text": f"reply {hits['n']}"}],
+            "usage": {"input_tokens": 10, "output_tokens": 2},
+        })
+
+    def connector(**over):
+        cfg = {"provider": "anthropic", "api_key": "x",
+               "cache": {"enabled": True, "path": f"{base}/llm.db", "max_entries": 2, **over}}
+        llm = LLMConnector(cfg)
+        llm.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return llm
+
+    async def scenario():
+        llm = connector()
+        msgs = [{"role": "user", "content": "status?"}]
+        a = await llm.chat("sys", msgs)
+        b = await llm.chat("sys", msgs)
+        assert a.text == b.text == "reply 1" and hits["n"] == 1, (a.text, b.text, hits)
+        assert b.usage == {"input_tokens": 10, "output_tokens": 2}
+        ok("Identical request served from cache")
+
+        await llm.chat("sys", msgs, cache=False)
+        await llm.chat("sys", msgs + [{"role": "assistant", "content": "x"}])
+        assert hits["n"] == 3, hits
+        ok("Per-call bypass and changed history both miss")
+
+        first = [c async for c in llm.chat_stream("sys", msgs)]
+        second = [c async for c in llm.chat_stream("sys", msgs)]
+        assert hits["n"] == 4 and first[:-1] == second[:-1], (hits, first, second)
+        assert [c["type"] for c in second] == ["text", "text", "tool_calls", "done"]
+        assert second[-1]["cached"] and second[-1]["usage"] == {"input_tokens": 12, "output_tokens": 7}
+        assert second[2]["tool_calls"][0].name == "battery"
+        ok("Streamed reply replays as the same chunk sequence")
+
+        st = llm.cache.stats()
+        assert st["entries"] == 2 and st["evictions"] == 1 and st["hits"] == 2, st
+        ok(f"LRU bound holds ({st['entries']} entries, {st['evictions']} evicted, hit rate {st['hit_rate']:.0%})")
+        await llm.close()
+
+        hot = connector()
+        hot.temperature = 0.9
+        await hot.chat("sys", msgs)
+        await hot.chat("sys", msgs)
+        assert hits["n"] == 6, hits
+        await hot.close()
+        expired = connector(ttl=-1)
+        n = hits["n"]
+        await expired.chat("other", msgs)
+        await expired.chat("other", msgs)
+        assert hits["n"] == n + 2, hits
+        await expired.close()
+        ok("High temperature and expired entries are not replayed")
+
+    asyncio.run(scenario())
+    shutil.rmtree(base, ignore_errors=True)
+
+
+def test_router():
+    section("Model Router")
+    import httpx
+    import shutil
+    from pocketclaw.router import Router
+    base = "/tmp/pocketclaw_test_router"
+    shutil.rmtree(base, ignore_errors=True)
+
+    def reply(text=None, tool=None, args=None, tokens=(100, 10)):
+        content = [{"type": "text", "text": text}] if text else []
+        if tool:
+            content.append({"type": "tool_use", "id": f"tu_{tool}_{len(calls)}", "name": tool, "input": args or {}})
+        return httpx.Response(200, json={"content": content, "usage": {"input_tokens": tokens[0], "output_tokens": tokens[1]}})
+
+    calls = []
+    fast_script, primary_script = [], []
+
+    def fast(request):
+        calls.append("fast")
+        step = fast_script.pop(0)
+        return step if isinstance(step, httpx.Response) else reply(**step)
+
+    def primary(request):
+        calls.append("primary")
+        r = reply(**primary_script.pop(0))
+        if not json.loads(request.content).get("stream"):
+            return r
+        events = []
+        for b in r.json()["content"]:
+            if b["type"] == "text":
+                events.append({"type": "content_block_delta", "delta": {"type": "text_delta", "text": b["text"]}})
+            else:
+                events += [{"type": "content_block_start", "content_block": {"type": "tool_use", "id": b["id"], "name": b["name"]}},
+                           {"type": "content_block_delta", "delta": {"type": "input_json_delta", "partial_json": json.dumps(b["input"])}},
+                           {"type": "content_block_stop"}]
+        return httpx.Response(200, text="".join(f"data: {json.dumps(e)}\n\n" for e in events))
+
+    c = Config()
+    c.set("llm.provider", "anthropic")
+    c.set("llm.api_key", "x")
+    c.set("llm.model", "claude-sonnet-4-20250514")
+    c.set("llm.router.enabled", True)
+    c.set("llm.router.fast", {"provider": "anthropic", "model": "claude-3-5-haiku-latest"})
+    c.set("skills.paths", ["./skills/builtin"])
+    c.set("memory.path", base)
+    c.set("metrics.path", f"{base}/metrics.jsonl")
+    gw = Gateway(c)
+    assert isinstance(gw.llm, Router)
+    gw.llm.fast.client = httpx.AsyncClient(transport=httpx.MockTransport(fast))
+    gw.llm.primary.client = httpx.AsyncClient(transport=httpx.MockTransport(primary))
+
+    fast_script += [{"tool": "run_shell", "args": {"command": "echo ok"}}, {"text": "All done"}]
+    primary_script += [{"text": "Done: ok"}]
+    reply_text = asyncio.run(gw.handle_message("check", "r1"))
+    assert reply_text == "Done: ok" and calls == ["fast", "fast", "primary"], (reply_text, calls)
+    ok("Tool step on the fast model, final reply escalated to primary")
+
+    calls.clear()
+    fast_script += [{"tool": "run_shell", "args": {"command": "exit 1"}}, {"tool": "no_such_tool"},
+                    httpx.Response(500, json={})]
+    primary_script += [{"tool": "run_shell", "args": {"command": "echo fixed"}},
+                       {"tool": "run_shell", "args": {"command": "echo again"}}, {"text": "Recovered"}]
+
+    async def stream():
+        return [ch async for ch in gw.handle_message_stream("retry", "r2")]
+
+    chunks = asyncio.run(stream())
+    assert calls == ["fast", "primary", "fast", "primary", "fast", "primary"], calls
+    assert chunks[-1] == {"type": "text", "text": "Recovered"}, chunks
+    ok("Escalates on tool error, unknown tool and fast-model failure (streaming)")
+
+    st = gw.llm.stats()
+    assert st["fast_calls"] == 2 and st["primary_calls"] == 4, st
+    assert st["escalations"] == {"final_reply": 1, "low_confidence": 1, "fast_error": 1}, st
+    from pocketclaw.metrics import summarize
+    rt = summarize(gw.metrics.tail())["router"]
+    assert rt["fast"] == 2 and rt["primary"] == 4 and rt["escalations"]["tool_error"] == 1, rt
+    assert rt["offloaded_tokens"] == 220, rt
+    ok(f"Savings reported: {rt['offloaded_tokens']} tokens offloaded, escalations {rt['escalations']}")
+    same = summarize(gw.metrics.tail(), {"claude-3-5-haiku": (3.0, 15.0)})["router"]
+    assert same["saved_usd"] <= 0 < rt["saved_usd"], (same, rt)
+    ok("Savings use the configured metrics.prices")
+    asyncio.run(gw.close())
+    shutil.rmtree(base, ignore_errors=True)
+
+
+def test_rate_limit():
+    section("Rate Limiter")
+    import httpx
+    import time
+    from pocketclaw.llm import LLMConnector
+    from pocketclaw.metrics import MetricsLog, summarize
+    from pocketclaw.ratelimit import RateLimiter, _seconds, parse_headers
+
+    assert _seconds("6m0s") == 360 and _seconds("20ms") == 0.02 and _seconds("1.5") == 1.5
+    limits = parse_headers({"x-ratelimit-limit-requests": "500", "x-ratelimit-remaining-requests": "499",
+                            "x-ratelimit-reset-requests": "120ms", "x-ratelimit-limit-tokens": "30000",
+                            "x-ratelimit-remaining-tokens": "29000", "x-ratelimit-reset-tokens": "2s"})
+    assert limits == {"requests": (500, 499, 0.12), "tokens": (30000, 29000, 2.0)}, limits
+    later = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 30))
+    limits = parse_headers({"anthropic-ratelimit-input-tokens-limit": "40000",
+                            "anthropic-ratelimit-input-tokens-remaining": "0",
+                            "anthropic-ratelimit-input-tokens-reset": later})
+    assert limits["tokens"][:2] == (40000, 0) and 28 < limits["tokens"][2] <= 30
+    ok("Parsed OpenAI-style and Anthropic rate-limit headers")
+
+    state = {"active": 0, "peak": 0, "calls": 0, "fail": 0}
+
+    async def handler(request):
+        state["calls"] += 1
+        if state["fail"]:
+            state["fail"] -= 1
+            return httpx.Response(429, headers={"retry-after": "0.05"}, json={"error": "rate limited"})
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.02)
+        state["active"] -= 1
+        headers = {"x-ratelimit-limit-tokens": "100000", "x-ratelimit-remaining-tokens": "90000",
+                   "x-ratelimit-reset-tokens": "6s"}
+        if json.loads(request.content).get("stream"):
+            return httpx.Response(200, headers=headers, text='data: {"choices": [{"delta": {"content": "hi"}}]}\n\ndata: [DONE]\n\n')
+        return httpx.Response(200, headers=headers, json={"choices": [{"message": {"content": "hi"}}]})
+
+    def connector(max_tokens=4096, **rl):
+        llm = LLMConnector({"provider": "openai", "api_key": "x", "model": "gpt-4o",
+                            "max_tokens": max_tokens, "rate_limit": rl})
+        llm.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return llm
+
+    async def run():
+        llm = connector(max_concurrency=3)
+        await asyncio.gather(*(llm.chat("s", [{"role": "user", "content": f"q{i}"}]) for i in range(12)))
+        assert state["peak"] == 3, state
+        rl = llm.rate_limits()["openai/gpt-4o"]
+        assert rl["tokens"]["limit"] == 100000 and rl["inflight"] == 0 and rl["queued"] == 0, rl
+        ok("12 concurrent calls capped at a window of 3; token budget learned from headers")
+
+        state["fail"] = 2
+        t0 = time.monotonic()
+        resp = await llm.chat("s", [{"role": "user", "content": "again"}])
+        assert resp.text == "hi" and resp.throttle["retries"] == 2 and time.monotonic() - t0 >= 0.1, resp.throttle
+        # 3 -> 1.5 -> 1 on the two 429s, then +1 for the success
+        assert llm.limiter.window == 2.0 and llm.limiter.throttled == 2, llm.limiter.window
+        ok(f"429s queued and retried after retry-after ({resp.throttle['wait_ms']:.0f}ms held), window cut and regrowing")
+
+        state["fail"] = 1
+        chunks = [c async for c in llm.chat_stream("s", [{"role": "user", "content": "stream"}])]
+        assert chunks[0]["text"] == "hi" and chunks[-1]["throttle"]["retries"] == 1, chunks
+        ok("Streaming requests are retried the same way")
+
+        state["fail"] = 5
+        try:
+            await connector(max_retries=1).chat("s", [{"role": "user", "content": "x"}])
+            assert False, "should give up"
+        except httpx.HTTPStatusError as e:
+            assert e.response.status_code == 429
+        state["fail"] = 0
+        ok("Gives up after max_retries")
+
+        # A known, nearly spent token budget holds the next call until it refills
+        lim = RateLimiter(tpm=6000)
+        lim.tokens.level = 0
+        llm = connector(max_tokens=10)
+        llm.limiter = lim
+        t0 = time.monotonic()
+        await llm.chat("s", [{"role": "user", "content": "x"}])
+        held = time.monotonic() - t0
+        assert held > 0.2, held
+        ok(f"Token bucket held a call {held * 1000:.0f}ms for its estimated cost")
+
+        tm = MetricsLog(Config()).turn("c", "openai", "gpt-4o")
+        tm.llm(time.monotonic(), {}, throttle={"wait_ms": 120.0, "retries": 1})
+        st = summarize([tm.record()])
+        assert st["throttle"]["retries"] == 1 and st["throttle"]["wait_ms"]["p50"] == 120.0
+        ok("Rate-limit waits and retries reach the metrics summary")
+
+    asyncio.run(run())
+
+
+def test_batch():
+    section("Batch Mode")
+    import shutil
+    from pocketclaw.batch import BatchRunner, load_prompts
+    base = "/tmp/pocketclaw_test_batch"
+    shutil.rmtree(base, ignore_errors=True)
+    os.makedirs(base)
+    src = f"{base}/prompts.jsonl"
+    with open(src, "w") as f:
+        f.write('{"prompt": "one", "id": "a"}\n"two"\n\nthree as text\n')
+        f.write('{"request_id": "r-9", "title": "Four", "body": "details", "conv_id": "default"}\n{"text": "five"}\n')
+    prompts = load_prompts(src)
+    assert [p[0] for p in prompts] == [0, 1, 3, 4, 5] and prompts[3][1] == "Four\n\ndetails", prompts
+    ok("Prompts parsed from objects, strings and text; indices follow lines")
+
+    class Flaky(MockLLM):
+        async def chat(self, system, messages, tools=None, cache=True):
+            await asyncio.sleep(0.01 * (5 - len(messages[-1]["content"]) % 5))
+            if messages[-1]["content"] == "five" and self.fail:
+                raise RuntimeError("provider down")
+            return LLMResponse(f"echo {messages[-1]['content']}")
+
+    gw = mock_gateway(f"{base}/mem")
+    gw.memory.save_conversation("default", [{"role": "user", "content": "keep me"}])
+    gw.llm = Flaky()
+    gw.llm.fail = True
+    runner = BatchRunner(gw, src, parallel=3)
+    st = asyncio.run(runner.run())
+    recs = [json.loads(line) for line in open(f"{base}/prompts.out.jsonl")]
+    assert st["ok"] == 4 and st["failed"] == 1, st
+    assert sorted(r["index"] for r in recs) == [0, 1, 3, 4, 5]
+    assert {r["conv_id"] for r in recs} == {f"batch-prompts-{i}" for i in (0, 1, 3, 4, 5)}
+    byidx = {r["index"]: r for r in recs}
+    assert byidx[0]["id"] == "a" and byidx[4]["request_id"] == "r-9" and byidx[3]["reply"] == "echo three as text"
+    assert not byidx[5]["ok"] and "provider down" in byidx[5]["error"]
+    assert byidx[4]["label"] == "default" and gw.memory.get_conversation("default")[0]["content"] == "keep me"
+    ok(f"Ran 5 prompts 3-wide: {st['ok']} ok, {st['failed']} failed, isolated conversations")
+
+    gw.llm.fail = False
+    st = asyncio.run(BatchRunner(gw, src, parallel=3).run())
+    assert st["skipped"] == 4 and st["ok"] == 1, st
+    recs = [json.loads(line) for line in open(f"{base}/prompts.out.jsonl")]
+    assert recs[-1]["index"] == 5 and recs[-1]["ok"]
+    assert len(gw.memory.get_conversation("batch-prompts-5")) == 2
+    ok("Resume reruns only the failed prompt, from a clean conversation")
+    shutil.rmtree(base, ignore_errors=True)
+
+
+def test_terminal():
+    section("Terminal")
+    import io
+    import httpx
+    import shutil
+    import threading
+    import time
+    from pocketclaw.interfaces.terminal import FrameWriter, TerminalInterface, read_line
+    from pocketclaw.llm import LLMConnector
+    base = "/tmp/pocketclaw_test_terminal"
+    shutil.rmtree(base, ignore_errors=True)
+
+    async def frames():
+        buf = io.StringIO()
+        out = FrameWriter(buf, frame_ms=20)
+        out.write("first ")
+        assert buf.getvalue() == "first ", "first token is written at once"
+        for i in range(300):
+            out.write(f"t{i} ")
+            await asyncio.sleep(0.0005)
+        out.flush()
+        return buf.getvalue(), out.writes
+
+    text, writes = asyncio.run(frames())
+    assert text == "first " + "".join(f"t{i} " for i in range(300))
+    assert writes < 60, writes
+    ok(f"301 streamed deltas rendered in {writes} writes")
+
+    stdin = sys.stdin
+    r, w = os.pipe()
+    sys.stdin = os.fdopen(r)
+    try:
+        # read_line reads sys.stdin, so feed it from the pipe
+        async def feed():
+            asyncio.get_running_loop().call_later(0.2, os.write, w, b"typed slowly\n")
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0.01)
+
+            t = asyncio.create_task(ticker())
+            line = await read_line("")
+            t.cancel()
+            return line, ticks
+
+        line, ticks = asyncio.run(feed())
+    finally:
+        sys.stdin.close()
+        os.close(w)
+        sys.stdin = stdin
+    assert line == "typed slowly" and ticks >= 10, ticks
+    ok(f"Event loop kept running while waiting for input ({ticks} ticks)")
+
+    gw = mock_gateway(f"{base}/mem")
+    seen = []
+    build = gw._build
+    gw._build = lambda conv_id, text: seen.append(conv_id in gw._warm) or build(conv_id, text)
+    stdout, stdin = sys.stdout, sys.stdin
+    sys.stdin, sys.stdout = io.StringIO("hello\n/quit\n"), io.StringIO()
+    try:
+        term = TerminalInterface(gw, gw.config)
+        asyncio.run(term.run())
+        printed = sys.stdout.getvalue()
+    finally:
+        sys.stdout, sys.stdin = stdout, stdin
+    assert "done" in printed and "Bye!" in printed, printed
+    assert seen == [True], seen
+    ok("Terminal turn used the prompt parts and tools built while typing")
+
+    async def slow_prewarm(conv_id):
+        await asyncio.sleep(5)
+
+    gw.prewarm = slow_prewarm
+    sys.stdin, sys.stdout = io.StringIO("hello\nagain\n/quit\n"), io.StringIO()
+    t0 = time.monotonic()
+    try:
+        asyncio.run(TerminalInterface(gw, gw.config).run())
+        printed = sys.stdout.getvalue()
+    finally:
+        sys.stdout, sys.stdin = stdout, stdin
+    elapsed = time.monotonic() - t0
+    readers = [t for t in threading.enumerate() if t.name == "terminal-input"]
+    assert printed.count("done") == 2 and elapsed < 2, (elapsed, printed)
+    assert len(readers) == 1, readers
+    ok(f"Turns don't wait for a slow prewarm ({elapsed:.2f}s); one reader thread serves every prompt")
+
+    heads = []
+
+    def handler(request):
+        heads.append(request.method)
+        return httpx.Response(404)
+
+    async def preconnect():
+        llm = LLMConnector({"provider": "openai", "api_key": "x", "model": "gpt-4o"})
+        llm.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        await llm.preconnect()
+        await llm.preconnect()
+        await llm.close()
+
+    asyncio.run(preconnect())
+    assert heads == ["HEAD"], heads
+    ok("Preconnect opens one connection and skips while it's still alive")
+    shutil.rmtree(base, ignore_errors=True)
+
+
+def test_cancellation():
+    section("Cancellation")
+    import httpx
+    import shutil
+    from pocketclaw.gateway import CANCELLED
+    from pocketclaw.llm import LLMConnector
+    from pocketclaw.tools.builtin import run_shell
+    base = "/tmp/pocketclaw_test_cancel"
+    shutil.rmtree(base, ignore_errors=True)
+    os.makedirs(base)
+
+    def alive(pid):
+        # Orphans nobody reaps linger as zombies; those aren't running
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                return f.read().rsplit(")", 1)[1].split()[0] not in ("Z", "X")
+        except FileNotFoundError:
+            return False
+        except OSError:
+            try:
+                os.kill(pid, 0)
+                return True
+            except ProcessLookupError:
+                return False
+
+    # Grandchildren ignoring SIGTERM: the shell, a background sleep, and a
+    # nested shell with its own sleep
+    tree = (f"trap '' TERM; sleep 60 & echo $! >> {base}/pids; "
+            f"sh -c 'trap \"\" TERM; sleep 60 & echo $! >> {base}/pids; wait' & wait")
+
+    result = asyncio.run(run_shell(tree, timeout=0.5))
+    pids = [int(p) for p in open(f"{base}/pids").read().split()]
+    assert result == "Error: command timed out" and len(pids) == 2, (result, pids)
+    time.sleep(0.1)
+    assert not any(alive(p) for p in pids), [p for p in pids if alive(p)]
+    ok("Timed-out command: whole process tree killed, TERM-ignoring grandchildren included")
+    os.remove(f"{base}/pids")
+
+    gw = mock_gateway(f"{base}/mem", [("", [("run_shell", {"command": tree}), ("read_file", {"path": "/etc/hostname"})])])
+
+    async def cancel_during_tool():
+        seen = []
+
+        async def consume():
+            async for chunk in gw.handle_message_stream("start it", "c1"):
+                seen.append(chunk["type"])
+
+        task = asyncio.create_task(consume())
+        while not os.path.exists(f"{base}/pids") or len(open(f"{base}/pids").read().split()) < 2:
+            await asyncio.sleep(0.02)
+        task.cancel()
+        try:
+            await task
+            assert False, "should be cancelled"
+        except asyncio.CancelledError:
+            pass
+        return seen
+
+    t0 = time.monotonic()
+    seen = asyncio.run(cancel_during_tool())
+    elapsed = time.monotonic() - t0
+    pids = [int(p) for p in open(f"{base}/pids").read().split()]
+    time.sleep(0.1)
+    assert not any(alive(p) for p in pids), [p for p in pids if alive(p)]
+    assert seen == ["tool_call"] and elapsed < 5, (seen, elapsed)
+    ok(f"Cancelled turn left no orphan processes ({len(pids)} grandchildren killed, {elapsed:.1f}s)")
+
+    history = gw.memory.get_conversation("c1")
+    assert [m["role"] for m in history] == ["user", "assistant", "user", "assistant"], history
+    results = history[2]["content"]
+    assert [r["content"] for r in results] == [CANCELLED, CANCELLED]
+    assert {r["tool_use_id"] for r in results} == {b["id"] for b in history[1]["content"]}
+    assert history[3]["content"] == CANCELLED
+    assert asyncio.run(gw.handle_message("still there?", "c1")) == "done"
+    ok("Partial history saved with a result for every tool call; conversation continues")
+
+    class SlowStream(MockLLM):
+        async def chat_stream(self, system, messages, tools=None, cache=True):
+            for word in ("partial ", "answer ", "never ", "finished"):
+                yield {"type": "text", "text": word}
+                await asyncio.sleep(0.05)
+            yield {"type": "done", "text": ""}
+
+    gw.llm = SlowStream()
+
+    async def close_early():
+        stream = gw.handle_message_stream("talk", "c2")
+        async for chunk in stream:
+            if chunk["text"] == "answer ":
+                break
+        await stream.aclose()
+
+    asyncio.run(close_early())
+    assert gw.memory.get_conversation("c2")[-1]["content"] == f"partial answer \n\n{CANCELLED}"
+    ok("Consumer closing the stream keeps the text already shown")
+
+    closed = []
+
+    class Endless(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            yield b'data: {"choices": [{"delta": {"content": "hi"}}]}\n\n'
+            await asyncio.sleep(60)
+
+        async def aclose(self):
+            closed.append(True)
+
+    async def abort_http():
+        llm = LLMConnector({"provider": "openai", "api_key": "x", "model": "gpt-4o"})
+        llm.client = httpx.AsyncClient(transport=httpx.MockTransport(lambda r: httpx.Response(200, stream=Endless())))
+        gw.llm = llm
+
+        async def consume():
+            async for _ in gw.handle_message_stream("hello", "c3"):
+                pass
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.2)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return llm.limiter.inflight
+
+    inflight = asyncio.run(abort_http())
+    assert closed and inflight == 0, (closed, inflight)
+    assert gw.memory.get_conversation("c3")[-1]["content"] == f"hi\n\n{CANCELLED}"
+    ok("Cancel aborts the provider HTTP stream and frees its rate-limit slot")
+    shutil.rmtree(base, ignore_errors=True)
+
+
+def test_compaction():
+    section("Compaction")
+    import shutil
+    from pocketclaw.compaction import Compactor
+
+    def history(rounds, tool="list_directory"):
+        msgs = [{"role": "user", "content": "go"}]
+        for i in range(rounds):
+            msgs.append({"role": "assistant", "content": [{"type": "tool_use", "id": f"t{i}", "name": tool, "input": {}}]})
+            msgs.append({"role": "user", "content": [{"type": "tool_result", "tool_use_id": f"t{i}", "content": f"{i}:" + "x" * 5000}]})
+        return msgs
+
+    c = Compactor(keep_iterations=4, max_chars=2000, excerpt_chars=600)
+    msgs = history(10)
+    sent, saved = c.compact(msgs)
+    sizes = [len(m["content"][0]["content"]) for m in sent[2::2]]
+    assert all(n < 700 for n in sizes[:4]) and all(n > 5000 for n in sizes[4:]), sizes
+    assert sent[2]["content"][0]["content"].startswith("0:xx") and "elided" in sent[2]["content"][0]["content"]
+    assert len(msgs[2]["content"][0]["content"]) > 5000 and saved == sum(5002 - n for n in sizes[:4])
+    ok(f"Results older than the kept rounds cut to head/tail excerpts ({saved} chars saved)")
+
+    # Between steps of the cut-off, each request extends the last one
+    prev, changed = None, 0
+    for n in range(1, 13):
+        sent, _ = c.compact(history(n))
+        assert c.compact(history(n)) == (sent, _)
+        if prev is not None and sent[:len(prev)] != prev:
+            changed += 1
+        prev = sent
+    assert changed == 2, changed
+    ok("Deterministic, and the sent prefix changes only when the cut-off steps (2 of 11 rounds)")
+
+    msgs = history(10, tool="screen_read")
+    sent, _ = c.compact(msgs)
+    results = [m["content"][0]["content"] for m in sent[2::2]]
+    assert all(r.startswith("[screen_read output superseded") for r in results[:3]), results[:3]
+    assert results[3].startswith("3:xx") and "elided" in results[3], "last stale snapshot excerpted"
+    assert sent[10:] == msgs[10:], "recent snapshots untouched"
+    prev, changed = None, 0
+    for n in range(1, 13):
+        sent, _ = c.compact(history(n, tool="screen_wait"))
+        if prev is not None and sent[:len(prev)] != prev:
+            changed += 1
+        prev = sent
+    assert changed == 2, changed
+    ok("Superseded screen snapshots past the cut-off collapse, without breaking the cached prefix")
+
+    base = "/tmp/pocketclaw_test_compaction"
+    shutil.rmtree(base, ignore_errors=True)
+    script = [("", [("big", {"n": i})]) for i in range(8)]
+    gw = mock_gateway(base, script)
+    seen = []
+
+    async def big(n):
+        return f"{n}:" + "y" * 8000
+
+    def record(chat):
+        async def wrapped(system, messages, tools=None, cache=True):
+            seen.append(sum(len(str(m["content"])) for m in messages))
+            return await chat(system, messages, tools, cache)
+        return wrapped
+
+    gw.tools["big"] = big
+    gw.llm.chat = record(gw.llm.chat)
+    assert asyncio.run(gw.handle_message("go", "cmp")) == "done"
+    stored = gw.memory.get_conversation("cmp")
+    assert all(len(m["content"][0]["content"]) > 8000 for m in stored[2:-1:2]), "history kept in full"
+    elided = gw.metrics.tail()[-1]["elided_tokens"]
+    assert elided > 0 and seen[-1] < 8 * 8000, (elided, seen)
+    ok(f"Gateway sends compacted context, stores full history ({elided} input tokens saved this turn)")
+    shutil.rmtree(base, ignore_errors=True)
+
+
+def test_jobs():
+    section("Scheduled Jobs")
+    import shutil
+    from datetime import datetime
+    from pocketclaw.jobs import Cron, JobScheduler, parse_interval
+    from pocketclaw.supervisor import WAKE_LOCK
+    base = "/tmp/pocketclaw_test_jobs"
+    shutil.rmtree(base, ignore_errors=True)
+    os.makedirs(f"{base}/skills")
+
+    assert parse_interval("1h30m") == 5400 and parse_interval(90) == 90
+    t = datetime(2026, 3, 4, 10, 7).timestamp()  # a Wednesday
+    assert datetime.fromtimestamp(Cron("*/15 * * * *").next(t)) == datetime(2026, 3, 4, 10, 15)
+    assert datetime.fromtimestamp(Cron("0 9 * * 1").next(t)) == datetime(2026, 3, 9, 9, 0)
+    assert datetime.fromtimestamp(Cron("30 6 1 */3 *").next(t)) == datetime(2026, 4, 1, 6, 30)
+    ok("Intervals and cron expressions parse; next run times are right")
+
+    with open(f"{base}/skills/widgets.md", "w") as f:
+        f.write("""---
+name: widgets
+tools: []
+schedule:
+  - name: prices
+    every: 10m
+    window: 5m
+    prompt: refresh prices
+  - name: news
+    every: 10m
+    window: 5m
+    command: "echo news >> %s/ran"
+  - name: backup
+    every: 1h
+    window: 1m
+    on_low_battery: run
+    command: "exit 3"
+---
+""" % base)
+    c = Config()
+    c.set("jobs.state", f"{base}/jobs.json")
+    gw = mock_gateway(f"{base}/mem", config=c)
+    skills = Config()
+    skills.set("skills.paths", [f"{base}/skills"])
+    gw.skills = SkillLoader(skills)
+
+    now = [1_000_000.0]
+    battery = [(80, False)]
+
+    async def read_battery():
+        return battery[0]
+
+    commands, held = [], []
+    WAKE_LOCK.release(force=True)  # left over from earlier turns' event loops
+    WAKE_LOCK.enabled, WAKE_LOCK.run, WAKE_LOCK.linger = True, commands.append, 0.05
+    chat = gw.llm.chat
+
+    async def watch(*a, **kw):
+        held.append(WAKE_LOCK.held)
+        return await chat(*a, **kw)
+
+    gw.llm.chat = watch
+
+    async def scenario():
+        js = JobScheduler(gw, c, battery=read_battery, clock=lambda: now[0])
+        ids = {j.id: j for j in js.jobs}
+        assert sorted(ids) == ["widgets/backup", "widgets/news", "widgets/prices"], ids
+        st = js.state
+        st["widgets/news"]["due"] = now[0] + 120
+        st["widgets/backup"]["due"] = now[0] + 3600
+        # prices: due now, deadline +300; news: due +120 -> shares the wakeup
+        assert js.next_wakeup() == now[0] + 300
+        now[0] += 300
+        ran = await js.run_due()
+        await asyncio.sleep(0.2)
+        return js, ran
+
+    try:
+        js, ran = asyncio.run(scenario())
+    finally:
+        WAKE_LOCK._pool.submit(lambda: None).result()
+        WAKE_LOCK.enabled, WAKE_LOCK.linger = False, 10
+    assert sorted(ran) == ["widgets/news", "widgets/prices"] and js.wakeups == 1, ran
+    assert open(f"{base}/ran").read() == "news\n"
+    assert held == [True] and commands == ["termux-wake-lock", "termux-wake-unlock"], (held, commands)
+    ok("Jobs due within a window share one wakeup; wake lock held only while they run")
+
+    assert "job-widgets_prices" in gw.memory.backend.list(), gw.memory.backend.list()
+    gw.memory.clear_conversations()
+    assert gw.memory.backend.list() == [], gw.memory.backend.list()
+    ok("Prompt jobs keep a flat conversation id, so clearing conversations removes them")
+
+    st = js.state
+    assert st["widgets/prices"]["due"] == 1_000_000.0 + 600 and st["widgets/news"]["due"] == 1_000_000.0 + 720
+    # Asleep for 5 hours: each job runs once and skips the runs it missed
+    now[0] += 5 * 3600
+
+    async def later():
+        return await js.run_due()
+
+    ran = asyncio.run(later())
+    assert sorted(ran) == ["widgets/backup", "widgets/news", "widgets/prices"], ran
+    assert st["widgets/prices"]["missed"] == 29 and st["widgets/prices"]["runs"] == 2, st["widgets/prices"]
+    assert st["widgets/prices"]["due"] > now[0] and st["widgets/backup"]["last_error"] == "exit code 3"
+    ok(f"Missed runs caught up once ({st['widgets/prices']['missed']} skipped); failures recorded")
+
+    js2 = JobScheduler(gw, c, battery=read_battery, clock=lambda: now[0])
+    assert js2.state == json.loads(open(f"{base}/jobs.json").read()) == st
+    ok("Job state persisted across restarts")
+
+    battery[0] = (12, False)
+    now[0] = st["widgets/news"]["due"] + 1
+    st["widgets/backup"]["due"] = now[0]
+    ran = asyncio.run(later())
+    assert ran == ["widgets/backup"], ran
+    assert st["widgets/prices"]["deferred"] == 1 and st["widgets/prices"]["due"] == st["widgets/prices"]["last_run"] + 2400
+    battery[0] = (12, True)
+    now[0] += 1
+    assert sorted(asyncio.run(later())) == [], "deferred until backoff, even once plugged in"
+    now[0] = st["widgets/prices"]["due"]
+    assert "widgets/prices" in asyncio.run(later())
+    ok("Low battery defers jobs to backoff x period; on_low_battery: run jobs still run")
+
+    # Two schedulers on one state file, each running a different job
+    battery[0] = (80, True)
+    a, b = (JobScheduler(gw, c, battery=read_battery, clock=lambda: now[0]) for _ in range(2))
+    runs = {j: a.state[j]["runs"] for j in ("widgets/backup", "widgets/news")}
+    a.state["widgets/backup"]["due"] = b.state["widgets/news"]["due"] = now[0]
+    assert asyncio.run(a.run_due()) == ["widgets/backup"] and asyncio.run(b.run_due()) == ["widgets/news"]
+    disk = json.loads(open(f"{base}/jobs.json").read())
+    assert disk["widgets/backup"]["runs"] == runs["widgets/backup"] + 1, disk["widgets/backup"]
+    assert disk["widgets/news"]["runs"] == runs["widgets/news"] + 1, disk["widgets/news"]
+    ok("Saves from two schedulers merge per job instead of overwriting each other")
+    shutil.rmtree(base, ignore_errors=True)
+
+
+def test_macros():
+    section("Macros")
+    import shutil
+    base = "/tmp/pocketclaw_test_macros"
+    shutil.rmtree(base, ignore_errors=True)
+    c = Config()
+    c.set("macros.path", f"{base}/macros.json")
+    c.set("macros.guard_timeout", 0.5)
+    c.set("macros.poll_ms", 20)
+    # A phone with a banking app: home -> app -> balance screen
+    screens = {"home": ["Bank", "Camera"], "app": ["Balance", "Transfer"], "pin": ["PIN"], "balance": ["£1,234.56"]}
+    phone = {"screen": "home", "typed": [], "loading": 0}
+
+    async def screen_read():
+        if phone["loading"]:
+            phone["loading"] -= 1
+            return json.dumps({"elements": []})
+        return json.dumps({"elements": [{"text": t, "description": ""} for t in screens[phone["screen"]]]})
+
+    async def screen_tap_element(text, element_type=None, index=0):
+        if text not in screens[phone["screen"]]:
+            return f"Error: element '{text}' not found on screen"
+        phone["screen"] = {"Bank": "app", "Balance": "pin"}.get(text, phone["screen"])
+        return f"Tapped '{text}'"
+
+    async def screen_type_text(text, clear_first=False):
+        phone["typed"].append(text)
+        phone["screen"] = "balance"
+        return f"Typed: {text}"
+
+    script = [
+        ("", [("screen_read", {})]), ("", [("screen_tap_element", {"text": "Bank"})]),
+        ("", [("screen_read", {})]), ("", [("screen_tap_element", {"text": "Balance"})]),
+        ("", [("screen_type_text", {"text": "1234"})]), ("", [("screen_read", {})]),
+        ("Your balance is £1,234.56", []),
+        ("", [("macro", {"action": "save", "name": "balance", "params": {"pin": "1234"}, "description": "read bank balance"})]),
+    ]
+    gw = mock_gateway(f"{base}/mem", script, config=c)
+    gw.tools.update(screen_read=screen_read, screen_tap_element=screen_tap_element, screen_type_text=screen_type_text)
+
+    async def turns():
+        first = await gw.handle_message("what's my bank balance?", "m")
+        calls = gw.llm.calls
+        await gw.handle_message("save that as a macro", "m")
+        return first, calls
+
+    first, calls = asyncio.run(turns())
+    steps = gw.macros.macros["balance"]["steps"]
+    assert [(s["tool"], s["args"].get("text"), s.get("expect")) for s in steps] == [
+        ("screen_tap_element", "Bank", ["Bank"]), ("screen_tap_element", "Balance", ["Balance"]),
+        ("screen_type_text", "{pin}", None), ("screen_read", None, None)], steps
+    assert calls == 7 and "macro" in [d["name"] for d in gw.get_tool_definitions()]
+    ok(f"Recorded a {calls - 1}-step turn as a macro with a {{pin}} parameter")
+
+    gw2 = mock_gateway(f"{base}/mem", [("", [("macro", {"action": "run", "name": "balance", "params": {"pin": "9999"}})])], config=c)
+    gw2.tools.update(screen_read=screen_read, screen_tap_element=screen_tap_element, screen_type_text=screen_type_text)
+    phone.update(screen="home", loading=3)
+    assert "'balance'" in [d for d in gw2.get_tool_definitions() if d["name"] == "macro"][0]["description"]
+    assert asyncio.run(gw2.handle_message("bank balance please", "m2")) == "done"
+    result = gw2.memory.get_conversation("m2")[2]["content"][0]["content"]
+    assert gw2.llm.calls == 2 and phone["typed"][-1] == "9999" and "1,234.56" in result, (gw2.llm.calls, result)
+    assert "9999" not in result
+    ok("Replayed from disk in one tool call (2 LLM calls instead of 7), waiting out a loading screen")
+
+    phone.update(screen="home", loading=0)
+    screens["app"] = ["Accounts", "Payments"]  # the app was redesigned
+    result = asyncio.run(gw2.macros.replay("balance", {"pin": "1"}, gw2.tools))
+    assert result.startswith("Error: macro 'balance' stopped at step 2/4: 'Balance' not on screen"), result
+    assert "Steps 1-1 done" in result and "Payments" in result
+    assert gw2.macros.macros["balance"]["fallbacks"] == 1
+    ok("A failed guard stops the replay and hands the current screen to the LLM")
+
+    from pocketclaw.macros import Trace
+    tr = Trace()
+    tr.add("run_shell", {"command": "cp /sdcard/file5.txt /sdcard/backup"}, "[exit code: 0]")
+    tr.add("screen_type_text", {"text": "volume 5"}, "Typed")
+    gw2.macros.record("vol", tr, params={"level": "5"})
+    assert gw2.macros.macros["vol"]["steps"][0]["args"]["command"] == "cp /sdcard/file5.txt /sdcard/backup"
+    assert gw2.macros.macros["vol"]["steps"][1]["args"]["text"] == "volume {level}"
+    assert gw2.macros.record("bad", tr, params={"x": "7"}).startswith("Error: param 'x' value '7' isn't a whole word")
+    ok("Parameters replace whole words only; a value found nowhere is rejected")
+
+    from pocketclaw.macros import MacroStore
+    other = MacroStore(c)  # another process, loaded before the saves below
+    gw2.macros.record("vol2", tr, params={"level": "5"})
+    other.record("vol3", tr, params={"level": "5"})
+    asyncio.run(other.handle_tool(None, {}, "delete", "vol2"))
+    gw2.macros.record("vol4", tr, params={"level": "5"})
+    assert sorted(MacroStore(c).macros) == ["balance", "vol", "vol3", "vol4"], sorted(MacroStore(c).macros)
+    ok("Concurrent stores merge saves and deletes under the lock")
+
+    ran = []
+
+    async def run_shell(command, timeout=None):
+        ran.append(command)
+        return "[exit code: 0]"
+
+    gw2.tools["run_shell"] = run_shell
+    gw2.tools["screen_type_text"] = screen_type_text
+    gw2.llm.script = [("", [("macro", {"action": "run", "name": "vol", "params": '{"level": "9"}'})]), ("ok", [])]
+    gw2.llm.calls = 0
+    asyncio.run(gw2.handle_message("set volume", "m3"))
+    result = gw2.memory.get_conversation("m3")[2]["content"][0]["content"]
+    assert result.startswith("Error: macro 'vol' needs the user's confirmation for: run_shell") and not ran, result
+    gw2.llm.script = [("", [("macro", {"action": "run", "name": "vol", "params": '{"level": "9"}', "confirmed": True})]),
+                      ("ok", [])]
+    gw2.llm.calls = 0
+    asyncio.run(gw2.handle_message("yes, go ahead", "m3"))
+    assert ran and phone["typed"][-1] == "volume 9", (ran, phone["typed"])
+    tools = [t["name"] for t in gw2.metrics.tail(1)[0]["tools"]]
+    assert tools == ["run_shell", "screen_type_text", "macro"], tools
+    ok("Shell steps need confirmed=true; JSON-string params; steps run through the gateway and show in metrics")
+    shutil.rmtree(base, ignore_errors=True)
+
+
+def test_screen_wait():
+    section("Screen Wait")
+    from pocketclaw.tools import screen
+    frames, acts, reads = [], [], []
+
+    async def fake_read():
+        reads.append(time.monotonic())
+        texts = frames.pop(0) if len(frames) > 1 else frames[0]
+        return json.dumps({"elements": [{"text": t, "description": ""} for t in texts]})
+
+    async def fake_activity():
+        return acts.pop(0) if len(acts) > 1 else acts[0]
+
+    real = screen.screen_read, screen.current_activity
+    screen.screen_read, screen.current_activity = fake_read, fake_activity
+    try:
+        frames[:] = [["Loading"]] * 3 + [["Inbox", "Compose"]]
+        result = asyncio.run(screen.screen_wait(text="inbox", timeout=5))
+        assert result.startswith("Condition met") and "(4 polls)" in result and "Compose" in result, result
+        ok("text: returns with the screen as soon as the element shows")
+
+        frames[:] = [["Loading", "Feed"]] * 2 + [["Feed"]]
+        assert "(3 polls)" in asyncio.run(screen.screen_wait(gone="Loading", timeout=5))
+        ok("gone: returns once the element disappears")
+
+        reads.clear()
+        acts[:] = ["com.launcher/.Home"] * 4 + ["com.bank/.Main"]
+        frames[:] = [["Balance"]]
+        result = asyncio.run(screen.screen_wait(activity="changed", text="Balance", timeout=5))
+        assert "Activity: com.bank/.Main" in result and len(reads) == 1, (result, len(reads))
+        ok("activity: polls the cheap window probe, dumps the UI tree once")
+
+        frames[:] = [["a"], ["b"], ["c"], ["d"]]
+        t0 = time.monotonic()
+        result = asyncio.run(screen.screen_wait(stable_ms=300, timeout=5))
+        elapsed = time.monotonic() - t0
+        assert result.startswith("Condition met") and 0.55 <= elapsed < 1.2, (result, elapsed)
+        ok(f"stable_ms: waits for the UI to settle ({elapsed:.2f}s)")
+
+        reads.clear()
+        frames[:] = [["Spinner"]]
+        result = asyncio.run(screen.screen_wait(text="Done", timeout=2))
+        gaps = [b - a for a, b in zip(reads, reads[1:])]
+        assert result.startswith("Error: screen_wait timed out") and "Spinner" in result, result
+        assert len(reads) <= 8 and gaps[-1] > 3 * gaps[0], (len(reads), gaps)
+        ok(f"Timeout returns the last screen; backoff kept it to {len(reads)} reads in 2s")
+    finally:
+        screen.screen_read, screen.current_activity = real
+
+
+def test_pipeline():
+    section("Pipelines")
+    import shutil
+    from pocketclaw.jsonpath import json_path
+    from pocketclaw.pipeline import Pipeline, PipelineError
+    base = "/tmp/pocketclaw_test_pipeline_dag"
+    shutil.rmtree(base, ignore_errors=True)
+    os.makedirs(base)
+
+    data = {"items": [{"name": "a", "n": 1}, {"name": "b", "n": 2}]}
+    assert json_path(data, "$.items[1].name") == "b" and json_path(data, "$.items[*].n") == [1, 2]
+    assert json_path(data, "$['items'][0]") == {"name": "a", "n": 1}
+    for steps, err in (([{"id": "x", "tool": "t", "args": {"a": "{{y}}"}}, {"id": "y", "tool": "t", "args": {"a": "{{x}}"}}], "cycle"),
+                       ([{"id": "x", "tool": "t", "args": {"a": "{{nope}}"}}], "unknown step")):
+        try:
+            Pipeline(steps)
+            assert False, err
+        except PipelineError as e:
+            assert err in str(e), e
+    ok("JSONPath subset; cycles and unknown references rejected up front")
+
+    steps = [
+        {"id": "fetch", "tool": "run_shell", "args": {"command": "echo '" + json.dumps(data) + "'"}},
+        {"id": "name", "tool": "run_python", "args": {"code": "print({{fetch | json: $.items[1].name | py}}.upper())"}},
+        {"id": "count", "tool": "run_shell", "args": {"command": "sleep 0.3; echo {{fetch | re: \"n\": (\\d+) | shell}}"}},
+        {"id": "slow", "tool": "run_shell", "args": {"command": "sleep 0.3; echo ok"}},
+        {"id": "save", "tool": "write_file", "args": {"path": f"{base}/out.txt", "content": "{{name}}-{{count}}"}},
+    ]
+    gw = mock_gateway(f"{base}/mem", [("", [("pipeline", {"steps": steps, "output": ["save", "slow"]})])])
+    t0 = time.monotonic()
+    assert asyncio.run(gw.handle_message("fetch and save", "p")) == "done"
+    elapsed = time.monotonic() - t0
+    result = gw.memory.get_conversation("p")[2]["content"][0]["content"]
+    assert open(f"{base}/out.txt").read() == "B-1", "outputs piped without status or exit-code lines"
+    assert result.startswith("Pipeline: 5/5 steps ok") and "[save]" in result and "[fetch]" not in result, result
+    assert gw.llm.calls == 2 and elapsed < 1.5, (gw.llm.calls, elapsed)
+    ok(f"5-step DAG in one tool call, parallel branches ({elapsed:.2f}s), only selected outputs returned")
+
+    steps = [
+        {"id": "bad", "tool": "run_shell", "args": {"command": "exit 2"}},
+        {"id": "after", "tool": "write_file", "args": {"path": f"{base}/never.txt", "content": "{{bad}}"}},
+        {"id": "other", "tool": "run_shell", "args": {"command": "echo fine"}},
+        {"id": "missing", "tool": "run_shell", "args": {"command": "echo {{other | re: nothing(here) | shell}}"}},
+    ]
+    result = asyncio.run(gw._handle_pipeline(steps))
+    assert result.startswith("Error: Pipeline: 1/4 steps ok, 2 failed, 1 skipped"), result
+    assert "[bad]" in result and "[exit code: 2]" in result and "matched nothing" in result
+    assert not os.path.exists(f"{base}/never.txt")
+    ok("A failed step skips its dependents; independent branches still run")
+
+    evil = "x'; touch " + base + "/pwned; echo '"
+    steps = [
+        {"id": "page", "tool": "run_python", "args": {"code": f"print({evil!r})"}},
+        {"id": "sh", "tool": "run_shell", "args": {"command": "echo {{page | shell}}"}},
+        {"id": "py", "tool": "run_python", "args": {"code": "print(len({{page | py}}))"}},
+    ]
+    result = asyncio.run(gw._handle_pipeline(steps))
+    assert not os.path.exists(f"{base}/pwned") and evil in result and f"\n{len(evil)}" in result, result
+    try:
+        Pipeline([{"id": "a", "tool": "run_shell", "args": {"command": "echo hi"}},
+                  {"id": "b", "tool": "run_shell", "args": {"command": "echo {{a}}"}}])
+        assert False, "raw reference in a command accepted"
+    except PipelineError as e:
+        assert "need | shell" in str(e), e
+    pipe = Pipeline([{"id": "get", "tool": "http_request", "args": {"url": "http://x"}},
+                     {"id": "use", "tool": "write_file", "args": {"path": "p", "content": "{{get | json: $.a}}"}}])
+    assert pipe.steps["get"]["args"]["max_chars"] > 100000
+    ok("Outputs are quoted into commands and code; piped http_request output isn't truncated")
+
+    with open(f"{base}/in.txt", "w") as fh:
+        fh.write("hello world\n")
+    read = ("read_file", {"path": f"{base}/in.txt"})
+    steps = [{"id": "a", "tool": "read_file", "args": read[1]},
+             {"id": "w", "tool": "write_file", "args": {"path": f"{base}/copy.txt", "content": "{{a}}"}}]
+    gw = mock_gateway(f"{base}/mem", [("", [read]), ("", [read]), ("", [("pipeline", {"steps": steps})])])
+    asyncio.run(gw.handle_message("copy it", "cached"))
+    msgs = gw.memory.get_conversation("cached")
+    assert open(f"{base}/copy.txt").read() == "hello world\n", open(f"{base}/copy.txt").read()
+    assert msgs[4]["content"][0]["content"].startswith("[cached:"), "the model still sees the cache flag"
+    ok("A cache hit inside a pipeline pipes the raw output; only the transcript is flagged")
+    shutil.rmtree(base, ignore_errors=True)
+
+
+def test_file_edits():
+    section("Large File Edits")
+    import shutil
+    from pocketclaw.tools import builtin, files
+    base = "/tmp/pocketclaw_test_file_edits"
+    shutil.rmtree(base, ignore_errors=True)
+    os.makedirs(base)
+    f = f"{base}/big.txt"
+    lines = [f"line {i:06d}\r\n" for i in range(100000)]
+    with open(f, "w", newline="") as fh:
+        fh.writelines(lines)
+    os.chmod(f, 0o640)
+
+    # Tiny chunks so every match crosses a chunk boundary somewhere
+    edits = [{"old_str": "line 000000", "new_str": "first"}, {"old_str": "line 050000\r\nline 050001", "new_str": "mid"},
+             {"old_str": "line 099999\r\n", "new_str": "last\n"}]
+    files.stream_edit(f, edits, chunk=7)
+    expect = "".join(lines).replace("line 000000", "first").replace("line 050000\r\nline 050001", "mid")
+    expect = expect.replace("line 099999\r\n", "last\n")
+    assert open(f, newline="").read() == expect, "edits applied, CRLF kept"
+    assert os.stat(f).st_mode & 0o777 == 0o640, "file mode kept"
+    ok("Batch of edits in one streaming pass, matches across chunk boundaries")
+
+    before = open(f, newline="").read()
+    result = asyncio.run(builtin.edit_file(f, edits=[{"old_str": "first", "new_str": "x"}, {"old_str": "line 00001", "new_str": "y"}]))
+    assert result.startswith("Error: edit 2: old_str found 10 times"), result
+    assert open(f, newline="").read() == before and os.listdir(base) == ["big.txt"], "all or nothing, temp file removed"
+    result = asyncio.run(builtin.edit_file(f, "nope", "x"))
+    assert result == "Error: old_str not found in file", result
+    result = asyncio.run(builtin.edit_file(f, "first", "zeroth", edits='[{"old_str": "mid", "new_str": "middle"}]'))
+    assert result == "File edited successfully (2 edits)", result
+    assert open(f, newline="").read().startswith("zeroth") and "middle" in open(f).read()
+    ok("A failed edit leaves the file untouched; old_str/new_str combine with edits")
+
+    g = f"{base}/gen.txt"
+    assert asyncio.run(builtin.write_file(g, "a\n")).startswith("Written")
+    assert asyncio.run(builtin.write_file(g, "b\n", mode="append")).startswith("Appended")
+    assert open(g).read() == "a\nb\n"
+    os.chmod(g, 0o750)
+    with open(g + ".part", "w") as fh:
+        fh.write("abandoned stream\n")
+    assert asyncio.run(builtin.write_file(g, "x", mode="stream")).startswith("Error: mode 'stream' needs piece")
+    for i in range(3):
+        asyncio.run(builtin.write_file(g, f"part {i}\n", mode="stream", piece=i + 1))
+        assert open(g).read() == "a\nb\n", "target unchanged until done"
+    assert asyncio.run(builtin.write_file(g, "end\n", mode="stream", piece=4, done=True)) == f"Written 25 bytes to {g}"
+    assert open(g).read() == "part 0\npart 1\npart 2\nend\n" and not os.path.exists(g + ".part")
+    assert os.stat(g).st_mode & 0o777 == 0o750, oct(os.stat(g).st_mode)
+    assert asyncio.run(builtin.write_file(g, "x", mode="stream", piece=2)).startswith("Error: no stream started")
+    ok("Append mode; stream mode starts clean at piece 1 and moves the file into place (mode kept) on done")
+    shutil.rmtree(base, ignore_errors=True)
+
+
+def test_search_files():
+    section("File Search")
+    import shutil
+    from pocketclaw.tools import builtin, search
+    base = "/tmp/pocketclaw_test_search"
+    shutil.rmtree(base, ignore_errors=True)
+    for d in ("src/pkg", "node_modules/lib", "build", "logs"):
+        os.makedirs(f"{base}/{d}")
+    files = {
+        ".gitignore": "build/\n*.log\n!keep.log\n",
+        "src/a.py": "import os\n\ndef target():\n    return 1\n",
+        "src/pkg/b.py": "x = 1\n# target one\ny = 2\n# target two\n",
+        "src/pkg/.gitignore": "gen_*.py\n",
+        "src/pkg/gen_c.py": "target = 'generated'\n",
+        "node_modules/lib/d.js": "target()\n",
+        "build/e.py": "target\n",
+        "logs/run.log": "target\n",
+        "logs/keep.log": "first\ntarget in log\n",
+    }
+    for name, text in files.items():
+        with open(f"{base}/{name}", "w") as f:
+            f.write(text)
+    with open(f"{base}/src/blob.bin", "wb") as f:
+        f.write(b"\0\1target\0")
+
+    result = json.loads(asyncio.run(builtin.search_files("target", base)))
+    paths = [m["path"] for m in result["matches"]]
+    assert paths == ["src/pkg/b.py", "src/pkg/b.py", "logs/keep.log", "src/a.py"], paths
+    first = result["matches"][0]
+    assert first == {"path": "src/pkg/b.py", "line": 2, "text": "# target one", "before": ["x = 1"], "after": ["y = 2", "# target two"]}, first
+    assert result["matches"][3]["line"] == 3 and result["matches"][3]["before"] == ["import os", ""]
+    assert result["searched"] == 6 and not result["truncated"], result
+    ok("Honours nested .gitignore (with negation) and default ignores, skips binaries, ranks by matches")
+
+    result = json.loads(asyncio.run(builtin.search_files("^def \\w+\\(", base, glob="*.py", context=0)))
+    assert [(m["path"], m["text"], m["before"]) for m in result["matches"]] == [("src/a.py", "def target():", [])]
+    result = json.loads(asyncio.run(builtin.search_files("TARGET(", f"{base}/src/a.py", ignore_case=True, literal=True)))
+    assert [m["line"] for m in result["matches"]] == [3], result
+    assert asyncio.run(builtin.search_files("(", base)).startswith("Error: bad pattern")
+    ok("Regex with glob filter; literal, case-insensitive search of a single file")
+
+    for text in ("a\nb\n", "a\nb"):
+        with open(f"{base}/two.txt", "w") as f:
+            f.write(text)
+        for pattern in ("$", "x*", "^"):
+            result = json.loads(asyncio.run(builtin.search_files(pattern, f"{base}/two.txt")))
+            assert [(m["line"], m["text"]) for m in result["matches"]] == [(1, "a"), (2, "b")], (text, pattern, result)
+    os.remove(f"{base}/two.txt")
+    ok("Zero-width patterns match each line once and stop at EOF")
+
+    with open(f"{base}/logs/keep.log", "w") as f:
+        f.write("target\n" * 100000)
+    for i in range(200):
+        with open(f"{base}/src/many_{i:03d}.txt", "w") as f:
+            f.write("target\n")
+    result = search.search("target", base, max_results=20)
+    assert len(result["matches"]) == 20 and result["truncated"], len(result["matches"])
+    assert result["searched"] < 150, result["searched"]
+    ok(f"Stops early at the result cap ({result['searched']} files searched)")
+    shutil.rmtree(base, ignore_errors=True)
+
+
+def test_http_streaming():
+    section("HTTP Streaming")
+    import shutil
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from pocketclaw.tools import builtin
+    base = "/tmp/pocketclaw_test_http_stream"
+    shutil.rmtree(base, ignore_errors=True)
+    blob = bytes(range(256)) * 40000  # ~10 MB
+    page = ("<html><head><title>T</title><style>p {color: red}</style></head><body><h1>News</h1>"
+            "<script>var x = 1;</script><p>First   story.</p><ul><li>one</li><li>two</li></ul></body></html>")
+    drop = {"after": None, "etag": '"v1"'}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path == "/page":
+                body, kind = page.encode(), "text/html"
+            elif self.path == "/api":
+                body, kind = json.dumps({"items": [{"name": "a"}, {"name": "b"}]}).encode(), "application/json"
+            else:
+                body, kind = blob, "application/octet-stream"
+            start = int(self.headers["Range"].split("=")[1].rstrip("-")) if self.headers.get("Range") else 0
+            if self.headers.get("If-Range", drop["etag"]) != drop["etag"]:
+                start = 0
+            self.send_response(206 if start else 200)
+            self.send_header("Content-Type", kind)
+            self.send_header("Content-Length", str(len(body) - start))
+            self.send_header("ETag", drop["etag"])
+            if start:
+                self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+            self.end_headers()
+            end = len(body) if drop["after"] is None else drop["after"]
+            try:
+                for i in range(start, end, 65536):
+                    self.wfile.write(body[i:min(i + 65536, end)])
+                    if self.path == "/slow":
+                        time.sleep(0.01)
+            except OSError:
+                pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        # At 10ms per 64 KB the whole body would take 1.6s to send
+        t0 = time.monotonic()
+        result = asyncio.run(builtin.http_request("GET", f"{url}/slow"))
+        elapsed = time.monotonic() - t0
+        assert result.startswith("HTTP 200\n") and "[truncated at 5000 chars of 10240000 bytes" in result, result[-120:]
+        assert elapsed < 0.5, elapsed
+        ok(f"Reading stops at the return budget ({elapsed:.2f}s, not the 1.6s a full read takes)")
+
+        result = asyncio.run(builtin.http_request("GET", f"{url}/page", extract="text"))
+        assert result == "HTTP 200\nNews\n\nFirst story.\n\n- one\n- two", repr(result)
+        result = asyncio.run(builtin.http_request("GET", f"{url}/api", extract="$.items[*].name"))
+        assert result == 'HTTP 200\n["a", "b"]', result
+        assert asyncio.run(builtin.http_request("GET", f"{url}/page", extract="$.x")).startswith("Error: response is not JSON")
+        ok("HTML to text and JSONPath extraction")
+
+        dest = f"{base}/dl/blob.bin"
+        drop["after"] = 3 * 65536
+        result = asyncio.run(builtin.http_request("GET", f"{url}/blob", save_to=dest))
+        assert result.startswith("Error: download interrupted at 196608 of 10240000 bytes (1%) at "), result
+        assert not os.path.exists(dest) and os.path.getsize(dest + ".part") == 196608
+        drop["after"] = None
+        result = asyncio.run(builtin.http_request("GET", f"{url}/blob", save_to=dest))
+        assert result.startswith(f"HTTP 206\nSaved 10240000 bytes to {dest}") and "resumed at byte 196608" in result, result
+        assert open(dest, "rb").read() == blob and not os.path.exists(dest + ".part")
+        ok("save_to streams to disk; an interrupted download resumes with a Range request")
+
+        drop["after"] = 3 * 65536
+        asyncio.run(builtin.http_request("GET", f"{url}/blob", save_to=dest))
+        drop["after"], drop["etag"] = None, '"v2"'
+        result = asyncio.run(builtin.http_request("GET", f"{url}/blob", save_to=dest))
+        assert result.startswith(f"HTTP 200\nSaved 10240000 bytes to {dest}") and "resumed" not in result, result
+        assert open(dest, "rb").read() == blob and not os.path.exists(dest + ".part.tag")
+        ok("If-Range: a resource changed since the interruption is downloaded again")
+
+        from pocketclaw.tools import fetch
+        from pocketclaw.tools.process import ToolScope
+        every, fetch.PROGRESS_EVERY = fetch.PROGRESS_EVERY, 0
+
+        async def slow_download(scope):
+            with scope.active():
+                await asyncio.wait_for(builtin.http_request("GET", f"{url}/slow", save_to=f"{base}/dl/slow.bin"), 0.3)
+
+        scope = ToolScope()
+        try:
+            asyncio.run(slow_download(scope))
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            fetch.PROGRESS_EVERY = every
+        assert scope.progress.startswith("downloaded ") and "of 10240000 bytes (" in scope.progress, scope.progress
+        ok(f"Download progress kept for the timeout error ({scope.progress.split(';')[0]})")
+    finally:
+        server.shutdown()
+        shutil.rmtree(base, ignore_errors=True)
+
+
+def test_tool_limits():
+    section("Tool Limits")
+    import shutil
+    from pocketclaw.llm import ToolCall
+    from pocketclaw.metrics import summarize
+    from pocketclaw.tools import process
+    from pocketclaw.tools.process import ToolScope
+    base = "/tmp/pocketclaw_test_limits"
+    shutil.rmtree(base, ignore_errors=True)
+    c = Config()
+    c.set("advanced.tool_timeout", 0.3)
+    c.set("advanced.tool_timeouts", {"slow_ok": 2})
+    gw = mock_gateway(base, config=c)
+
+    async def slow():
+        await asyncio.sleep(1)
+        return "finished"
+
+    gw.tools["slow"] = slow
+    gw.tools["slow_ok"] = slow
+
+    async def calls():
+        t0 = time.monotonic()
+        capped, _ = await gw._exec_tool(ToolCall("t1", "slow", {}))
+        capped_s = time.monotonic() - t0
+        allowed, _ = await gw._exec_tool(ToolCall("t2", "slow_ok", {}))
+        return capped, capped_s, allowed
+
+    capped, capped_s, allowed = asyncio.run(calls())
+    assert capped == "Error: slow timed out after 0.3s" and capped_s < 0.8, (capped, capped_s)
+    assert allowed == "finished", allowed
+    ok(f"Central timeout stops a slow handler ({capped_s:.2f}s); per-tool override lets another finish")
+
+    from pocketclaw.tools import screen
+
+    async def spinner():
+        return json.dumps({"elements": [{"text": "Spinner", "description": ""}]})
+
+    real_read, screen.screen_read = screen.screen_read, spinner
+    gw.tools["screen_wait"] = screen.screen_wait
+    try:
+        waited, _ = asyncio.run(gw._exec_tool(ToolCall("t3", "screen_wait", {"text": "Done", "timeout": 1})))
+    finally:
+        screen.screen_read = real_read
+    assert waited.startswith("Error: screen_wait timed out after 1.0s") and "Spinner" in waited, waited
+    assert gw._tool_timeout("screen_wait", screen.screen_wait, {"timeout": 600}) == 610
+    assert gw._tool_timeout("screen_wait", screen.screen_wait, {}) == 20
+    assert gw._tool_timeout("screen_wait", screen.screen_wait, {"timeout": "soon"}) == 0.3
+    ok("screen_wait's cap follows its own timeout argument instead of advanced.tool_timeout")
+
+    async def scoped(cmd, **limits):
+        scope = ToolScope(**limits)
+        with scope.active():
+            proc = await process.run(cmd, shell=True)
+        return proc, scope.usage()
+
+    proc, usage = asyncio.run(scoped("while :; do :; done", cpu_s=1))
+    assert proc.returncode < 0 and usage["cpu_s"] >= 0.9, (proc.returncode, usage)
+    ok(f"RLIMIT_CPU stops a busy loop (exit {proc.returncode}, {usage['cpu_s']:.2f}s CPU)")
+
+    proc, _ = asyncio.run(scoped("head -c 3000000 /dev/zero", output_mb=1))
+    assert len(proc.stdout) == 1024 * 1024 and proc.dropped == 3000000 - 1024 * 1024 and proc.returncode == 0
+    ok(f"Output past output_mb is drained and dropped ({proc.dropped} bytes)")
+
+    gw = mock_gateway(base, [("", [("run_python", {"code": "x = bytearray(40 * 1024 * 1024); print(len(x))"})])])
+    assert asyncio.run(gw.handle_message("allocate", "lim")) == "done"
+    tool = gw.metrics.tail()[-1]["tools"][0]
+    assert tool["name"] == "run_python" and tool["ok"] and tool["rss_mb"] >= 40 and tool["cpu_s"] > 0, tool
+    st = summarize(gw.metrics.tail())["tools"]["run_python"]
+    assert st["rss_mb"] == tool["rss_mb"] and st["cpu_s"] == tool["cpu_s"], st
+    ok(f"Per-call CPU and peak RSS recorded in metrics ({tool['cpu_s']}s, {tool['rss_mb']} MB)")
+
+    # Screen tools run Android's input/screencap; fake them on PATH
+    from pocketclaw.tools import screen
+    os.makedirs(f"{base}/bin")
+    with open(f"{base}/bin/input", "w") as fh:
+        fh.write(f"#!/bin/sh\necho \"$@\" >> {base}/input.log\n[ \"$1\" = swipe ] && exec sleep 30\nexit 0\n")
+    os.chmod(f"{base}/bin/input", 0o755)
+    path = os.environ["PATH"]
+    os.environ["PATH"] = f"{base}/bin:{path}"
+    try:
+        async def screen_calls():
+            scope = ToolScope()
+            with scope.active():
+                typed = await screen.screen_type_text('a "b"; touch pwned')
+                tapped = await screen.screen_tap_coordinates(10, 20)
+            t0 = time.monotonic()
+            try:
+                await asyncio.wait_for(screen.screen_scroll("down"), 0.3)
+            except asyncio.TimeoutError:
+                pass
+            return typed, tapped, scope.usage(), time.monotonic() - t0
+
+        typed, tapped, usage, scroll_s = asyncio.run(screen_calls())
+    finally:
+        os.environ["PATH"] = path
+    logged = open(f"{base}/input.log").read().splitlines()
+    assert typed.startswith("Typed") and tapped == "Tapped (10, 20)", (typed, tapped)
+    assert logged[:2] == ['text a%s"b";%stouch%spwned', "tap 10 20"], logged
+    assert usage and scroll_s < 1 and not os.path.exists("pwned"), (usage, scroll_s)
+    ok("Screen tools run input through process.run: argv (no shell), scope usage, killed on timeout")
+    shutil.rmtree(base, ignore_errors=True)
+
+
+def test_scheduler():
+    section("Scheduler")
+    from pocketclaw.scheduler import Scheduler
+    import shutil
+    base = "/tmp/pocketclaw_test_sched"
+    shutil.rmtree(base, ignore_errors=True)
+
+    async def same_conversation():
+        gw = mock_gateway(base, delay=0.05)
+        await asyncio.gather(
+            gw.handle_message("first", "shared"),
+            gw.handle_message("second", "shared"),
+        )
+        msgs = [m["content"] for m in gw.memory.get_conversation("shared")]
+        await gw.close()
+        return msgs
+
+    msgs = asyncio.run(same_conversation())
+    assert msgs == ["first", "done", "second", "done"], f"turns serialised ({msgs})"
+    ok("Concurrent turns on one conversation are serialised")
+
+    async def lanes():
+        sched = Scheduler(max_concurrent=1)
+        order = []
+
+        async def job(name, lane):
+            async with sched.slot(lane):
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        async with sched.slot("normal"):
+            tasks = [asyncio.create_task(job("bg", "background")),
+                     asyncio.create_task(job("norm", "normal")),
+                     asyncio.create_task(job("user", "interactive"))]
+            await asyncio.sleep(0.01)
+            depth = sched.metrics()["queued"]
+        await asyncio.gather(*tasks)
+        return order, depth, sched.metrics()
+
+    order, depth, metrics = asyncio.run(lanes())
+    assert order == ["user", "norm", "bg"], f"priority order ({order})"
+    assert depth == 3 and metrics["queued"] == 0 and metrics["active"] == 0, "queue metrics"
+    ok(f"Priority lanes: {' > '.join(order)} (peak queue depth {depth})")
+
+    async def cancellation():
+        gw = mock_gateway(base, delay=5)
+        task = asyncio.create_task(gw.handle_message("slow", "c1"))
+        await asyncio.sleep(0.05)
+        assert gw.cancel("c1") == 1
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        m = gw.scheduler.metrics()
+        await gw.close()
+        return m
+
+    m = asyncio.run(cancellation())
+    assert m["cancelled"] == 1 and m["active"] == 0, "cancel frees slot"
+    ok("Cancelling a turn frees its slot")
+    shutil.rmtree(base, ignore_errors=True)
+
+
+def test_http_interface():
+    section("HTTP API")
+    import httpx
+    import shutil
+    from pocketclaw.interfaces.http import HTTPInterface
+    base = "/tmp/pocketclaw_test_http"
+    shutil.rmtree(base, ignore_errors=True)
+
+    async def scenario():
+        c = Config()
+        c.set("interfaces.http.port", 0)
+        c.set("interfaces.http.token", "s3cret")
+        gw = mock_gateway(base, [("one", []), ("two", []), ("three", [])], config=c)
+        api = await HTTPInterface(gw, c).start()
+        url = f"http://127.0.0.1:{api.port}"
+        auth = {"Authorization": "Bearer s3cret"}
+        async with httpx.AsyncClient(headers=auth) as client:
+            r = await client.post(f"{url}/v1/message", json={"text": "hi", "conv_id": "h1"})
+            assert r.json() == {"reply": "one", "conv_id": "h1"}, r.text
+            ok("POST /v1/message")
+
+            events = []
+            async with client.stream("POST", f"{url}/v1/message/stream", json={"text": "more", "conv_id": "h1"}) as r:
+                async for line in r.aiter_lines():
+                    if line.startswith("event: "):
+                        events.append(line[7:])
+            assert events == ["start", "text", "end"], events
+            ok("POST /v1/message/stream (SSE over a kept-alive connection)")
+
+            r = await client.post(f"{url}/v1/chat/completions", json={
+                "model": "x", "user": "h1", "messages": [{"role": "user", "content": "again"}]})
+            assert r.json()["choices"][0]["message"]["content"] == "three", r.text
+            r = await client.get(f"{url}/health")
+            assert r.json()["requests"] >= 4 and api.connections == 1, "one reused connection"
+            ok("OpenAI shim + keep-alive")
+
+            r = await client.post(f"{url}/v1/message", json={"text": "hi", "conv_id": "../../escaped"})
+            assert r.status_code == 400 and "invalid conversation id" in r.text, r.text
+            r = await client.post(f"{url}/v1/chat/completions", headers={"X-Conversation-Id": "a/../../b"},
+                                  json={"messages": [{"role": "user", "content": "x"}]})
+            assert r.status_code == 400, r.text
+            assert not os.path.exists(f"{base}/escaped.json") and not os.path.exists("/tmp/escaped.json")
+            ok("Conversation ids that aren't safe file names get 400")
+        async with httpx.AsyncClient() as anon:
+            assert (await anon.get(f"{url}/health")).status_code == 401, "token required"
+        ok("Bearer token enforced")
+        await api.close()
+        history = [m["content"] for m in gw.memory.get_conversation("h1")]
+        await gw.close()
+        return history
+
+    history = asyncio.run(scenario())
+    assert history == ["hi", "one", "more", "two", "again", "three"], history
+    ok("All three endpoints share one conversation")
+    shutil.rmtree(base, ignore_errors=True)
+
+
+def test_daemon():
+    section("Daemon")
+    from pocketclaw import daemon
+    import shutil
+    base = "/tmp/pocketclaw_test_daemon"
+    shutil.rmtree(base, ignore_errors=True)
+    os.makedirs(base)
+    c = Config()
+    c.set("daemon.socket", f"{base}/pc.sock")
+    built = []
+
+    def factory(config):
+        gw = mock_gateway(f"{base}/memory", [("hi ", [("run_shell", {"command": "echo warm"})]), ("there", [])])
+        built.append(gw)
+        return gw
+
+    async def scenario():
+        d = daemon.Daemon(c, gateway_factory=factory)
+        await d.start()
+        path = daemon.socket_path(c)
+        chunks = [ch async for ch in daemon.request(path, {"op": "message", "text": "hello"})]
+        text = "".join(ch["text"] for ch in chunks if ch["type"] == "text")
+        assert text == "hi there", f"streamed reply ({text!r})"
+        assert any(ch["type"] == "tool_result" and "warm" in ch["result"] for ch in chunks), "tool ran"
+        ok(f"Streamed a tool-using turn over the socket ({len(chunks)} frames)")
+
+        st = await daemon.call(path, "status")
+        assert st["served"] == 1 and st["in_flight"] == 0 and st["model"] == "mock-1", "status"
+        ok(f"Status reports health ({st['tools']} tools, {st['served']} served)")
+
+        chunks = [ch async for ch in daemon.request(path, {"op": "message", "text": "x", "conv_id": "../../up"})]
+        assert chunks[-1]["type"] == "error" and "invalid conversation id" in chunks[-1]["error"], chunks
+        assert not os.path.exists(f"{base}/up.json"), "nothing written outside conversations/"
+        ok("Daemon rejects unsafe conversation ids")
+
+        d.config = c  # reload re-reads config from disk; keep the test config
+        await daemon.call(path, "reload")
+        assert len(built) == 2 and d.gateway is built[1], "gateway swapped on reload"
+        ok("Reload swaps in a fresh gateway")
+
+        await daemon.call(path, "shutdown")
+        await d.close()
+        assert not await daemon.ping(path), "daemon gone"
+        ok("Shutdown removes the socket")
+
+    asyncio.run(scenario())
+    shutil.rmtree(base, ignore_errors=True)
+
+
 # ── Run ───────────────────────────────────────────────────
 
 if __name__ == "__main__":
     print(f"\n{C}PocketClaw Test Suite{R}\n")
-    tests = [test_config, test_skill_loader, test_memory, test_system_prompt, test_builtin_tools, test_tool_pipeline]
+    tests = [test_config, test_skill_loader, test_memory, test_storage_backends, test_fact_store, test_semantic_memory, test_system_prompt, test_builtin_tools, test_tool_pipeline, test_tool_cache, test_llm_cache, test_metrics, test_router, test_rate_limit, test_batch, test_terminal, test_cancellation, test_compaction, test_jobs, test_macros, test_screen_wait, test_pipeline, test_file_edits, test_search_files, test_http_streaming, test_tool_limits, test_scheduler, test_http_interface, test_daemon]
     passed = 0
     failed = 0
     for test in tests: